@@ -0,0 +1,249 @@
+# financial-analysis-suite-web/backend/api/admission.py
+
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from flask import jsonify, make_response, request
+
+from .data_loading import sniff_format
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Rough per-request cost model: memory = base + upload size x expansion + rows x per-row overhead.
+# The expansion covers the parsed frame plus the engines' working copies (features, scaled
+# matrices, plot data); forecast's base is the Keras model and TF runtime buffers.
+ENGINE_COSTS = {
+    'forecast': {'base_mb': 300, 'upload_expansion': 8, 'kb_per_row': 0.5, 'cpu': 1.0},
+    'fraud': {'base_mb': 60, 'upload_expansion': 10, 'kb_per_row': 1.5, 'cpu': 1.0},
+    'invoice': {'base_mb': 40, 'upload_expansion': 8, 'kb_per_row': 1.0, 'cpu': 0.5},
+    'dataset': {'base_mb': 20, 'upload_expansion': 4, 'kb_per_row': 0.2, 'cpu': 0.25},
+}
+_COUNT_CHUNK_BYTES = 1 << 20
+
+
+def _default_memory_budget_mb() -> float:
+    """40% of physical memory, split across the gunicorn workers of this host."""
+    try:
+        total_mb = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        total_mb = 4096
+    workers = int(os.environ.get('API_WORKERS', 1))
+    return 0.4 * total_mb / max(workers, 1)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Per-worker admission control for the heavy analysis endpoints.
+
+    Each heavy request carries an estimated cost (memory MB, CPU slots). It runs once the
+    sum of in-flight costs stays within the worker's budgets; otherwise it waits in a FIFO
+    queue, so a large upload isn't overtaken forever by small ones. The queue is bounded in
+    length (beyond it: 429) and in wait time (beyond it: 503); both carry Retry-After.
+    A request larger than the whole budget is admitted only when nothing else is running.
+
+    Cheap endpoints (tax, home, metadata) use a separate lane with its own slots, so a
+    backlog of uploads never starves them.
+    """
+
+    def __init__(self, memory_budget_mb: float = None, cpu_slots: float = None, max_queue: int = None,
+                 max_wait: float = None, light_slots: int = None):
+        env = os.environ.get
+        self.memory_budget_mb = float(memory_budget_mb or env('ADMISSION_MEMORY_MB') or _default_memory_budget_mb())
+        self.cpu_slots = float(cpu_slots or env('ADMISSION_CPU_SLOTS') or os.cpu_count() or 1)
+        self.max_queue = int(max_queue if max_queue is not None else env('ADMISSION_MAX_QUEUE', 4))
+        self.max_wait = float(max_wait if max_wait is not None else env('ADMISSION_MAX_WAIT', 30))
+        self.light_slots = int(light_slots or env('ADMISSION_LIGHT_SLOTS', 16))
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self.memory_in_use = 0.0
+        self.cpu_in_use = 0.0
+        self.heavy_in_flight = 0
+        self.light_in_flight = 0
+        self._durations = deque(maxlen=50)  # Recent heavy request durations (s), for Retry-After
+        self.counters = {'admitted': 0, 'queued_total': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0,
+                         'light_admitted': 0, 'light_rejected': 0}
+
+    def _retry_after(self) -> int:
+        typical = sum(self._durations) / len(self._durations) if self._durations else 5.0
+        return int(min(max(math.ceil(typical * (len(self._queue) + 1) / self.cpu_slots), 1), 120))
+
+    def _fits(self, cost: dict) -> bool:
+        if self.heavy_in_flight == 0:
+            return True  # Never deadlock on a request larger than the budget
+        return (self.memory_in_use + cost['memory_mb'] <= self.memory_budget_mb
+                and self.cpu_in_use + cost['cpu'] <= self.cpu_slots)
+
+    def acquire(self, cost: dict) -> dict:
+        """Blocks until `cost` is admitted (returns a ticket for `release`) or raises AdmissionRejected."""
+        with self._cond:
+            if cost.get('lane') == 'light':
+                deadline = time.monotonic() + self.max_wait
+                while self.light_in_flight >= self.light_slots:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        self.counters['light_rejected'] += 1
+                        raise AdmissionRejected(503, "Server busy.", 1)
+                self.light_in_flight += 1
+                self.counters['light_admitted'] += 1
+                return {'cost': cost, 'start': time.monotonic()}
+
+            if not self._queue and self._fits(cost):
+                return self._admit(cost)
+            if len(self._queue) >= self.max_queue:
+                self.counters['rejected_queue_full'] += 1
+                raise AdmissionRejected(429, "Too many analyses queued on this worker.", self._retry_after())
+
+            token = object()
+            self._queue.append(token)
+            self.counters['queued_total'] += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while not (self._queue[0] is token and self._fits(cost)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['rejected_timeout'] += 1
+                        raise AdmissionRejected(503, "Timed out waiting for capacity.", self._retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self._queue.remove(token)
+                self._cond.notify_all()  # The next in line may fit now
+            return self._admit(cost)
+
+    def _admit(self, cost: dict) -> dict:
+        self.memory_in_use += cost['memory_mb']
+        self.cpu_in_use += cost['cpu']
+        self.heavy_in_flight += 1
+        self.counters['admitted'] += 1
+        return {'cost': cost, 'start': time.monotonic()}
+
+    def release(self, ticket: dict):
+        with self._cond:
+            cost = ticket['cost']
+            if cost.get('lane') == 'light':
+                self.light_in_flight -= 1
+            else:
+                self.memory_in_use -= cost['memory_mb']
+                self.cpu_in_use -= cost['cpu']
+                self.heavy_in_flight -= 1
+                self._durations.append(time.monotonic() - ticket['start'])
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'memory_budget_mb': self.memory_budget_mb, 'memory_in_use_mb': round(self.memory_in_use, 1),
+                'cpu_slots': self.cpu_slots, 'cpu_in_use': self.cpu_in_use,
+                'heavy_in_flight': self.heavy_in_flight, 'queue_length': len(self._queue),
+                'light_in_flight': self.light_in_flight, **self.counters,
+            }
+
+
+def _count_rows(file_storage) -> int:
+    """Row count of an uploaded file without loading it: Parquet metadata, or newlines in 1 MB chunks."""
+    stream = file_storage.stream
+    try:
+        fmt = sniff_format(stream)
+        if fmt == 'parquet' and pq is not None:
+            return pq.ParquetFile(stream).metadata.num_rows
+        if fmt != 'csv':
+            return None
+        rows = 0
+        chunk = stream.read(_COUNT_CHUNK_BYTES)
+        while chunk:
+            rows += chunk.count(b'\n')
+            chunk = stream.read(_COUNT_CHUNK_BYTES)
+        return max(rows - 1, 0)  # Header
+    finally:
+        stream.seek(0)
+
+
+def estimate_cost(engine: str, upload_bytes: int = 0, rows: int = None) -> dict:
+    """
+    Estimated memory (MB) and CPU slots of one request to `engine` (see ENGINE_COSTS).
+    Without a row count, rows are guessed at ~100 bytes each.
+    """
+    if engine not in ENGINE_COSTS:
+        return {'lane': 'light', 'memory_mb': 0.0, 'cpu': 0.0}
+    model = ENGINE_COSTS[engine]
+    upload_mb = upload_bytes / (1024 * 1024)
+    rows = rows if rows is not None else upload_bytes // 100
+    memory_mb = model['base_mb'] + upload_mb * model['upload_expansion'] + rows * model['kb_per_row'] / 1024
+    return {'lane': 'heavy', 'engine': engine, 'memory_mb': round(memory_mb, 1), 'cpu': model['cpu'], 'rows': rows}
+
+
+def with_worker_processes(cost: dict, processes: int) -> dict:
+    """`cost` plus `processes` helper processes, each charged the engine's base memory and one CPU slot."""
+    if processes <= 0 or cost['lane'] != 'heavy':
+        return cost
+    return {**cost, 'memory_mb': round(cost['memory_mb'] + processes * ENGINE_COSTS[cost['engine']]['base_mb'], 1),
+            'cpu': cost['cpu'] + processes, 'worker_processes': processes}
+
+
+def request_cost(engine: str, dataset_metadata=None, worker_processes=None) -> dict:
+    """
+    Cost of the current Flask request: from a registered dataset's metadata, or the uploaded
+    file, plus the helper processes the request will start (`worker_processes()`, if given).
+    """
+    if engine not in ENGINE_COSTS:
+        return estimate_cost(engine)
+    processes = worker_processes() if worker_processes is not None else 0
+    dataset_id = request.form.get('dataset_id')
+    if dataset_id and dataset_metadata is not None:
+        metadata = dataset_metadata(dataset_id)
+        if metadata is not None:
+            return with_worker_processes(estimate_cost(engine, metadata['memory_bytes'], metadata['rows']), processes)
+    file = request.files.get('file')
+    if file is None:
+        return with_worker_processes(estimate_cost(engine, request.content_length or 0), processes)
+    return with_worker_processes(estimate_cost(engine, request.content_length or 0, _count_rows(file)), processes)
+
+
+def admission_controlled(controller: AdmissionController, engine: str, dataset_metadata=None, worker_processes=None):
+    """
+    View decorator: admits the request through `controller` before running the view.
+    Capacity is released when the response is closed, i.e. after a streamed body is sent.
+
+    Args:
+        controller (AdmissionController): The worker's controller.
+        engine (str): Key of ENGINE_COSTS; anything else (e.g. 'tax') uses the light lane.
+        dataset_metadata (callable, optional): dataset_id -> metadata, to cost dataset_id requests.
+        worker_processes (callable, optional): () -> number of processes the request will spawn
+                                               (e.g. forecast tuning's pool), charged on top.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            try:
+                ticket = controller.acquire(request_cost(engine, dataset_metadata, worker_processes))
+            except AdmissionRejected as e:
+                response = jsonify({"error": e.reason, "retry_after": e.retry_after})
+                response.status_code = e.status
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                controller.release(ticket)
+                raise
+            response = make_response(response)
+            response.call_on_close(lambda: controller.release(ticket))
+            return response
+        return wrapped
+    return decorator
+
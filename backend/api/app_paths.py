@@ -0,0 +1,45 @@
+# financial-analysis-suite-web/backend/api/app_paths.py
+
+import os
+
+APP_NAME = 'financial-analysis-suite'
+
+
+def app_data_dir(name: str, env_var: str) -> str:
+    """
+    Directory for state that must outlive restarts (unlike the temp-dir caches): `env_var`
+    if set, else <APP_DATA_DIR or $XDG_DATA_HOME or ~/.local/share>/financial-analysis-suite/<name>.
+    """
+    if os.environ.get(env_var):
+        return os.environ[env_var]
+    base = os.environ.get('APP_DATA_DIR') or os.path.join(
+        os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'), APP_NAME)
+    return os.path.join(base, name)
+
+
+def app_cache_dir(name: str, env_var: str) -> str:
+    """
+    Directory for caches the app re-creates if lost: `env_var` if set, else
+    <APP_CACHE_DIR or $XDG_CACHE_HOME or ~/.cache>/financial-analysis-suite/<name>. Unlike a
+    fixed name under the shared temp dir, no other local user can create it first.
+    """
+    if os.environ.get(env_var):
+        return os.environ[env_var]
+    base = os.environ.get('APP_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), APP_NAME)
+    return os.path.join(base, name)
+
+
+def private_dir(path: str) -> str:
+    """
+    Creates `path` (mode 0700) if needed and checks it is ours and closed to other users,
+    since the stores in it load files they trust. Raises PermissionError otherwise.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        info = os.stat(path)
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"Refusing to use '{path}': it belongs to another user.")
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
@@ -0,0 +1,298 @@
+# financial-analysis-suite-web/backend/api/batch.py
+#
+# Offline batch runner: calls the analysis engines directly (no Flask, no HTTP) over
+# directories of files, one file per task on a process pool.
+#
+# Usage (from the repository root):
+#     python -m backend.api.batch fraud uploads/transactions/ --out results/fraud --workers 8
+#     python -m backend.api.batch invoice uploads/invoices/*.csv --out results/invoices
+#     python -m backend.api.batch forecast uploads/sales/ --out results/forecast --forecast-months 6 --plots
+#
+# For every input file the runner writes <out>/<file stem>-<key>/ with one Parquet file per
+# result table and a result.json (scalars, timings), written last. <key> is a digest of the
+# file's content and the analysis options, so re-running the same command skips files whose
+# result.json already exists: a crashed or interrupted run resumes where it stopped (--force
+# recomputes). Every file processed or skipped gets a line in <out>/manifest.jsonl with its
+# status, timings and error, if any.
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+INPUT_PATTERNS = ('*.csv', '*.parquet', '*.arrow', '*.feather')
+ENGINES = ('forecast', 'fraud', 'invoice')
+_HASH_CHUNK_BYTES = 1 << 20
+
+
+def find_inputs(paths: list) -> list:
+    """Input files, in a stable order: files as given, directories searched recursively for INPUT_PATTERNS."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in INPUT_PATTERNS:
+                found.extend(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        else:
+            found.extend(glob.glob(path) or [path])
+    return sorted(set(found))
+
+
+def task_key(path: str, engine: str, options: dict) -> str:
+    """Digest of the file's content, the engine and its options; the resume key."""
+    digest = hashlib.sha256(json.dumps([engine, sorted(options.items())]).encode())
+    with open(path, 'rb') as f:
+        chunk = f.read(_HASH_CHUNK_BYTES)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(_HASH_CHUNK_BYTES)
+    return digest.hexdigest()[:16]
+
+
+def _json_safe(value):
+    return json.loads(json.dumps(value, default=str))
+
+
+# ------------------ Engine adapters ------------------ #
+# Each returns (tables, extras, figures): DataFrames to write as Parquet, JSON-able scalars,
+# and charts (PlotSpecs or Plotly figures), which are only built with --plots.
+
+def _run_forecast(path: str, options: dict, plots: bool) -> tuple:
+    from .financial_forecasting import finance_forecasting
+
+    df_anomalies, forecast_df, forecast_fig, plot_images = finance_forecasting(
+        path,
+        contamination=options['contamination'],
+        forecast_months=options['forecast_months'],
+        target_col=options['target_col'],
+        date_col=options['date_col'] or 'Date',
+        interval_samples=options['interval_samples'],
+        tune=options['tune'],
+        generate_plots=plots
+    )
+    tables = {'anomalies': df_anomalies, 'forecast': forecast_df}
+    extras = {'date_parsing': df_anomalies.attrs.get('date_parsing', {}),
+              'tuning': forecast_df.attrs.get('tuning')}
+    figures = {'forecast': forecast_fig, **plot_images} if plots else {}
+    return tables, extras, figures
+
+
+def _run_fraud(path: str, options: dict, plots: bool) -> tuple:
+    from .fraud_detection import fraud_detection_analysis
+
+    df_full, anomalies_df, anomaly_summary, top_anom_df, amount_col_name, plot_specs = fraud_detection_analysis(
+        path,
+        contamination=options['contamination'],
+        date_col_name=options['date_col'] or 'TransactionDate',
+        detector=options['detector'],
+        generate_plots=plots
+    )
+    tables = {'transactions': df_full, 'anomalies': anomalies_df, 'top_anomalies': top_anom_df}
+    extras = {'anomaly_summary': anomaly_summary, 'amount_col_name': amount_col_name,
+              'date_parsing': df_full.attrs.get('date_parsing', {})}
+    return tables, extras, plot_specs
+
+
+def _run_invoice(path: str, options: dict, plots: bool) -> tuple:
+    from .invoice_processing import process_invoices
+
+    df, top_segments, city_revenue_fig, revenue_trend_fig, \
+    suspicious_invoices, extracted_entities, actual_vs_budget, audit_flags = process_invoices(
+        path, generate_plots=plots, segment_by=options['segment_by'])
+    tables = {'invoices': df, 'top_segments': top_segments, 'suspicious_invoices': suspicious_invoices,
+              'extracted_entities': extracted_entities, 'actual_vs_budget': actual_vs_budget,
+              'audit_flags': audit_flags}
+    extras = {'total_invoices': len(df), 'total_revenue': float(df['total_value'].sum()),
+              'date_parsing': df.attrs.get('date_parsing', {})}
+    figures = {'city_revenue': city_revenue_fig, 'revenue_trend': revenue_trend_fig} if plots else {}
+    return tables, extras, figures
+
+
+_ADAPTERS = {'forecast': _run_forecast, 'fraud': _run_fraud, 'invoice': _run_invoice}
+
+
+# ------------------ Writing results ------------------ #
+
+def _atomic_write(path: str, content):
+    """Writes `content` (bytes, str, or a function writing to a given path) to `path` via a temp file."""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    if callable(content):
+        content(tmp_path)
+    else:
+        with open(tmp_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _write_table(df, path: str):
+    df = df.copy()
+    df.attrs = {}  # Reports go to result.json; Parquet metadata would need them JSON-clean
+    df.columns = [str(col) for col in df.columns]
+    _atomic_write(path, lambda tmp: df.to_parquet(tmp))
+
+
+def _write_figures(figures: dict, out_dir: str) -> list:
+    """PlotSpecs are rendered to PNG, Plotly figures saved as their JSON. Returns the file names."""
+    from .plot_assets import PlotSpec
+
+    written = []
+    for name, fig in figures.items():
+        if isinstance(fig, dict):  # e.g. forecast's market indicators: name -> figure
+            written += _write_figures({f'{name}_{key}': value for key, value in fig.items()}, out_dir)
+        elif isinstance(fig, PlotSpec):
+            _atomic_write(os.path.join(out_dir, f'{name}.png'), fig.render('png'))
+            written.append(f'{name}.png')
+        elif fig is not None and hasattr(fig, 'to_json'):
+            _atomic_write(os.path.join(out_dir, f'{name}.plotly.json'), fig.to_json())
+            written.append(f'{name}.plotly.json')
+    return written
+
+
+def process_file(path: str, engine: str, options: dict, plots: bool, out_dir: str) -> dict:
+    """
+    Runs `engine` on one file and writes its results to `out_dir` (result.json last).
+    Runs in a pool worker; errors are reported in the returned record, never raised.
+    """
+    record = {'input': path, 'out_dir': out_dir, 'pid': os.getpid(), 'started_at': time.time()}
+    start = time.perf_counter()
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        tables, extras, figures = _ADAPTERS[engine](path, options, plots)
+        analysis_seconds = time.perf_counter() - start
+
+        written = {}
+        for name, df in tables.items():
+            if df is not None:
+                _write_table(df, os.path.join(out_dir, f'{name}.parquet'))
+                written[name] = len(df)
+        plot_files = _write_figures(figures, out_dir) if plots else []
+
+        record.update(status='ok', tables=written, plots=plot_files, analysis_seconds=round(analysis_seconds, 3),
+                      seconds=round(time.perf_counter() - start, 3))
+        result = {'engine': engine, 'options': options, **record, 'extras': _json_safe(extras)}
+        _atomic_write(os.path.join(out_dir, 'result.json'), json.dumps(result, indent=2))
+    except Exception as e:
+        record.update(status='failed', error=f'{type(e).__name__}: {e}', traceback=traceback.format_exc(),
+                      seconds=round(time.perf_counter() - start, 3))
+    return record
+
+
+# ------------------ Runner ------------------ #
+
+def run_batch(engine: str, inputs: list, out: str, options: dict, workers: int = None,
+              plots: bool = False, force: bool = False, log=print) -> dict:
+    """
+    Runs `engine` over `inputs` on a process pool, appending one manifest line per file.
+
+    Returns:
+        dict: Counts per status ('ok', 'failed', 'skipped') and the total wall time.
+    """
+    os.makedirs(out, exist_ok=True)
+    manifest_path = os.path.join(out, 'manifest.jsonl')
+    counts = {'ok': 0, 'failed': 0, 'skipped': 0}
+    start = time.perf_counter()
+
+    with open(manifest_path, 'a') as manifest:
+        def record(entry: dict):
+            counts[entry['status']] += 1
+            manifest.write(json.dumps({'engine': engine, **entry}) + '\n')
+            manifest.flush()  # A crash loses at most the files still in flight
+            log(f"[{sum(counts.values())}/{len(inputs)}] {entry['status']:<7} {entry['input']}"
+                + (f" ({entry['seconds']}s)" if 'seconds' in entry else '')
+                + (f": {entry['error']}" if 'error' in entry else ''))
+
+        pending = []
+        for path in inputs:
+            try:
+                key = task_key(path, engine, options)
+            except OSError as e:
+                record({'input': path, 'status': 'failed', 'error': f'{type(e).__name__}: {e}'})
+                continue
+            out_dir = os.path.join(out, f"{os.path.splitext(os.path.basename(path))[0]}-{key}")
+            if not force and os.path.exists(os.path.join(out_dir, 'result.json')):
+                record({'input': path, 'out_dir': out_dir, 'status': 'skipped'})
+            else:
+                pending.append((path, out_dir))
+
+        if pending:
+            # Spawned workers: TensorFlow (forecast) is not fork-safe
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(pending)),
+                                     mp_context=context) as pool:
+                futures = {pool.submit(process_file, path, engine, options, plots, out_dir): path
+                           for path, out_dir in pending}
+                for future in as_completed(futures):
+                    try:
+                        record(future.result())
+                    except Exception as e:  # The worker process itself died (e.g. out of memory)
+                        record({'input': futures[future], 'status': 'failed', 'error': f'{type(e).__name__}: {e}'})
+
+    return {**counts, 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def parse_args(argv=None):
+    from .anomaly_detectors import DETECTORS
+    from .segment_anomaly import SEGMENT_COLUMNS
+
+    parser = argparse.ArgumentParser(description="Run an analysis engine over directories of files in parallel.")
+    parser.add_argument('engine', choices=ENGINES)
+    parser.add_argument('inputs', nargs='+', help=f"Files, globs or directories (searched for {', '.join(INPUT_PATTERNS)}).")
+    parser.add_argument('--out', required=True, help="Output directory (results, manifest.jsonl).")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core).")
+    parser.add_argument('--plots', action='store_true', help="Also write the charts (PNG / Plotly JSON).")
+    parser.add_argument('--force', action='store_true', help="Recompute files that already have results.")
+    parser.add_argument('--contamination', type=float, default=0.01)
+    parser.add_argument('--date-col', default=None, help="Date column (default: the engine's own).")
+    parser.add_argument('--detector', default='isolation_forest', choices=sorted(DETECTORS),
+                        help="Fraud anomaly detector.")
+    parser.add_argument('--target-col', default='target_sales', help="Forecast target column.")
+    parser.add_argument('--forecast-months', type=int, default=12)
+    parser.add_argument('--interval-samples', type=int, default=0)
+    parser.add_argument('--tune', action='store_true', help="Tune the forecast model per file.")
+    parser.add_argument('--segment-by', default=None, choices=SEGMENT_COLUMNS,
+                        help="Invoice ML flags per segment instead of across the file.")
+    return parser.parse_args(argv)
+
+
+def engine_options(args) -> dict:
+    """The options that affect `args.engine`'s results (and so the resume key)."""
+    if args.engine == 'forecast':
+        return {'contamination': args.contamination, 'date_col': args.date_col, 'target_col': args.target_col,
+                'forecast_months': args.forecast_months, 'interval_samples': args.interval_samples, 'tune': args.tune}
+    if args.engine == 'fraud':
+        return {'contamination': args.contamination, 'date_col': args.date_col, 'detector': args.detector}
+    return {'segment_by': args.segment_by}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        import pyarrow  # noqa: F401  (to_parquet)
+    except ImportError:
+        raise SystemExit("pyarrow is not installed (pip install pyarrow); it is required to write Parquet results.")
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        raise SystemExit("No input files found.")
+    # One process per file: keep each worker's BLAS/OpenMP pools single-threaded (inherited by the workers)
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(var, '1')
+    # ... and no scoring or tuning pool of their own per worker (workers x cores processes)
+    os.environ['PARTITIONED_SCORING_WORKERS'] = '1'
+    os.environ['FORECAST_TUNING_WORKERS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    summary = run_batch(args.engine, inputs, args.out, engine_options(args), workers=args.workers,
+                        plots=args.plots, force=args.force)
+    print(f"{summary['ok']} ok, {summary['failed']} failed, {summary['skipped']} skipped in {summary['seconds']}s"
+          f" (manifest: {os.path.join(args.out, 'manifest.jsonl')})")
+    if summary['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
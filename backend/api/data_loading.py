@@ -0,0 +1,208 @@
+# financial-analysis-suite-web/backend/api/data_loading.py
+
+import csv
+import io
+import os
+import pandas as pd
+
+# pyarrow is optional: it gives us Parquet/Arrow IPC support and a multi-threaded CSV
+# parser. Without it we fall back to pandas' C parser (CSV only).
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+PARQUET_MAGIC = b'PAR1'
+ARROW_FILE_MAGIC = b'ARROW1'
+ARROW_STREAM_MAGIC = b'\xff\xff\xff\xff'  # IPC stream continuation marker
+
+# Rows pandas samples to guess column kinds when pyarrow is not available.
+_SCHEMA_SAMPLE_ROWS = 1000
+
+
+def sniff_format(fp: any) -> str:
+    """
+    Detects the upload format from its leading magic bytes.
+
+    Args:
+        fp (str or file-like): Path or seekable binary file object (e.g. io.BytesIO).
+
+    Returns:
+        str: One of 'parquet', 'arrow', 'arrow_stream' or 'csv'.
+    """
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, 'rb') as f:
+            head = f.read(8)
+    else:
+        pos = fp.tell()
+        head = fp.read(8)
+        fp.seek(pos)
+
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if head.startswith(ARROW_FILE_MAGIC):
+        return 'arrow'
+    if head.startswith(ARROW_STREAM_MAGIC):
+        return 'arrow_stream'
+    return 'csv'
+
+
+def _arrow_kind(arrow_type) -> str:
+    """Maps an Arrow type to the coarse kinds the engines care about."""
+    if pa.types.is_boolean(arrow_type):
+        return 'bool'
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return 'numeric'
+    if pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        return 'datetime'
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) or pa.types.is_dictionary(arrow_type):
+        return 'string'
+    return 'other'
+
+
+def _pandas_kind(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    if pd.api.types.is_object_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return 'string'
+    return 'other'
+
+
+def _rewind(fp: any):
+    if not isinstance(fp, (str, os.PathLike)):
+        fp.seek(0)
+
+
+def _read_csv_header(fp: any) -> list:
+    """Reads just the header row of a CSV without parsing the body."""
+    if isinstance(fp, (str, os.PathLike)):
+        with open(fp, 'rb') as f:
+            first_line = f.readline()
+    else:
+        first_line = fp.readline()
+        _rewind(fp)
+    text = first_line.decode('utf-8-sig', errors='replace')
+    return next(csv.reader(io.StringIO(text)), [])
+
+
+def peek_schema(fp: any, fmt: str = None) -> list:
+    """
+    Returns the column names and coarse kinds of an upload without reading its body.
+
+    For CSV the kinds are inferred from the first block only, which is enough to decide
+    which columns to project; the full read re-infers types over the whole file.
+
+    Args:
+        fp (str or file-like): Path or seekable binary file object.
+        fmt (str, optional): Format as returned by `sniff_format`. Detected if omitted.
+
+    Returns:
+        list: (column_name, kind) tuples, kind being 'numeric', 'datetime', 'string', 'bool' or 'other'.
+    """
+    fmt = fmt or sniff_format(fp)
+
+    if fmt == 'parquet':
+        schema = pq.ParquetFile(fp).schema_arrow
+    elif fmt == 'arrow':
+        schema = pa_ipc.open_file(fp).schema
+    elif fmt == 'arrow_stream':
+        schema = pa_ipc.open_stream(fp).schema
+    elif pa is not None:
+        try:
+            schema = pa_csv.open_csv(fp, convert_options=pa_csv.ConvertOptions(strings_can_be_null=True)).schema
+        except pa.ArrowInvalid:
+            schema = None
+    else:
+        schema = None
+    _rewind(fp)
+
+    if schema is not None:
+        return [(field.name, _arrow_kind(field.type)) for field in schema]
+
+    # CSV without pyarrow (or a block pyarrow couldn't parse): sample with pandas.
+    sample = pd.read_csv(fp, nrows=_SCHEMA_SAMPLE_ROWS)
+    _rewind(fp)
+    return [(col, _pandas_kind(dtype)) for col, dtype in sample.dtypes.items()]
+
+
+def _select_columns(schema: list, columns: any, normalize) -> list:
+    if columns is None:
+        return [name for name, _ in schema]
+    if callable(columns):
+        return [name for name, kind in schema if columns(normalize(name), kind)]
+    wanted = set(columns)
+    return [name for name, _ in schema if normalize(name) in wanted]
+
+
+def read_table(fp: any, columns: any = None, normalize=str.strip) -> pd.DataFrame:
+    """
+    Loads a CSV, Parquet or Arrow IPC upload into a DataFrame, reading only the needed columns.
+
+    The format is detected from magic bytes, so callers don't need to trust file extensions.
+    Column names are returned as they appear in the file; `normalize` is only used to match
+    them against `columns`.
+
+    Args:
+        fp (str, io.BytesIO or pd.DataFrame): Path, seekable binary file object, or an already
+            parsed frame (in which case only the projection is applied).
+        columns (iterable or callable, optional): Normalized names of the columns to keep, or a
+            predicate `(normalized_name, kind) -> bool`. None keeps every column.
+        normalize (callable): Maps a raw column name to the form used in `columns`.
+
+    Returns:
+        pd.DataFrame: The projected table.
+    """
+    if isinstance(fp, pd.DataFrame):
+        schema = [(col, _pandas_kind(dtype)) for col, dtype in fp.dtypes.items()]
+        return fp[_select_columns(schema, columns, normalize)].copy()
+
+    fmt = sniff_format(fp)
+    if fmt != 'csv' and pa is None:
+        raise ValueError(f"Reading {fmt} uploads requires pyarrow, which is not installed.")
+
+    if fmt == 'csv' and columns is None:
+        schema = None
+    elif fmt == 'csv' and not callable(columns):
+        # Matching by name only: the header row is all we need.
+        schema = [(name, None) for name in _read_csv_header(fp)]
+    else:
+        schema = peek_schema(fp, fmt)
+
+    selected = _select_columns(schema, columns, normalize) if schema is not None else None
+    if selected is not None and not selected:
+        return pd.DataFrame()
+
+    if fmt == 'parquet':
+        table = pq.read_table(fp, columns=selected)
+    elif fmt == 'arrow':
+        table = pa_ipc.open_file(fp).read_all()
+        table = table.select(selected) if selected is not None else table
+    elif fmt == 'arrow_stream':
+        reader = pa_ipc.open_stream(fp)
+        batches = [batch.select(selected) if selected is not None else batch for batch in reader]
+        table = pa.Table.from_batches(batches) if batches else reader.schema.empty_table()
+    else:
+        return _read_csv(fp, selected)
+
+    return table.to_pandas(date_as_object=False)
+
+
+def _read_csv(fp: any, selected: list) -> pd.DataFrame:
+    """CSV fast path through pyarrow's multi-threaded reader, pandas as the fallback."""
+    if pa is not None:
+        convert_options = pa_csv.ConvertOptions(strings_can_be_null=True)
+        if selected is not None:
+            convert_options.include_columns = selected
+        try:
+            return pa_csv.read_csv(fp, convert_options=convert_options).to_pandas(date_as_object=False)
+        except (pa.ArrowInvalid, UnicodeDecodeError):
+            # Ragged rows, odd quoting or mixed encodings: let pandas have a go.
+            _rewind(fp)
+    return pd.read_csv(fp, usecols=selected)
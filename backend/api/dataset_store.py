@@ -0,0 +1,179 @@
+# financial-analysis-suite-web/backend/api/dataset_store.py
+
+import glob
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    from pyarrow import ArrowException
+except ImportError:  # Without pyarrow (Parquet) datasets are kept in memory only
+    ArrowException = None
+
+from .app_paths import app_cache_dir, private_dir
+from .data_loading import read_table
+from .schema import infer_schema, optimize_dtypes, memory_per_row
+
+DEFAULT_DATASET_DIR = app_cache_dir('datasets', 'DATASET_STORE_DIR')
+MAX_DATASET_MEMORY_BYTES = int(os.environ.get('DATASET_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+MAX_CACHED_DATASETS = 64
+MAX_SPILLED_DATASETS = 256
+
+
+def dataset_id_for(content: bytes) -> str:
+    """Content-addressed id: uploading the same file twice yields the same dataset."""
+    return hashlib.sha256(content).hexdigest()[:24]
+
+
+class DatasetStore:
+    """
+    Parse-once cache of uploads, shared by the forecast, fraud and invoice endpoints.
+
+    An upload is parsed with `read_table` (every column) and cast to compact dtypes once; the
+    typed frame is then handed to the engines, whose loaders only apply their projection.
+    Frames live in an LRU bounded by memory (deep bytes) and count. With a `root` directory
+    they are also written through to a private (0700) directory as Parquet (which keeps
+    categories and dtypes), so a frame evicted from memory, or registered by another worker
+    process, is reloaded instead of re-uploaded.
+    """
+
+    def __init__(self, root: str = DEFAULT_DATASET_DIR, max_bytes: int = MAX_DATASET_MEMORY_BYTES,
+                 max_items: int = MAX_CACHED_DATASETS, max_spilled: int = MAX_SPILLED_DATASETS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.max_spilled = max_spilled
+        self._frames = OrderedDict()  # dataset_id -> (df, metadata)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if root:
+            private_dir(root)
+
+    def _paths(self, dataset_id: str) -> tuple:
+        safe = ''.join(ch for ch in dataset_id if ch.isalnum())
+        return os.path.join(self.root, f'{safe}.parquet'), os.path.join(self.root, f'{safe}.json')
+
+    def register(self, content: bytes, filename: str = None) -> dict:
+        """
+        Parses and stores an upload (CSV, Parquet or Arrow IPC bytes).
+
+        Returns:
+            dict: Metadata: dataset_id, filename, rows, columns (name, role, dtype),
+                  memory_bytes, memory_per_row, created_at.
+        """
+        dataset_id = dataset_id_for(content)
+        existing = self.metadata(dataset_id)
+        if existing is not None:
+            return existing
+
+        df = read_table(io.BytesIO(content))
+        df.columns = df.columns.str.strip()
+        df = optimize_dtypes(df)
+        schema = infer_schema(df)
+        memory_bytes = int(df.memory_usage(deep=True).sum())
+        metadata = {
+            'dataset_id': dataset_id,
+            'filename': filename,
+            'rows': len(df),
+            'columns': [{'name': col, 'role': spec['role'], 'dtype': str(df[col].dtype)}
+                        for col, spec in schema.items()],
+            'memory_bytes': memory_bytes,
+            'memory_per_row': round(memory_per_row(df), 1),
+            'created_at': time.time(),
+        }
+        if self.root:
+            self._spill(dataset_id, df, metadata)
+        self._cache(dataset_id, df, metadata)
+        return metadata
+
+    def get(self, dataset_id: str) -> pd.DataFrame:
+        """The typed frame, or None if unknown (or evicted without a disk copy). Treat it as read-only."""
+        entry = self._lookup(dataset_id, load_frame=True)
+        return entry[0] if entry is not None else None
+
+    def metadata(self, dataset_id: str) -> dict:
+        entry = self._lookup(dataset_id, load_frame=False)
+        return entry[1] if entry is not None else None
+
+    def delete(self, dataset_id: str) -> bool:
+        """Drops a dataset from memory and disk. Returns False if it was not found."""
+        found = False
+        with self._lock:
+            entry = self._frames.pop(dataset_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]['memory_bytes']
+                found = True
+        if self.root:
+            for path in self._paths(dataset_id):
+                try:
+                    os.remove(path)
+                    found = True
+                except FileNotFoundError:
+                    pass
+        return found
+
+    def _lookup(self, dataset_id: str, load_frame: bool):
+        with self._lock:
+            entry = self._frames.get(dataset_id)
+            if entry is not None:
+                self._frames.move_to_end(dataset_id)
+                return entry
+        if not self.root or not dataset_id:
+            return None
+
+        frame_path, meta_path = self._paths(dataset_id)
+        try:
+            with open(meta_path) as f:
+                metadata = json.load(f)
+            if not load_frame:
+                return None, metadata
+            df = pd.read_parquet(frame_path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        self._cache(dataset_id, df, metadata)
+        return df, metadata
+
+    def _cache(self, dataset_id: str, df: pd.DataFrame, metadata: dict):
+        with self._lock:
+            if dataset_id in self._frames:
+                self._frames.move_to_end(dataset_id)
+                return
+            self._frames[dataset_id] = (df, metadata)
+            self._bytes += metadata['memory_bytes']
+            # Evict least recently used frames, but always keep the newest one
+            while len(self._frames) > 1 and (self._bytes > self.max_bytes or len(self._frames) > self.max_items):
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self._bytes -= evicted['memory_bytes']
+
+    def _spill(self, dataset_id: str, df: pd.DataFrame, metadata: dict):
+        if ArrowException is None:
+            return
+        frame_path, meta_path = self._paths(dataset_id)
+        suffix = f'.{uuid.uuid4().hex}.tmp'
+        try:
+            df.to_parquet(frame_path + suffix)
+        except (ValueError, TypeError, ArrowException):  # e.g. mixed-type object columns: memory only
+            if os.path.exists(frame_path + suffix):
+                os.remove(frame_path + suffix)
+            return
+        os.replace(frame_path + suffix, frame_path)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(meta_path + suffix, meta_path)  # Metadata last: it marks the dataset complete
+
+        # Bound the disk copy too: drop the oldest datasets beyond max_spilled.
+        spilled = sorted(glob.glob(os.path.join(self.root, '*.json')), key=os.path.getmtime)
+        for old_meta in spilled[:-self.max_spilled]:
+            for path in (old_meta, old_meta[:-len('.json')] + '.parquet'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
@@ -0,0 +1,121 @@
+# financial-analysis-suite-web/backend/api/date_parsing.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+# Tried in order; the first that parses (nearly) all of the sample wins. Month-first comes
+# before day-first, as in pd.to_datetime's own default. 'ISO8601' catches the remaining
+# ISO variants (fractions, 'T' separators, offsets).
+CANDIDATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y/%m/%d',
+    '%m/%d/%Y', '%d/%m/%Y', '%m/%d/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%d/%m/%Y %H:%M',
+    '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y%m%d', '%d %b %Y', '%b %d, %Y', '%Y-%m',
+    'ISO8601',
+]
+SNIFF_SAMPLE_SIZE = 200
+SNIFF_MIN_MATCH = 0.9
+CARDINALITY_SAMPLE_SIZE = 10000
+DENSE_UNIQUE_RATIO = 0.2  # Sample uniques/rows above which an ISO column is parsed directly
+
+
+def sniff_date_format(values: pd.Series) -> str:
+    """
+    The explicit format that parses at least SNIFF_MIN_MATCH of a sample of `values`
+    (strings), or None if no candidate does.
+    """
+    sample = values.dropna()
+    if len(sample) > SNIFF_SAMPLE_SIZE:
+        sample = sample.sample(SNIFF_SAMPLE_SIZE, random_state=0)
+    if sample.empty:
+        return None
+    for fmt in CANDIDATE_FORMATS:
+        try:
+            parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+        except (ValueError, TypeError):
+            continue
+        if parsed.notna().mean() >= SNIFF_MIN_MATCH:
+            return fmt
+    return None
+
+
+def _is_iso(fmt: str) -> bool:
+    return fmt == 'ISO8601' or fmt.startswith('%Y-%m-%d')
+
+
+def _parse_with_fallback(values: pd.Series, fmt: str) -> tuple:
+    """Parses `values` with `fmt`; only the non-null strings it rejects go through format='mixed'."""
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce') if fmt else pd.Series(pd.NaT, index=values.index)
+    misses = parsed.isna() & values.notna()
+    if misses.any():
+        parsed[misses] = pd.to_datetime(values[misses], errors='coerce', format='mixed')
+        parsed = pd.to_datetime(parsed)
+    return parsed, int(misses.sum())
+
+
+def parse_dates(series: pd.Series) -> tuple:
+    """
+    Converts a column of date strings to datetime64, like pd.to_datetime(errors='coerce').
+
+    The format is sniffed from a sample and applied explicitly. Strings it rejects are
+    parsed element by element (format='mixed'); what that can't parse either becomes NaT.
+    Unless the column is a dense ISO column (which pandas parses about as fast as it can
+    hash it), each distinct string is parsed once and the results are mapped back by code:
+    exports repeat the same dates many times, and non-ISO formats cost microseconds per parse.
+
+    Returns:
+        tuple: (parsed Series with the same index, report dict with the format, strategy
+               ('native', 'direct', 'unique' or 'pandas'), row and unique counts, how many strings needed the
+               fallback, and seconds taken)
+    """
+    start = time.perf_counter()
+    report = {'rows': len(series), 'format': None, 'strategy': None, 'unique': None, 'fallback': 0}
+    if pd.api.types.is_datetime64_any_dtype(series):
+        report['strategy'] = 'native'  # Already typed by the reader (e.g. pyarrow's ISO timestamps)
+        report['seconds'] = round(time.perf_counter() - start, 4)
+        return series, report
+
+    categorical = isinstance(series.dtype, pd.CategoricalDtype)
+    positions = np.random.default_rng(0).choice(len(series), min(len(series), CARDINALITY_SAMPLE_SIZE), replace=False)
+    sample = series.iloc[np.sort(positions)].dropna().astype(str)
+    fmt = sniff_date_format(sample)
+    report['format'] = fmt
+    dense = len(sample) > 0 and sample.nunique() > DENSE_UNIQUE_RATIO * len(sample)
+
+    try:
+        if not categorical and fmt is not None and _is_iso(fmt) and dense:
+            report['strategy'] = 'direct'
+            result, report['fallback'] = _parse_with_fallback(series, fmt)
+        else:
+            report['strategy'] = 'unique'
+            if categorical:
+                codes, uniques = series.cat.codes.to_numpy(), series.cat.categories.astype(str)
+            else:
+                codes, uniques = pd.factorize(series)
+            uniques = pd.Series(uniques, dtype=object).astype(str)
+            report['unique'] = len(uniques)
+            parsed, report['fallback'] = _parse_with_fallback(uniques, fmt)
+            # Code -1 (missing input) becomes NaT
+            result = pd.Series(parsed.array.take(codes, allow_fill=True), index=series.index, name=series.name)
+    except (ValueError, TypeError):
+        # Mixed time zones or other oddities: hand the whole column to pandas as before
+        report['format'], report['strategy'] = None, 'pandas'
+        result = pd.to_datetime(series, errors='coerce')
+    report['seconds'] = round(time.perf_counter() - start, 4)
+    return result, report
+
+
+def parse_date_columns(df: pd.DataFrame, columns: list) -> dict:
+    """
+    Parses each of `columns` present in `df` in place with `parse_dates`.
+
+    Returns:
+        dict: column -> report (format, strategy, rows, unique, fallback, seconds); the engines keep
+              it in df.attrs['date_parsing'].
+    """
+    reports = {}
+    for col in columns:
+        if col in df.columns:
+            df[col], reports[col] = parse_dates(df[col])
+    return reports
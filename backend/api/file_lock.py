@@ -0,0 +1,26 @@
+# financial-analysis-suite-web/backend/api/file_lock.py
+
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+_fallback_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock on `path` (created if missing), across threads and worker processes sharing the directory."""
+    with open(path, 'a+') as lock_file:
+        if fcntl is None:
+            with _fallback_lock:
+                yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
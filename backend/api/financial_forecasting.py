@@ -2,21 +2,33 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 import plotly.graph_objects as go
 import plotly.express as px
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
-from scipy.stats import zscore
 import datetime
-import io
-import base64
-from tensorflow.keras.models import Sequential # Using tensorflow.keras
-from tensorflow.keras.layers import LSTM, Dense # Using tensorflow.keras
+
+from .data_loading import read_table
+from .date_parsing import parse_date_columns
+from .plot_assets import PlotSpec, plot_renderer
+from .schema import optimize_dtypes
+from .online_anomaly import score_online, infer_season_length
+from .summary_stats import correlation_matrix
+from .forecast_tuning import DEFAULT_FORECAST_CONFIG, build_forecast_model, create_sequences, tune_forecast
+
+# Non-numeric columns the forecasting engine reads besides the date column.
+# Every numeric column is read as well, since anomaly detection and the plots use them all.
+FORECAST_EXTRA_COLUMNS = ['sales', 'gdp_growth', 'unemployment_rate', 'inflation_rate']
+
+# Each bootstrap path is a full recursive forecast (one model predict per step per path batch)
+MAX_INTERVAL_SAMPLES = 2000
 
 def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01, forecast_months: int = 12, 
-                        target_col: str = 'target_sales', date_col: str = 'Date'):
+                        target_col: str = 'target_sales', date_col: str = 'Date', anomaly_method: str = None,
+                        use_isolation_forest: bool = True, series_id: str = None, interval_samples: int = 0,
+                        tune: bool = False, generate_plots: bool = True):
     """
     Main function to perform financial forecasting, anomaly detection, and visualization.
 
@@ -27,31 +39,47 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         target_col (str): The name of the column to forecast.
         date_col (str): The name of the date column in the CSV. If not found or invalid,
                         a numerical time step index will be used.
+        anomaly_method (str, optional): Online detector for the target series, 'robust_zscore' or
+                        'seasonal' (see online_anomaly). Adds 'online_score' and 'online_anomaly' columns;
+                        its flags are merged into 'is_anomaly'.
+        use_isolation_forest (bool): Whether to also run IsolationForest over all numeric columns.
+        series_id (str, optional): Persist the online detector's state under this id, so later uploads
+                        of the same series only score the newly appended points.
+        interval_samples (int): Bootstrap paths for prediction intervals (0 disables, at most
+                        MAX_INTERVAL_SAMPLES). When > 0, forecast_df gains P10/P50/P90 columns and
+                        the forecast plot an 80% band.
+        tune (bool): Choose the model configuration by time-series cross-validation (see
+                        forecast_tuning). The result is cached per dataset, and the chosen config and
+                        tuning cost are reported in forecast_df.attrs['tuning'].
+        generate_plots (bool): Build the figures. Without them plotly_forecast_fig is empty and
+                        plot_images is {}.
     
     Returns:
         tuple: (df_anomalies, forecast_df, plotly_forecast_fig, plot_images)
-            - df_anomalies (pd.DataFrame): DataFrame with detected anomalies.
+            - df_anomalies (pd.DataFrame): DataFrame with detected anomalies (date parsing timings in
+                                           df_anomalies.attrs['date_parsing']).
             - forecast_df (pd.DataFrame): DataFrame with forecasted values.
             - plotly_forecast_fig (go.Figure): Plotly figure object for interactive forecast visualization.
-            - plot_images (dict): Dictionary of base64 encoded Matplotlib plot images and Plotly figure objects.
+            - plot_images (dict): Plotly figure objects, and plot_assets.PlotSpecs for the Matplotlib
+                                  charts (drawn lazily, when first fetched from the plot asset store).
     """
+    if not 0 <= interval_samples <= MAX_INTERVAL_SAMPLES:
+        raise ValueError(f"interval_samples must be between 0 and {MAX_INTERVAL_SAMPLES} (got {interval_samples}).")
     plot_images = {}
 
     # ------------------ Data Loading and Preparation ------------------ #
     def load_and_prepare_data(fp: any, dc: str) -> pd.DataFrame: 
         """
-        Loads CSV data, cleans it, handles missing values, duplicates, and sets up time index.
-        Can load from a file path string or an io.BytesIO object.
+        Loads CSV/Parquet/Arrow data, cleans it, handles missing values, duplicates, and sets up time index.
+        Can load from a file path string or an io.BytesIO object. Only the date, target and
+        numeric columns are read; free-text columns are never parsed.
         """
-        if isinstance(fp, io.BytesIO):
-            df = pd.read_csv(fp)
-        else:
-            df = pd.read_csv(fp)
-            
+        wanted = {dc, target_col, *FORECAST_EXTRA_COLUMNS}
+        df = read_table(fp, columns=lambda name, kind: name in wanted or kind == 'numeric')
         df.columns = df.columns.str.strip()
 
+        date_parsing = parse_date_columns(df, [dc]) # Sniffed format, unique values parsed once
         if dc in df.columns:
-            df[dc] = pd.to_datetime(df[dc], errors='coerce')
             df = df.dropna(subset=[dc])
             if not df.empty:
                 df = df.sort_values(dc)
@@ -70,11 +98,13 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         df = df.ffill().bfill().fillna(0) # Chain ffill, bfill, then 0 for any remaining NaNs
 
         df.drop_duplicates(inplace=True)
+        df = optimize_dtypes(df) # Compact dtypes (float32 where the values round-trip)
 
         if target_col not in df.columns:
             raise ValueError(f"Target column '{target_col}' not found in the uploaded CSV.")
         df[target_col] = pd.to_numeric(df[target_col], errors='coerce').fillna(df[target_col].mean() if pd.api.types.is_numeric_dtype(df[target_col]) else 0)
 
+        df.attrs['date_parsing'] = date_parsing
         return df
 
     # ------------------ Anomaly Detection ------------------ #
@@ -100,10 +130,15 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         return df_copy
 
     # ------------------ Forecasting ------------------ #
-    def forecast_target(df: pd.DataFrame, col='target_sales', f_months=12) -> pd.DataFrame:
+    def forecast_target(df: pd.DataFrame, col='target_sales', f_months=12, n_samples=0, config=None) -> pd.DataFrame:
         """
-        Forecasts future values of the target column using an LSTM model.
+        Forecasts future values of the target column using an LSTM (or GRU) model.
         Handles both DatetimeIndex and numerical index for future periods.
+        `config` (seq_len, units, epochs, batch_size, engine) defaults to DEFAULT_FORECAST_CONFIG.
+
+        With n_samples > 0, also simulates that many bootstrap paths: each step adds a residual
+        resampled from the model's in-sample one-step errors. The paths and the point forecast
+        are rolled forward together as one batch, so each step is still a single predict call.
         """
         data_to_scale = df[[col]].dropna()
 
@@ -113,14 +148,8 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         scaler = MinMaxScaler()
         scaled_data = scaler.fit_transform(data_to_scale)
 
-        def create_sequences(data, seq_length):
-            X, y = [], []
-            for i in range(seq_length, len(data)):
-                X.append(data[i-seq_length:i])
-                y.append(data[i])
-            return np.array(X), np.array(y)
-
-        SEQ_LEN = 12 # Sequence length for LSTM
+        config = config or DEFAULT_FORECAST_CONFIG
+        SEQ_LEN = config['seq_len'] # Sequence length for the recurrent model
         # Ensure enough data for sequences AND for the input_seq for initial prediction
         if len(scaled_data) < SEQ_LEN + 1: # Need SEQ_LEN + 1 points to create at least one sequence (X[0], y[0])
             raise ValueError(f"Not enough data to create sequences for forecasting. Need at least {SEQ_LEN + 1} data points for LSTM (current: {len(scaled_data)}).")
@@ -129,17 +158,12 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         X, y = create_sequences(scaled_data, SEQ_LEN)
         X = X.reshape((X.shape[0], X.shape[1], 1))
 
-        # Build and compile LSTM model
-        model = Sequential([
-            LSTM(50, activation='relu', return_sequences=True, input_shape=(SEQ_LEN, 1)),
-            LSTM(50, activation='relu'),
-            Dense(1)
-        ])
-        model.compile(optimizer='adam', loss='mse')
+        # Build and compile the model
+        model = build_forecast_model(SEQ_LEN, units=config['units'], engine=config['engine'])
         
         # Train the model
         try:
-            model.fit(X, y, epochs=30, batch_size=16, verbose=0)
+            model.fit(X, y, epochs=config['epochs'], batch_size=config['batch_size'], verbose=0)
         except Exception as e:
             raise RuntimeError(f"Error during LSTM model training: {e}.")
 
@@ -149,15 +173,22 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         if len(input_seq) < SEQ_LEN:
              raise ValueError(f"Insufficient data for initial forecast sequence. Need at least {SEQ_LEN} points for input_seq (current: {len(input_seq)}).")
 
-        forecast = []
-        for _ in range(f_months):
-            input_reshaped = input_seq.reshape((1, SEQ_LEN, 1))
-            pred = model.predict(input_reshaped, verbose=0)
-            forecast.append(pred[0, 0])
-            input_seq = np.append(input_seq[1:], pred)
-
-        # Inverse transform the forecast to original scale
-        forecast = scaler.inverse_transform(np.array(forecast).reshape(-1, 1)).flatten()
+        # Row 0 is the point forecast; rows 1..n_samples are bootstrap paths.
+        noise = np.zeros((n_samples + 1, f_months))
+        if n_samples > 0:
+            residuals = (y - model.predict(X, verbose=0)).ravel()
+            noise[1:] = np.random.default_rng(42).choice(residuals, size=(n_samples, f_months))
+
+        input_seqs = np.repeat(input_seq.reshape(1, SEQ_LEN), n_samples + 1, axis=0)
+        paths = np.empty((n_samples + 1, f_months))
+        for step in range(f_months):
+            pred = model.predict(input_seqs.reshape((-1, SEQ_LEN, 1)), verbose=0)[:, 0] + noise[:, step]
+            paths[:, step] = pred
+            input_seqs = np.concatenate([input_seqs[:, 1:], pred[:, None]], axis=1)
+
+        # Inverse transform the forecast (and paths) to original scale
+        paths = scaler.inverse_transform(paths.reshape(-1, 1)).reshape(paths.shape)
+        forecast = paths[0]
         
         # Create future index based on original df's index type
         if isinstance(df.index, pd.DatetimeIndex):
@@ -168,38 +199,17 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
             future_index = range(last_time_step_in_df + 1, last_time_step_in_df + 1 + f_months)
         
         forecast_df = pd.DataFrame(forecast, index=future_index, columns=[f'Forecast_{col}'])
+        if n_samples > 0:
+            for q in (10, 50, 90):
+                forecast_df[f'Forecast_{col}_P{q}'] = np.percentile(paths[1:], q, axis=0)
         return forecast_df
 
     # ------------------ Plotting Functions ------------------ #
-    def get_base64_image(plt_figure):
-        """Converts a Matplotlib figure to a base64 encoded PNG string. Handles None input."""
-        if plt_figure is None:
-            return None # Return None if no figure provided
-        buf = io.BytesIO()
-        try:
-            plt_figure.savefig(buf, format='png', bbox_inches='tight')
-        except Exception as e:
-            # Log this error but don't crash
-            print(f"Warning: Failed to save Matplotlib figure to buffer: {e}")
-            return None
-        finally:
-            plt.close(plt_figure) # Always close the figure
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        return img_base64
-
     def plot_numeric_trends(df_input, numeric_cols_to_plot):
         if df_input.empty or not numeric_cols_to_plot:
             return None
-        
-        fig, ax = plt.subplots(figsize=(15, 8))
-        df_input[numeric_cols_to_plot].plot(ax=ax)
-        ax.set_title("Numeric Trends After Cleaning")
-        ax.set_xlabel("Date" if isinstance(df_input.index, pd.DatetimeIndex) else "Time Step")
-        ax.set_ylabel("Value")
-        ax.grid(True, linestyle=':', alpha=0.7)
-        plt.tight_layout()
-        return fig
+        # Drawn on first fetch from /api/plots (see _render_numeric_trends)
+        return PlotSpec('forecast.numeric_trends.v1', df_input[numeric_cols_to_plot])
 
     def plot_sales_vs_target_sales(df_input, sales_col, target_sales_col):
         if sales_col not in df_input.columns or target_sales_col not in df_input.columns:
@@ -250,7 +260,7 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
         if numeric_df.empty:
             return go.Figure() # Return empty Plotly figure
         
-        corr = numeric_df.corr()
+        corr = correlation_matrix(numeric_df, list(numeric_df.columns))
         
         fig = px.imshow(
             corr,
@@ -285,19 +295,41 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
 
     df_anomalies = None
     try:
-        df_anomalies = detect_anomalies(df_cleaned, col=target_col, contam=contamination)
+        if use_isolation_forest:
+            df_anomalies = detect_anomalies(df_cleaned, col=target_col, contam=contamination)
+        else:
+            df_anomalies = df_cleaned.copy()
+            df_anomalies['is_anomaly'] = False
     except Exception as e:
         # If anomaly detection fails, proceed with original df but no anomaly flags
         print(f"Warning: Anomaly detection for financial forecasting failed: {e}. Proceeding with forecasting without anomaly flags.")
         df_anomalies = df_cleaned.copy()
         df_anomalies['is_anomaly'] = False
 
+    df_anomalies.attrs['date_parsing'] = df_cleaned.attrs.get('date_parsing', {})
+
+    if anomaly_method:
+        # Streaming detector on the target series only: O(1) per point, resumable by series_id
+        online = score_online(df_anomalies[target_col], method=anomaly_method, series_id=series_id)
+        df_anomalies['online_score'] = online['online_score']
+        df_anomalies['online_anomaly'] = online['online_anomaly']
+        df_anomalies['is_anomaly'] = df_anomalies['is_anomaly'] | df_anomalies['online_anomaly']
+
 
     forecast_df = pd.DataFrame()
     plotly_forecast_fig = go.Figure()
 
     try:
-        forecast_df = forecast_target(df_anomalies, col=target_col, f_months=forecast_months)
+        config, tuning_report = None, None
+        if tune:
+            config, tuning_report = tune_forecast(df_anomalies[target_col], horizon=forecast_months,
+                                                  season_length=infer_season_length(df_anomalies.index))
+        forecast_df = forecast_target(df_anomalies, col=target_col, f_months=forecast_months,
+                                      n_samples=interval_samples, config=config)
+        if tuning_report is not None:
+            forecast_df.attrs['tuning'] = {'config': config, **tuning_report}
+        if not generate_plots:
+            return df_anomalies, forecast_df, plotly_forecast_fig, plot_images
 
         plotly_forecast_fig = go.Figure()
         plotly_forecast_fig.add_trace(go.Scatter(x=df_anomalies.index, y=df_anomalies[target_col], 
@@ -308,6 +340,12 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
                                                      mode='markers', name='Anomalies', 
                                                      marker=dict(color='red', size=8, symbol='x')))
 
+        if interval_samples > 0:
+            plotly_forecast_fig.add_trace(go.Scatter(x=forecast_df.index, y=forecast_df[f'Forecast_{target_col}_P90'],
+                                                     mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            plotly_forecast_fig.add_trace(go.Scatter(x=forecast_df.index, y=forecast_df[f'Forecast_{target_col}_P10'],
+                                                     mode='lines', line=dict(width=0), fill='tonexty',
+                                                     fillcolor='rgba(255, 165, 0, 0.2)', name='P10-P90 Interval'))
         plotly_forecast_fig.add_trace(go.Scatter(x=forecast_df.index, y=forecast_df[forecast_df.columns[0]], 
                                                 name='Forecasted Sales', mode='lines+markers', 
                                                 line=dict(color='orange', dash='dash')))
@@ -330,13 +368,8 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
 
 
     # --- Generate Additional Plots ---
-    # Wrap Matplotlib plot generation in try-except to catch GUI errors
-    try:
-        fig_numeric_trends = plot_numeric_trends(df_cleaned, numeric_cols_for_general_plots)
-        if fig_numeric_trends: plot_images['numeric_trends'] = get_base64_image(fig_numeric_trends)
-    except Exception as e:
-        print(f"Warning: Failed to generate numeric trends plot (Matplotlib): {e}")
-        plot_images['numeric_trends'] = None # Ensure it's explicitly None if it fails
+    spec_numeric_trends = plot_numeric_trends(df_cleaned, numeric_cols_for_general_plots)
+    if spec_numeric_trends: plot_images['numeric_trends'] = spec_numeric_trends
 
 
     if 'sales' in df_cleaned.columns and target_col in df_cleaned.columns:
@@ -355,4 +388,19 @@ def finance_forecasting(filepath_or_bytes_obj: any, contamination: float = 0.01,
     if plotly_correlation_heatmap_fig: plot_images['correlation_heatmap_plotly'] = plotly_correlation_heatmap_fig
 
 
-    return df_anomalies, forecast_df, plotly_forecast_fig, plot_images
\ No newline at end of file
+    return df_anomalies, forecast_df, plotly_forecast_fig, plot_images
+
+
+# ------------------ Plot renderers ------------------ #
+
+@plot_renderer('forecast.numeric_trends.v1')
+def _render_numeric_trends(df_input):
+    fig = Figure(figsize=(15, 8))  # Figure rather than pyplot: safe under concurrent requests
+    ax = fig.subplots()
+    df_input.plot(ax=ax)
+    ax.set_title("Numeric Trends After Cleaning")
+    ax.set_xlabel("Date" if isinstance(df_input.index, pd.DatetimeIndex) else "Time Step")
+    ax.set_ylabel("Value")
+    ax.grid(True, linestyle=':', alpha=0.7)
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,223 @@
+# financial-analysis-suite-web/backend/api/forecast_tuning.py
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import LSTM, GRU, Dense
+
+from .app_paths import app_cache_dir, private_dir
+
+DEFAULT_TUNING_DIR = app_cache_dir('forecast_tuning', 'FORECAST_TUNING_DIR')
+# Spawned processes per tuning run, each importing TensorFlow (~300 MB); admission charges for them
+TUNING_WORKERS = int(os.environ.get('FORECAST_TUNING_WORKERS', 2))
+
+# What forecast_target used before tuning existed; still the default when tuning is off.
+DEFAULT_FORECAST_CONFIG = {'seq_len': 12, 'units': 50, 'epochs': 30, 'batch_size': 16, 'engine': 'lstm'}
+
+FORECAST_ENGINES = {'lstm': LSTM, 'gru': GRU}
+
+# seq_len candidates are multiples of the series' season length (see default_search_space).
+DEFAULT_SEARCH_SPACE = {
+    'seq_len_seasons': [0.5, 1, 2],
+    'units': [32, 64],
+    'epochs': [20, 40],
+    'engine': ['lstm', 'gru'],
+}
+
+_tuning_cache = {}
+_tuning_cache_lock = threading.Lock()
+
+
+def create_sequences(data: np.ndarray, seq_length: int):
+    """Sliding windows: X[i] = data[i:i+seq_length], y[i] = data[i+seq_length]."""
+    windows = np.arange(seq_length)[None, :] + np.arange(len(data) - seq_length)[:, None]
+    return data[windows], data[seq_length:]
+
+
+def build_forecast_model(seq_len: int, units: int = 50, engine: str = 'lstm'):
+    """Two stacked recurrent layers (LSTM or GRU) and a dense output, compiled with Adam/MSE."""
+    layer = FORECAST_ENGINES[engine]
+    model = Sequential([
+        layer(units, activation='relu', return_sequences=True, input_shape=(seq_len, 1)),
+        layer(units, activation='relu'),
+        Dense(1)
+    ])
+    model.compile(optimizer='adam', loss='mse')
+    return model
+
+
+def _recursive_forecast(model, last_window: np.ndarray, steps: int) -> np.ndarray:
+    window = last_window.reshape(1, -1)
+    out = np.empty(steps)
+    for step in range(steps):
+        # Direct call instead of predict(): no per-call dataset/callback setup for a single window
+        out[step] = float(model(window.reshape(1, -1, 1), training=False)[0, 0])
+        window = np.append(window[:, 1:], out[step]).reshape(1, -1)
+    return out
+
+
+def _init_worker():
+    # One TF thread per worker process: the pool provides the parallelism.
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _evaluate_candidate(task: dict) -> list:
+    """
+    Time-series CV for one (seq_len, units, engine) candidate. Each fold's model is trained
+    once up to the largest epoch count and evaluated at every epoch budget on the way, so
+    all epoch settings cost one training run.
+    """
+    values, seq_len, horizon = task['values'], task['seq_len'], task['horizon']
+    epoch_budgets = sorted(task['epochs'])
+    errors = {epochs: [] for epochs in epoch_budgets}
+    start = time.perf_counter()
+
+    for train_end in task['fold_ends']:
+        scaler = MinMaxScaler()
+        train = scaler.fit_transform(values[:train_end].reshape(-1, 1))
+        actual = values[train_end:train_end + horizon]
+        X, y = create_sequences(train, seq_len)
+        model = build_forecast_model(seq_len, task['units'], task['engine'])
+        trained = 0
+        for epochs in epoch_budgets:
+            model.fit(X, y, epochs=epochs - trained, batch_size=task['batch_size'], verbose=0)
+            trained = epochs
+            forecast = scaler.inverse_transform(_recursive_forecast(model, train[-seq_len:], len(actual)).reshape(-1, 1)).ravel()
+            errors[epochs].append(float(np.sqrt(np.mean((forecast - actual) ** 2))))
+
+    seconds = time.perf_counter() - start
+    return [{
+        'config': {'seq_len': seq_len, 'units': task['units'], 'epochs': epochs,
+                   'batch_size': task['batch_size'], 'engine': task['engine']},
+        'cv_rmse': float(np.mean(errors[epochs])),
+        'train_seconds': seconds / len(epoch_budgets),
+    } for epochs in epoch_budgets]
+
+
+def default_search_space(season_length: int) -> dict:
+    """DEFAULT_SEARCH_SPACE with seq_len candidates resolved for this season length."""
+    seq_lens = sorted({max(2, int(round(season_length * k))) for k in DEFAULT_SEARCH_SPACE['seq_len_seasons']})
+    return {'seq_len': seq_lens, 'units': DEFAULT_SEARCH_SPACE['units'],
+            'epochs': DEFAULT_SEARCH_SPACE['epochs'], 'engine': DEFAULT_SEARCH_SPACE['engine']}
+
+
+def dataset_fingerprint(series: pd.Series, search_space: dict, horizon: int, n_folds: int) -> str:
+    digest = hashlib.sha256()
+    digest.update(pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan).tobytes())
+    digest.update(pd.util.hash_pandas_object(series.index.to_series(), index=False).to_numpy().tobytes())
+    digest.update(json.dumps([search_space, horizon, n_folds], sort_keys=True).encode())
+    return digest.hexdigest()[:24]
+
+
+def _load_cached(fingerprint: str, cache_dir: str) -> dict:
+    with _tuning_cache_lock:
+        if fingerprint in _tuning_cache:
+            return _tuning_cache[fingerprint]
+    path = os.path.join(private_dir(cache_dir), f'{fingerprint}.json') if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path) as f:
+            result = json.load(f)
+        with _tuning_cache_lock:
+            _tuning_cache[fingerprint] = result
+        return result
+    return None
+
+
+def _save_cached(fingerprint: str, result: dict, cache_dir: str):
+    with _tuning_cache_lock:
+        _tuning_cache[fingerprint] = result
+    if cache_dir:
+        path = os.path.join(private_dir(cache_dir), f'{fingerprint}.json')
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+def tune_forecast(series: pd.Series, horizon: int = 12, season_length: int = 12, search_space: dict = None,
+                  n_folds: int = 3, max_workers: int = None, cache_dir: str = DEFAULT_TUNING_DIR):
+    """
+    Picks the forecast model configuration by expanding-window time-series cross-validation.
+
+    Candidates (seq_len x units x engine, every epoch budget evaluated within one training run)
+    are spread over a spawn-based process pool. The winner is cached by dataset fingerprint
+    (values, index, search space, horizon, folds) in memory and in `cache_dir`, so forecasting
+    the same series again reuses it without any training.
+
+    Args:
+        series (pd.Series): Target series in time order (NaNs dropped).
+        horizon (int): Steps per validation fold (usually the forecast horizon).
+        season_length (int): Used to derive the seq_len candidates when search_space is omitted.
+        search_space (dict, optional): Lists for 'seq_len', 'units', 'epochs' and 'engine'.
+        n_folds (int): Validation folds, each ending `horizon` steps after the previous one.
+        max_workers (int, optional): Pool size (default: TUNING_WORKERS, capped by candidates;
+                                     1 evaluates in this process).
+        cache_dir (str): Where tuned configs persist; falsy to keep them in memory only.
+
+    Returns:
+        tuple: (config, report). config has seq_len, units, epochs, batch_size and engine;
+               report has the fingerprint, whether it was a cache hit, wall-clock seconds,
+               the number of configurations evaluated, and the best CV RMSE.
+    """
+    start = time.perf_counter()
+    series = pd.to_numeric(series, errors='coerce').dropna()
+    search_space = search_space or default_search_space(season_length)
+    fingerprint = dataset_fingerprint(series, search_space, horizon, n_folds)
+
+    cached = _load_cached(fingerprint, cache_dir)
+    if cached is not None:
+        return dict(cached['config']), {**cached['report'], 'cached': True,
+                                        'seconds': round(time.perf_counter() - start, 3)}
+
+    values = series.to_numpy(dtype=np.float64)
+    n = len(values)
+    horizon = max(1, min(horizon, n // (n_folds + 1)))
+    fold_ends = [n - (n_folds - k) * horizon for k in range(n_folds)]
+
+    tasks = []
+    for seq_len, units, engine in itertools.product(search_space['seq_len'], search_space['units'], search_space['engine']):
+        feasible = [end for end in fold_ends if end >= seq_len + 2]  # At least two training windows
+        if feasible:
+            tasks.append({'values': values, 'seq_len': seq_len, 'units': units, 'engine': engine,
+                          'epochs': list(search_space['epochs']), 'batch_size': DEFAULT_FORECAST_CONFIG['batch_size'],
+                          'horizon': horizon, 'fold_ends': feasible})
+    if not tasks:
+        raise ValueError(f"Not enough data to tune the forecast model ({n} points for {n_folds} folds of {horizon}).")
+
+    workers = max(1, min(max_workers or TUNING_WORKERS, len(tasks)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker) as pool:
+            results = [row for rows in pool.map(_evaluate_candidate, tasks) for row in rows]
+    else:
+        results = [row for task in tasks for row in _evaluate_candidate(task)]
+
+    results.sort(key=lambda row: row['cv_rmse'])
+    best = results[0]
+    report = {
+        'fingerprint': fingerprint,
+        'cached': False,
+        'seconds': round(time.perf_counter() - start, 3),
+        'workers': workers,
+        'configs_evaluated': len(results),
+        'cv_folds': len(fold_ends),
+        'cv_horizon': horizon,
+        'best_cv_rmse': best['cv_rmse'],
+        'train_seconds_total': round(sum(row['train_seconds'] for row in results), 3),
+        'leaderboard': results[:5],
+    }
+    _save_cached(fingerprint, {'config': best['config'], 'report': report}, cache_dir)
+    return dict(best['config']), report
@@ -1,43 +1,70 @@
 # financial-analysis-suite-web/backend/api/fraud_detection.py
 
+import calendar
+
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import IsolationForest
-import matplotlib.pyplot as plt
+from sklearn.preprocessing import StandardScaler
+from matplotlib.figure import Figure
 import seaborn as sns
-import io
-import base64
+
+from .anomaly_detectors import get_detector, flag_anomalies
+from .data_loading import read_table
+from .partitioned_scoring import PARTITION_MIN_ROWS, partitioned_fit_score
+from .date_parsing import parse_date_columns
+from .plot_assets import PlotSpec, plot_renderer
+from .quantile_sketch import streaming_threshold
+from .schema import optimize_dtypes
+from .summary_stats import anomaly_statistics
+from .velocity_features import add_velocity_features
+
+# Columns the fraud engine reads (features, dates, account keys). Anything else in the
+# upload (addresses, notes, IPs) is skipped at parse time.
+FRAUD_COLUMNS = [
+    'TransactionID', 'AccountID', 'TransactionAmount', 'TransactionType', 'Location',
+    'DeviceID', 'Channel', 'CustomerAge', 'CustomerOccupation', 'TransactionDuration', 'LoginAttempts',
+    'AccountBalance', 'PreviousTransactionDate'
+]
+VALUE_COL_HINTS = ['TransactionAmount', 'amount', 'value', 'transaction', 'balance', 'sales']
 
 # Removed st_object from the main function definition
-def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float = 0.01, date_col_name: str = 'TransactionDate'):
+def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float = 0.01, date_col_name: str = 'TransactionDate',
+                             detector: str = 'isolation_forest', threshold_sketch: str = None,
+                             generate_plots: bool = True):
     """
     Main function for fraud detection analysis.
 
     Args:
         file_path_or_bytes_obj (any): Path to the CSV data file or an io.BytesIO object of the file.
-        contamination (float): The proportion of outliers in the data set for IsolationForest.
+        contamination (float): The proportion of outliers in the data set flagged as anomalies.
         date_col_name (str): The name of the primary date column for time-based features (e.g., 'TransactionDate').
+        detector (str): Anomaly detector backend: 'isolation_forest', 'hbos' or 'robust_zscore'
+                        (see anomaly_detectors.DETECTORS).
+        threshold_sketch (str, optional): Name of a persisted quantile sketch. When given, the
+                        HighTransactionAmount threshold is computed over this batch plus every
+                        earlier batch merged into the same sketch.
+        generate_plots (bool): Build the chart specs. Batch runs that only keep the tables turn this off.
 
     Returns:
-        tuple: (df, anomalies_df, anomaly_summary, top_anom_df, amount_col_name, plot_base64_images)
-            - df (pd.DataFrame): Original DataFrame with anomaly flags.
+        tuple: (df, anomalies_df, anomaly_summary, top_anom_df, amount_col_name, plot_specs)
+            - df (pd.DataFrame): Original DataFrame with anomaly flags and a continuous 'anomaly_score'.
+                                 Per-column date parsing timings are in df.attrs['date_parsing'].
             - anomalies_df (pd.DataFrame): DataFrame containing only detected anomalies.
             - anomaly_summary (list): List of summary strings for anomalies.
             - top_anom_df (pd.DataFrame or None): Top anomalies by value.
             - amount_col_name (str or None): The name of the identified amount column.
-            - plot_base64_images (dict): Dictionary of base64 encoded plot images.
+            - plot_specs (dict): Name -> plot_assets.PlotSpec. Charts are drawn lazily, when first
+                                 fetched from the plot asset store. Empty without generate_plots.
     """
 
     # Adapted fp to accept BytesIO object
     def load_data(fp: any):
-        """Loads CSV data from a file path or io.BytesIO object."""
-        if isinstance(fp, io.BytesIO):
-            df = pd.read_csv(fp)
-        else: # Assume it's a string path if not BytesIO
-            df = pd.read_csv(fp)
+        """Loads CSV/Parquet/Arrow data from a file path or io.BytesIO object, projecting to the columns we use."""
+        wanted = set(FRAUD_COLUMNS) | {date_col_name}
+        hints = [hint.lower() for hint in VALUE_COL_HINTS]
+        df = read_table(fp, columns=lambda name, kind: name in wanted or any(h in name.lower() for h in hints))
         df.columns = df.columns.str.strip() # Clean column names
-        return df
+        return optimize_dtypes(df) # Low-cardinality strings -> category, numerics -> compact dtypes
 
     def feature_engineer_fraud_data(df, primary_date_col): # Removed st_object from here
         """
@@ -45,9 +72,8 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
         """
         df_copy = df.copy()
 
-        for col in [primary_date_col, 'PreviousTransactionDate']:
-            if col in df_copy.columns:
-                df_copy[col] = pd.to_datetime(df_copy[col], errors='coerce')
+        # Sniffed format, each distinct timestamp parsed once
+        df_copy.attrs['date_parsing'] = parse_date_columns(df_copy, [primary_date_col, 'PreviousTransactionDate'])
 
         if primary_date_col in df_copy.columns and 'PreviousTransactionDate' in df_copy.columns:
             df_copy['TimeSinceLastTransaction'] = (df_copy[primary_date_col] - df_copy['PreviousTransactionDate']).dt.total_seconds()
@@ -62,10 +88,17 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
             df_copy['TransactionHour'] = -1
             df_copy['TransactionWeekday'] = -1
 
+        # Per-account velocity (counts/amounts over 1h/24h/7d, new location/device flags).
+        # Must run before the categorical columns below are replaced by their codes.
+        velocity_features = add_velocity_features(df_copy, date_col=primary_date_col)
+
         df_copy['IsNightTransaction'] = df_copy['TransactionHour'].apply(lambda x: 1 if 0 <= x <= 6 else 0)
 
         if 'TransactionAmount' in df_copy.columns and pd.api.types.is_numeric_dtype(df_copy['TransactionAmount']):
-            amount_threshold = df_copy['TransactionAmount'].quantile(0.95)
+            amount_threshold = streaming_threshold(
+                df_copy['TransactionAmount'], 0.95,
+                sketch_name=f'{threshold_sketch}-fraud-amount' if threshold_sketch else None
+            )
             df_copy['HighTransactionAmount'] = (df_copy['TransactionAmount'] > amount_threshold).astype(int)
         else:
             df_copy['HighTransactionAmount'] = 0
@@ -90,11 +123,12 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
         encoded_cols_names = []
         for col in categorical_cols_to_encode:
             if col in df_copy.columns:
-                try:
-                    df_copy[col] = LabelEncoder().fit_transform(df_copy[col].astype(str))
-                    encoded_cols_names.append(col)
-                except Exception as e:
-                    pass # Removed st_object.warning
+                # Categories are sorted, so the codes are what LabelEncoder used to assign
+                # (missing values get -1 instead of the code of the string 'nan').
+                if not isinstance(df_copy[col].dtype, pd.CategoricalDtype):
+                    df_copy[col] = df_copy[col].astype(str).astype('category')
+                df_copy[col] = df_copy[col].cat.codes
+                encoded_cols_names.append(col)
 
         base_features = [
             'TransactionAmount', 'CustomerAge', 'TransactionDuration', 'LoginAttempts',
@@ -108,7 +142,7 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
         ]
         
         final_features = []
-        for feature in base_features + engineered_features + encoded_cols_names:
+        for feature in base_features + engineered_features + velocity_features + encoded_cols_names:
             if feature in df_copy.columns:
                 final_features.append(feature)
 
@@ -121,7 +155,7 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
 
         return df_copy, final_features
 
-    def detect_anomalies(df_input, features_for_model, contam=0.01): # Removed st_object from here
+    def detect_anomalies(df_input, features_for_model, contam=0.01, detector_name='isolation_forest'): # Removed st_object from here
         if not features_for_model:
             raise ValueError("No valid features available for anomaly detection. Please check your data columns.")
 
@@ -134,41 +168,38 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
                 df_input[col] = pd.to_numeric(df_input[col], errors='coerce').fillna(0)
                 # Removed st_object.warning
 
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(df_input[features_for_model])
+        if len(df_input) >= PARTITION_MIN_ROWS:
+            # Large batches: scaled and scored in row blocks across the scoring pool
+            scores = partitioned_fit_score(df_input, features_for_model, detector_name)
+        else:
+            scaler = StandardScaler()
+            X_scaled = scaler.fit_transform(df_input[features_for_model])
 
-        model = IsolationForest(n_estimators=100, contamination=contam, random_state=42)
-        
-        df_input.loc[:, 'anomaly'] = model.fit_predict(X_scaled)
-        df_input.loc[:, 'is_anomaly'] = df_input['anomaly'].apply(lambda x: 1 if x == -1 else 0)
+            model = get_detector(detector_name)
+            scores = model.fit_score(X_scaled)
+        flags = flag_anomalies(scores, contam)
+
+        df_input.loc[:, 'anomaly_score'] = scores
+        df_input.loc[:, 'anomaly'] = np.where(flags, -1, 1)
+        df_input.loc[:, 'is_anomaly'] = flags.astype(int)
 
         anomalies_df = df_input[df_input['is_anomaly'] == 1].copy()
         
         return df_input, anomalies_df, features_for_model
 
 
-    def summarize_anomalies(anomalies_df, dc_name): # Removed st_object from here
-        summary = []
-        if dc_name in anomalies_df.columns and pd.api.types.is_datetime64_any_dtype(anomalies_df[dc_name]) and not anomalies_df[dc_name].isnull().all():
-            anomalies_df_copy = anomalies_df.copy()
-            anomalies_df_copy["Year"] = anomalies_df_copy[dc_name].dt.year
-            anomalies_df_copy["Month"] = anomalies_df_copy[dc_name].dt.month_name()
-            grouped = anomalies_df_copy.groupby(["Year", "Month"]).size().reset_index(name="Count")
-
-            if not grouped.empty:
-                summary.append("Anomalies by Month:")
-                for _, row in grouped.iterrows():
-                    summary.append(f"- {int(row['Count'])} anomalies in {row['Month']} {int(row['Year'])}")
-            else:
-                summary.append("No anomalies detected by month.")
-        else:
-            summary.append(f"Total anomalies detected: {len(anomalies_df)}")
+    def summarize_anomalies(stats): # Removed st_object from here
+        monthly = stats['monthly']
+        if monthly is None:
             # Removed st_object.warning
-
-        return summary
+            return [f"Total anomalies detected: {stats['anomalies']}"]
+        return ["Anomalies by Month:"] + [
+            f"- {count} anomalies in {calendar.month_name[month]} {year}"
+            for (year, month), count in zip(monthly.index, monthly.to_numpy())
+        ]
 
 
-    def top_anomalies(anomalies_df, value_col_hint=['TransactionAmount', 'amount', 'value', 'transaction', 'balance', 'sales']): # Removed st_object from here
+    def top_anomalies(anomalies_df, value_col_hint=VALUE_COL_HINTS): # Removed st_object from here
         amount_col = None
         df_cols_lower = {col.lower(): col for col in anomalies_df.columns}
 
@@ -190,107 +221,45 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
         # Removed st_object.warning
         return None, None
 
-    # --- Plotting Functions ---
-    def get_base64_image(plt_figure):
-        """Converts a Matplotlib figure to a base64 encoded PNG string."""
-        buf = io.BytesIO()
-        plt_figure.savefig(buf, format='png', bbox_inches='tight')
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close(plt_figure)
-        return img_base64
-
-    def plot_anomaly_count(df):
-        fig, ax = plt.subplots(figsize=(6, 4))
-        sns.countplot(x='is_anomaly', data=df, palette=['green', 'red'], ax=ax)
-        ax.set_title("Fraud vs Non-Fraud Predictions")
-        ax.set_xticks([0, 1])
-        ax.set_xticklabels(['Not Fraud', 'Fraud'])
-        ax.set_ylabel("Number of Transactions")
-        return fig
-
-    def plot_fraud_by_transaction_type(df):
-        if 'TransactionType' not in df.columns:
-            # Removed st_object.warning
-            return None
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        fraud_by_type = df.groupby(['TransactionType', 'is_anomaly']).size().unstack(fill_value=0)
-        fraud_by_type.plot(kind='bar', stacked=True, color=['green', 'red'], ax=ax)
-        ax.set_title("Fraud by Transaction Type")
-        ax.set_ylabel("Number of Transactions")
-        ax.set_xlabel("Transaction Type (Encoded)")
-        ax.legend(["Not Fraud", "Fraud"])
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        return fig
-
-    def plot_fraud_over_time(df, date_col_name):
-        if date_col_name not in df.columns or not pd.api.types.is_datetime64_any_dtype(df[date_col_name]) or df[date_col_name].isnull().all():
-            # Removed st_object.warning
-            return None
-        
-        fig, ax = plt.subplots(figsize=(12, 5))
-        fraud_daily = df[df['is_anomaly'] == 1].groupby(df[date_col_name].dt.date).size()
-        if not fraud_daily.empty:
-            fraud_daily.plot(kind='line', marker='o', color='red', ax=ax)
-            ax.set_title("Fraud Predictions Over Time")
-            ax.set_ylabel("Fraudulent Transactions")
-            ax.set_xlabel("Date")
-            ax.grid(True)
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            return fig
-        else:
-            # Removed st_object.info
-            return None
-
-    def plot_top_fraudulent_accounts(df):
-        if 'AccountID' not in df.columns:
+    # --- Plot data ---
+    # Each function picks the few numbers its chart shows from the statistics pass (see
+    # summary_stats.anomaly_statistics); the chart itself is drawn on first fetch from
+    # /api/plots (see the renderers at the bottom of this module).
+    def plot_anomaly_count(stats):
+        counts = pd.Series([stats['rows'] - stats['anomalies'], stats['anomalies']],
+                           index=pd.Index([0, 1], name='is_anomaly'), name='count')
+        return PlotSpec('fraud.anomaly_count.v1', counts)
+
+    def plot_fraud_by_transaction_type(stats):
+        if stats['by_type'] is None:
             # Removed st_object.warning
             return None
+        return PlotSpec('fraud.by_type.v1', stats['by_type'])
 
-        fig, ax = plt.subplots(figsize=(10, 6))
-        top_accounts = df[df['is_anomaly'] == 1]['AccountID'].value_counts().head(10)
-        
-        if not top_accounts.empty:
-            top_accounts.plot(kind='barh', color='darkred', ax=ax)
-            ax.set_title("Top 10 Fraudulent Accounts")
-            ax.set_xlabel("Number of Fraudulent Transactions")
-            ax.invert_yaxis()
-            plt.tight_layout()
-            return fig
-        else:
+    def plot_fraud_over_time(stats):
+        if stats['daily'] is None: # No datetime column, or no dated anomalies
             # Removed st_object.info
             return None
+        return PlotSpec('fraud.over_time.v1', stats['daily'])
 
-    def plot_correlation_heatmap(df, features_used):
-        cols_for_corr = [f for f in features_used if f in df.columns]
-        if 'is_anomaly' in df.columns and 'is_anomaly' not in cols_for_corr:
-            cols_for_corr.append('is_anomaly')
-        
-        numeric_df = df[cols_for_corr].select_dtypes(include=np.number)
-
-        if numeric_df.empty:
-            # Removed st_object.warning
+    def plot_top_fraudulent_accounts(stats):
+        if stats['by_account'] is None or stats['by_account'].empty:
+            # Removed st_object.info
             return None
+        top_accounts = stats['by_account'].head(10)
+        top_accounts.index = top_accounts.index.astype(str)
+        return PlotSpec('fraud.top_accounts.v1', top_accounts)
 
-        corr = numeric_df.corr()
-        
-        if 'is_anomaly' in corr.columns:
-            sorted_corr = corr[['is_anomaly']].sort_values(by='is_anomaly', ascending=False)
-            
-            fig, ax = plt.subplots(figsize=(6, max(6, len(sorted_corr) * 0.5)))
-            sns.heatmap(sorted_corr, annot=True, cmap='coolwarm', fmt=".2f", ax=ax, cbar=True)
-            ax.set_title("Correlation of Features with Fraud Prediction")
-            plt.tight_layout()
-            return fig
-        else:
+    def plot_correlation_heatmap(stats):
+        corr = stats['correlation']
+        if corr is None or 'is_anomaly' not in corr.columns:
             # Removed st_object.warning
             return None
+        sorted_corr = corr[['is_anomaly']].sort_values(by='is_anomaly', ascending=False)
+        return PlotSpec('fraud.correlation.v1', sorted_corr)
 
     # Main execution flow for fraud_detection_analysis
-    plot_images_b64 = {}
+    plot_specs = {}
 
     try:
         # Removed st_object.info
@@ -306,7 +275,7 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
 
     try:
         # Removed st_object.info
-        df_with_anomalies, anomalies_df, used_features = detect_anomalies(df_featured.copy(), features_for_model, contam=contamination)
+        df_with_anomalies, anomalies_df, used_features = detect_anomalies(df_featured.copy(), features_for_model, contam=contamination, detector_name=detector)
     except ValueError as e:
         raise ValueError(f"Anomaly detection failed: {e}")
     except RuntimeError as e:
@@ -315,31 +284,90 @@ def fraud_detection_analysis(file_path_or_bytes_obj: any, contamination: float =
         raise RuntimeError(f"A general error occurred during anomaly detection: {e}")
 
 
-    anomaly_summary_list = summarize_anomalies(anomalies_df, dc_name=date_col_name)
+    df_with_anomalies.attrs['date_parsing'] = df_featured.attrs.get('date_parsing', {})
+    # One pass over the scored frame for every summary and chart below
+    stats = anomaly_statistics(df_with_anomalies, date_col=date_col_name, type_col='TransactionType',
+                               account_col='AccountID', moment_cols=used_features if generate_plots else None)
+    anomaly_summary_list = summarize_anomalies(stats)
     top_anomalies_df, amount_col_identified = top_anomalies(anomalies_df)
 
-    # --- Generate Plots ---
+    # --- Collect Plots ---
     # Removed st_object.info
-    
-    # Plot 1: Anomaly Count Plot
-    fig_count = plot_anomaly_count(df_with_anomalies)
-    if fig_count: plot_images_b64['anomaly_count'] = get_base64_image(fig_count)
-    
-    # Plot 2: Fraud by Transaction Type
-    fig_type = plot_fraud_by_transaction_type(df_with_anomalies)
-    if fig_type: plot_images_b64['fraud_by_type'] = get_base64_image(fig_type)
-
-    # Plot 3: Fraud Over Time (requires valid date column)
-    fig_time = plot_fraud_over_time(df_with_anomalies, date_col_name)
-    if fig_time: plot_images_b64['fraud_over_time'] = get_base64_image(fig_time)
-
-    # Plot 4: Top Fraudulent Accounts (requires 'AccountID')
-    fig_accounts = plot_top_fraudulent_accounts(df_with_anomalies)
-    if fig_accounts: plot_images_b64['top_fraud_accounts'] = get_base64_image(fig_accounts)
-
-    # Plot 5: Correlation Heatmap
-    fig_corr = plot_correlation_heatmap(df_with_anomalies, used_features)
-    if fig_corr: plot_images_b64['correlation_heatmap'] = get_base64_image(fig_corr)
-
-
-    return df_with_anomalies, anomalies_df, anomaly_summary_list, top_anomalies_df, amount_col_identified, plot_images_b64
\ No newline at end of file
+    if generate_plots:
+        for name, spec in (
+            ('anomaly_count', plot_anomaly_count(stats)),
+            ('fraud_by_type', plot_fraud_by_transaction_type(stats)),
+            ('fraud_over_time', plot_fraud_over_time(stats)), # Requires a valid date column
+            ('top_fraud_accounts', plot_top_fraudulent_accounts(stats)), # Requires 'AccountID'
+            ('correlation_heatmap', plot_correlation_heatmap(stats)),
+        ):
+            if spec is not None:
+                plot_specs[name] = spec
+
+    return df_with_anomalies, anomalies_df, anomaly_summary_list, top_anomalies_df, amount_col_identified, plot_specs
+
+
+# ------------------ Plot renderers ------------------ #
+# Figure objects rather than pyplot, so renders from concurrent requests don't share state.
+
+@plot_renderer('fraud.anomaly_count.v1')
+def _render_anomaly_count(counts):
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.bar([0, 1], counts.to_numpy(), color=['green', 'red'])
+    ax.set_title("Fraud vs Non-Fraud Predictions")
+    ax.set_xticks([0, 1])
+    ax.set_xticklabels(['Not Fraud', 'Fraud'])
+    ax.set_xlabel("is_anomaly")
+    ax.set_ylabel("Number of Transactions")
+    return fig
+
+
+@plot_renderer('fraud.by_type.v1')
+def _render_fraud_by_type(fraud_by_type):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    fraud_by_type.plot(kind='bar', stacked=True, color=['green', 'red'], ax=ax)
+    ax.set_title("Fraud by Transaction Type")
+    ax.set_ylabel("Number of Transactions")
+    ax.set_xlabel("Transaction Type (Encoded)")
+    ax.legend(["Not Fraud", "Fraud"])
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+
+@plot_renderer('fraud.over_time.v1')
+def _render_fraud_over_time(fraud_daily):
+    fig = Figure(figsize=(12, 5))
+    ax = fig.subplots()
+    fraud_daily.plot(kind='line', marker='o', color='red', ax=ax)
+    ax.set_title("Fraud Predictions Over Time")
+    ax.set_ylabel("Fraudulent Transactions")
+    ax.set_xlabel("Date")
+    ax.grid(True)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+
+@plot_renderer('fraud.top_accounts.v1')
+def _render_top_accounts(top_accounts):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    top_accounts.plot(kind='barh', color='darkred', ax=ax)
+    ax.set_title("Top 10 Fraudulent Accounts")
+    ax.set_xlabel("Number of Fraudulent Transactions")
+    ax.invert_yaxis()
+    fig.tight_layout()
+    return fig
+
+
+@plot_renderer('fraud.correlation.v1')
+def _render_correlation(sorted_corr):
+    fig = Figure(figsize=(6, max(6, len(sorted_corr) * 0.5)))
+    ax = fig.subplots()
+    sns.heatmap(sorted_corr, annot=True, cmap='coolwarm', fmt=".2f", ax=ax, cbar=True)
+    ax.set_title("Correlation of Features with Fraud Prediction")
+    fig.tight_layout()
+    return fig
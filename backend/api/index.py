@@ -1,40 +1,225 @@
 # financial-analysis-suite-web/backend/api/index.py
 # (Or backend/api/__init__.py)
 
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS # Important for allowing your React frontend to talk to your Flask backend
 import io
 import json
 import os
 import pandas as pd
+import time
 import plotly.graph_objects as go # For Plotly figure type checking
 
 # Import your adapted core logic functions
 # These imports assume that financial_forecasting.py, fraud_detection.py,
 # tax_compliance.py, and invoice_processing.py are in the SAME directory
 # (backend/api/) as this index.py file.
-from .financial_forecasting import finance_forecasting
+from .financial_forecasting import MAX_INTERVAL_SAMPLES, finance_forecasting
+from .forecast_tuning import TUNING_WORKERS
 from .fraud_detection import fraud_detection_analysis
 from .tax_compliance import calculate_tax_liability
 from .invoice_processing import process_invoices
+from .anomaly_detectors import DETECTORS
+from .online_anomaly import ONLINE_METHODS
+from .invoice_store import InvoiceStore
+from .dataset_store import DatasetStore
+from .segmentation_cube import get_cube, has_cube
+from .streaming import FrameJSON, json_bytes_response, stream_json_body, streaming_json_response
+from .admission import AdmissionController, AdmissionRejected, admission_controlled, request_cost
+from .plot_assets import PLOT_FORMATS, PlotAssetStore, PlotSpec
+from .response_cache import ResponseCache, cached_response
+from .segment_anomaly import SEGMENT_COLUMNS
+from .data_loading import read_table
+from .jobs import JobStore
+from .profiling import ProfileStore, ProfilingMiddleware, admin_token_valid
+from .progressive import DEFAULT_SAMPLE_ROWS, EXACT_RESULT_MAX_WAIT, MAX_SAMPLE_ROWS, full_design, fraud_estimates, invoice_estimates, sample_report, stratified_sample
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes - necessary for React frontend to access API
 
+# Per-worker memory/CPU budget for the heavy endpoints; cheap ones get a reserved lane (see admission.py)
+admission = AdmissionController()
+
+# Complete analysis responses by input digest (RESPONSE_CACHE_DIR / RESPONSE_CACHE_MAX_BYTES); see response_cache.py
+response_cache = ResponseCache()
+
+_profile_store = None
+
+def get_profile_store():
+    """Lazily opens the captured profile store (directory from PROFILE_DIR)."""
+    global _profile_store
+    if _profile_store is None:
+        _profile_store = ProfileStore()
+    return _profile_store
+
+# Opt-in per-request profiling (X-Profile + X-Profile-Token headers); see profiling.py
+app.wsgi_app = ProfilingMiddleware(app.wsgi_app, get_profile_store)
+
+def has_side_effects(form):
+    """Requests that update persisted state (detector state, sketches, the invoice store, jobs) are never cached."""
+    return bool(form.get('series_id') or form.get('threshold_sketch')) or form.get('mode') == 'append' \
+        or form.get('progressive', 'false').lower() == 'true'
+
+def references_available(tags):
+    """
+    A cached response is only served while the charts and segment cube it points to can still
+    be fetched, from any worker: both are checked against their shared disk copies, so a hit
+    on an entry written by another worker doesn't invalidate (and delete) it.
+    """
+    if 'segment_cube_id' in tags and not has_cube(tags['segment_cube_id']):
+        return False
+    return all(get_plot_store().has(asset_id) for asset_id in tags.get('plot_ids', []))
+
+_invoice_store = None
+
+def get_invoice_store():
+    """Lazily opens the persistent invoice store (directory from INVOICE_STORE_DIR)."""
+    global _invoice_store
+    if _invoice_store is None:
+        _invoice_store = InvoiceStore()
+    return _invoice_store
+
+_dataset_store = None
+
+def get_dataset_store():
+    """Lazily opens the parse-once dataset cache (directory from DATASET_STORE_DIR)."""
+    global _dataset_store
+    if _dataset_store is None:
+        _dataset_store = DatasetStore()
+    return _dataset_store
+
+_plot_store = None
+
+def get_plot_store():
+    """Lazily opens the content-addressed chart cache (directory from PLOT_ASSET_DIR)."""
+    global _plot_store
+    if _plot_store is None:
+        _plot_store = PlotAssetStore()
+    return _plot_store
+
+def plot_url(spec, fmt='png'):
+    """Registers a PlotSpec for lazy rendering and returns its URL (swap the extension for SVG)."""
+    asset_id = get_plot_store().register(spec)
+    if 'response_cache_tags' in g:
+        g.response_cache_tags.setdefault('plot_ids', []).append(asset_id)
+    return f"/api/plots/{asset_id}.{fmt}"
+
+_job_store = None
+
+def get_job_store():
+    """Lazily opens the background job store (directory from JOB_DIR)."""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore()
+    return _job_store
+
+def lookup_dataset_metadata(dataset_id):
+    """Metadata of a registered dataset (None if unknown); used to cost dataset_id requests."""
+    return get_dataset_store().metadata(dataset_id)
+
+def get_upload():
+    """
+    Returns (data, None) for the analysis endpoints, or (None, error_response).
+    `data` is the typed frame of a registered `dataset_id` form field if one is given,
+    otherwise the uploaded file as a BytesIO object.
+    """
+    dataset_id = request.form.get('dataset_id')
+    if dataset_id:
+        df = get_dataset_store().get(dataset_id)
+        if df is None:
+            return None, (jsonify({"error": f"Unknown or expired dataset_id '{dataset_id}'. Upload it again via /api/datasets."}), 404)
+        return df, None
+    if 'file' not in request.files:
+        return None, (jsonify({"error": "No file part in request"}), 400)
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({"error": "No selected file"}), 400)
+    return io.BytesIO(file.read()), None
+
+def _run_exact_job(engine, cost, df, strata_col, run, build_payload, estimate):
+    """
+    Background half of a progressive request: the exact result, admitted like any other
+    analysis. Rejections are retried for up to EXACT_RESULT_MAX_WAIT seconds, then the job fails.
+    """
+    deadline = time.monotonic() + EXACT_RESULT_MAX_WAIT
+    while True:
+        try:
+            ticket = admission.acquire(cost)
+            break
+        except AdmissionRejected as e:
+            if time.monotonic() + e.retry_after > deadline:
+                raise RuntimeError(f"No capacity for the exact result within {EXACT_RESULT_MAX_WAIT:g} seconds "
+                                   f"({e.reason}). Resubmit the request later.") from e
+            time.sleep(e.retry_after)
+    try:
+        with app.app_context():
+            results = run(df)
+            design = full_design(df, strata_col)
+            payload = build_payload(results)
+            payload.update(approximate=False, sample=sample_report(design), estimates=estimate(results, df.index, design))
+            return b''.join(stream_json_body(payload))
+    finally:
+        admission.release(ticket)
+
+def progressive_response(engine, data, strata_candidates, run, build_payload, estimate):
+    """
+    Progressive mode for the fraud and invoice endpoints. The engine runs on a stratified
+    sample first (strata: the first of `strata_candidates` present), and the response is
+    flagged approximate, with the sample size and estimates (stderr, 95% CI) of the key
+    aggregates. The exact result is computed in the background; the response's job_url
+    returns it (same shape, approximate=false) once done. Uploads no larger than the
+    sample are answered exactly right away.
+
+    Args:
+        engine (str): Admission cost key ('fraud', 'invoice').
+        data: Uploaded BytesIO or registered dataset frame (see get_upload).
+        strata_candidates (list): Column names to stratify by, matched case-insensitively.
+        run (callable): frame -> engine results.
+        build_payload (callable): engine results -> response dict.
+        estimate (callable): (engine results, sampled index, design) -> estimates dict.
+    """
+    sample_rows = (request.form.get('sample_rows') or str(DEFAULT_SAMPLE_ROWS)).strip()
+    if not sample_rows.isdigit() or not 1 <= int(sample_rows) <= MAX_SAMPLE_ROWS:
+        return jsonify({"error": f"sample_rows must be a whole number from 1 to {MAX_SAMPLE_ROWS}."}), 400
+    sample_rows = int(sample_rows)
+    if isinstance(data, pd.DataFrame):
+        df = data  # Registered datasets are already parsed (and shared read-only)
+    else:
+        df = read_table(data)
+    by_name = {col.strip().lower(): col for col in df.columns}
+    strata_col = next((by_name[name] for name in strata_candidates if name in by_name), None)
+
+    if len(df) <= sample_rows:
+        results = run(df)
+        design = full_design(df, strata_col)
+        payload = build_payload(results)
+        payload.update(approximate=False, sample=sample_report(design), estimates=estimate(results, df.index, design))
+        return streaming_json_response(payload, request.headers.get('Accept-Encoding'))
+
+    sample, design = stratified_sample(df, strata_col, sample_rows)
+    results = run(sample)
+    payload = build_payload(results)
+    job_id = get_job_store().submit(engine, _run_exact_job, engine, request_cost(engine, lookup_dataset_metadata),
+                                    df, strata_col, run, build_payload, estimate)
+    payload.update(approximate=True, sample=sample_report(design), estimates=estimate(results, sample.index, design),
+                   job_id=job_id, job_url=f"/api/jobs/{job_id}")
+    return streaming_json_response(payload, request.headers.get('Accept-Encoding'))
+
 # Basic route for testing if the API is alive
 @app.route('/', methods=['GET'])
+@admission_controlled(admission, 'home')
 def home():
     """Returns a simple message indicating the API is running."""
     return jsonify({"message": "Financial Analysis Suite API is running!"})
 
-# --- Financial Forecasting Endpoint ---
-@app.route('/api/forecast', methods=['POST'])
-def forecast_endpoint():
+# --- Dataset Endpoints ---
+@app.route('/api/datasets', methods=['POST'])
+@admission_controlled(admission, 'dataset')
+def dataset_upload_endpoint():
     """
-    Handles financial forecasting requests. Expects a CSV file and parameters.
-    Returns forecasted data, anomalies, and plot data.
+    Uploads and parses a CSV, Parquet or Arrow IPC file once. The returned dataset_id can be sent
+    instead of the file to /api/forecast, /api/fraud and /api/invoice_process.
     """
-    # File upload via FormData from React frontend
     if 'file' not in request.files:
         return jsonify({"error": "No file part in request"}), 400
     file = request.files['file']
@@ -42,14 +227,64 @@ def forecast_endpoint():
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        # Pass file content as BytesIO object to your core function
-        file_bytes_io = io.BytesIO(file.read())
+        metadata = get_dataset_store().register(file.read(), filename=file.filename)
+        return jsonify(metadata), 201
+    except Exception as e:
+        app.logger.error(f"Error in /api/datasets: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/datasets/<dataset_id>', methods=['GET', 'DELETE'])
+@admission_controlled(admission, 'metadata')
+def dataset_endpoint(dataset_id):
+    """GET returns a registered dataset's metadata (rows, typed columns, memory); DELETE drops it."""
+    store = get_dataset_store()
+    if request.method == 'DELETE':
+        if not store.delete(dataset_id):
+            return jsonify({"error": f"Unknown dataset_id '{dataset_id}'."}), 404
+        return jsonify({"dataset_id": dataset_id, "deleted": True})
+
+    metadata = store.metadata(dataset_id)
+    if metadata is None:
+        return jsonify({"error": f"Unknown or expired dataset_id '{dataset_id}'."}), 404
+    return jsonify(metadata)
+
+def forecast_tuning_processes() -> int:
+    """Processes a forecast request will spawn: tune=true runs TUNING_WORKERS, each loading TensorFlow."""
+    tune = request.form.get('tune', 'false').lower() == 'true'
+    return TUNING_WORKERS if tune and TUNING_WORKERS > 1 else 0
+
+# --- Financial Forecasting Endpoint ---
+@app.route('/api/forecast', methods=['POST'])
+@cached_response(response_cache, bypass=has_side_effects, validate=references_available)
+@admission_controlled(admission, 'forecast', dataset_metadata=lookup_dataset_metadata,
+                      worker_processes=forecast_tuning_processes)
+def forecast_endpoint():
+    """
+    Handles financial forecasting requests. Expects a CSV, Parquet or Arrow IPC file (or a dataset_id) and parameters.
+    Returns forecasted data, anomalies, and plot data.
+    """
+    # File upload via FormData from React frontend, or the id of a dataset registered via /api/datasets
+    file_bytes_io, error_response = get_upload()
+    if error_response:
+        return error_response
+
+    try:
 
         # Extract other parameters from form data (e.g., from a FormData object in JS)
         target_col = request.form.get('target_column', 'target_sales')
         date_col = request.form.get('date_column', 'Date')
         forecast_months = int(request.form.get('forecast_months', 12))
         contamination = float(request.form.get('contamination', 0.01))
+        anomaly_method = request.form.get('anomaly_method') or None
+        use_isolation_forest = request.form.get('use_isolation_forest', 'true').lower() != 'false'
+        series_id = request.form.get('series_id') or None
+        interval_samples = request.form.get('interval_samples', '0').strip()
+        if not interval_samples.isdigit() or int(interval_samples) > MAX_INTERVAL_SAMPLES:
+            return jsonify({"error": f"interval_samples must be a whole number from 0 to {MAX_INTERVAL_SAMPLES}."}), 400
+        interval_samples = int(interval_samples)
+        tune = request.form.get('tune', 'false').lower() == 'true'
+        if anomaly_method and anomaly_method not in ONLINE_METHODS:
+            return jsonify({"error": f"Unknown anomaly_method '{anomaly_method}'. Choose one of: {', '.join(ONLINE_METHODS)}."}), 400
 
         # Call your core logic (already adapted not to use Streamlit's st_object)
         df_anomalies, forecast_df, plotly_forecast_fig, plot_images = finance_forecasting(
@@ -57,25 +292,35 @@ def forecast_endpoint():
             contamination=contamination,
             forecast_months=forecast_months,
             target_col=target_col,
-            date_col=date_col
+            date_col=date_col,
+            anomaly_method=anomaly_method,
+            use_isolation_forest=use_isolation_forest,
+            series_id=series_id,
+            interval_samples=interval_samples,
+            tune=tune
         )
 
         # Prepare results for JSON response
-        # DataFrames to JSON (orient='split' is good for re-creating in JavaScript)
+        # DataFrames to JSON (orient='split' is good for re-creating in JavaScript); FrameJSON streams
+        # them block by block instead of building each string up front
         # Plotly figures to JSON (Plotly.js can render this directly in the frontend)
-        # Matplotlib base64 strings are already strings
+        # Matplotlib charts become /api/plots URLs; they are rendered when the browser first fetches them
         
         response_data = {
-            "anomalies_data": df_anomalies.to_json(orient='split', date_format='iso'),
-            "forecast_data": forecast_df.to_json(orient='split', date_format='iso'),
+            "anomalies_data": FrameJSON(df_anomalies, date_format='iso'),
+            "forecast_data": FrameJSON(forecast_df, date_format='iso'),
             "main_forecast_plot_json": plotly_forecast_fig.to_json(),
             "additional_plots": {}
         }
+        if 'date_parsing' in df_anomalies.attrs:
+            response_data["date_parsing"] = df_anomalies.attrs['date_parsing']
+        if 'tuning' in forecast_df.attrs:
+            response_data["tuning"] = forecast_df.attrs['tuning']
         
         # Process the 'plot_images' dictionary returned by finance_forecasting
         for k, v in plot_images.items():
-            if isinstance(v, str): # This would be a Matplotlib base64 string
-                response_data["additional_plots"][k] = v
+            if isinstance(v, PlotSpec): # A Matplotlib chart, not drawn yet
+                response_data["additional_plots"][k] = plot_url(v)
             elif isinstance(v, go.Figure): # This would be a Plotly figure object
                 response_data["additional_plots"][k] = v.to_json()
             elif isinstance(v, dict) and all(isinstance(val, go.Figure) for val in v.values()):
@@ -85,7 +330,7 @@ def forecast_endpoint():
             # else:
             #     response_data["additional_plots"][k] = str(v) # Fallback for unexpected types
 
-        return jsonify(response_data)
+        return streaming_json_response(response_data, request.headers.get('Accept-Encoding'))
 
     except Exception as e:
         # It's good practice to log the full traceback for debugging in production environments
@@ -95,44 +340,62 @@ def forecast_endpoint():
 
 # --- Fraud Detection Endpoint ---
 @app.route('/api/fraud', methods=['POST'])
+@cached_response(response_cache, bypass=has_side_effects, validate=references_available)
+@admission_controlled(admission, 'fraud', dataset_metadata=lookup_dataset_metadata)
 def fraud_endpoint():
     """
-    Handles fraud detection requests. Expects a CSV file and parameters.
+    Handles fraud detection requests. Expects a CSV, Parquet or Arrow IPC file (or a dataset_id) and parameters.
     Returns fraud analysis results and plot data.
     """
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part in request"}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    file_bytes_io, error_response = get_upload()
+    if error_response:
+        return error_response
 
     try:
-        file_bytes_io = io.BytesIO(file.read())
         contamination = float(request.form.get('contamination', 0.01))
         date_col_name = request.form.get('date_column_name', 'TransactionDate')
-        
-        # Call your core logic (already adapted)
-        df_full, anomalies_df, anomaly_summary_list, top_anom_df, amount_col_name, plot_images = fraud_detection_analysis(
-            file_bytes_io,
-            contamination=contamination,
-            date_col_name=date_col_name
-        )
+        detector = request.form.get('detector', 'isolation_forest')
+        threshold_sketch = request.form.get('threshold_sketch') or None
+        progressive = request.form.get('progressive', 'false').lower() == 'true'
+        if detector not in DETECTORS:
+            return jsonify({"error": f"Unknown detector '{detector}'. Choose one of: {', '.join(DETECTORS)}."}), 400
+        if progressive and threshold_sketch:
+            return jsonify({"error": "progressive mode can't update a threshold_sketch (the sample and the exact run would both be merged)."}), 400
 
-        response_data = {
-            "full_data_json": df_full.to_json(orient='split', date_format='iso'),
-            "anomalies_data_json": anomalies_df.to_json(orient='split', date_format='iso'),
-            "anomaly_summary": anomaly_summary_list,
-            "top_anomalies_data_json": top_anom_df.to_json(orient='split', date_format='iso') if top_anom_df is not None else None,
-            "amount_col_name": amount_col_name,
-            "plot_images": {k: v for k,v in plot_images.items()} # These are already base64 strings from fraud_detection.py
-        }
-        return jsonify(response_data)
+        def run(data):
+            # Call your core logic (already adapted)
+            return fraud_detection_analysis(
+                data,
+                contamination=contamination,
+                date_col_name=date_col_name,
+                detector=detector,
+                threshold_sketch=threshold_sketch
+            )
+
+        def build_payload(results):
+            df_full, anomalies_df, anomaly_summary_list, top_anom_df, amount_col_name, plot_images = results
+            return {
+                "full_data_json": FrameJSON(df_full, date_format='iso'),
+                "anomalies_data_json": FrameJSON(anomalies_df, date_format='iso'),
+                "anomaly_summary": anomaly_summary_list,
+                "top_anomalies_data_json": FrameJSON(top_anom_df, date_format='iso') if top_anom_df is not None else None,
+                "amount_col_name": amount_col_name,
+                "detector": detector,
+                "date_parsing": df_full.attrs.get('date_parsing', {}),
+                "plot_images": {k: plot_url(v) for k, v in plot_images.items()} # URLs; charts render on first fetch
+            }
+
+        if progressive:
+            return progressive_response('fraud', file_bytes_io, ['transactiontype', 'channel'], run, build_payload,
+                                        lambda results, index, design: fraud_estimates(results[0], index, design, results[4]))
+        return streaming_json_response(build_payload(run(file_bytes_io)), request.headers.get('Accept-Encoding'))
     except Exception as e:
         app.logger.error(f"Error in /api/fraud: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 # --- Tax Compliance Endpoint ---
 @app.route('/api/tax_calculate', methods=['POST'])
+@admission_controlled(admission, 'tax')
 def tax_calculate_endpoint():
     """
     Calculates tax liability based on provided income, deductions, and year.
@@ -153,42 +416,227 @@ def tax_calculate_endpoint():
 
 # --- Invoice Processing Endpoint ---
 @app.route('/api/invoice_process', methods=['POST'])
+@cached_response(response_cache, bypass=has_side_effects, validate=references_available)
+@admission_controlled(admission, 'invoice', dataset_metadata=lookup_dataset_metadata)
 def invoice_process_endpoint():
     """
-    Handles invoice processing requests. Expects a CSV file and returns various analysis results.
+    Handles invoice processing requests. Expects a CSV, Parquet or Arrow IPC file (or a dataset_id) and returns various analysis results.
     """
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part in request"}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+    file_bytes_io, error_response = get_upload()
+    if error_response:
+        return error_response
 
     try:
-        file_bytes_io = io.BytesIO(file.read())
-        
-        # Call your core logic (already adapted)
-        df_original, top_segments_df, city_revenue_fig, revenue_trend_fig, \
-        suspicious_invoices_df, extracted_entities_df, actual_vs_budget_df, audit_flags_df = process_invoices(file_bytes_io)
+        near_dup_amount_tolerance = float(request.form.get('near_dup_amount_tolerance', 0.0))
+        near_dup_days = int(request.form.get('near_dup_days', 1))
+        near_dup_name_similarity = float(request.form.get('near_dup_name_similarity', 0.85))
+        # mode=append adds the upload to the persistent store and reports on the whole history
+        append_mode = request.form.get('mode', 'replace') == 'append'
+        threshold_sketch = request.form.get('threshold_sketch') or None
+        progressive = request.form.get('progressive', 'false').lower() == 'true'
+        # segment_by=product_id|job|city: judge amounts per segment instead of across all invoices
+        segment_by = request.form.get('segment_by') or None
+        if segment_by is not None and segment_by not in SEGMENT_COLUMNS:
+            return jsonify({"error": f"Unknown segment_by '{segment_by}'. Choose one of: {', '.join(SEGMENT_COLUMNS)}."}), 400
+        if progressive and (append_mode or threshold_sketch):
+            return jsonify({"error": "progressive mode can't be combined with mode=append or a threshold_sketch."}), 400
 
-        # Prepare results for JSON response
-        response_data = {
-            "summary": {
-                "total_invoices": len(df_original),
-                "total_revenue": df_original['total_value'].sum()
-            },
-            "top_segments_json": top_segments_df.to_json(orient='split'),
-            "city_revenue_fig_json": city_revenue_fig.to_json(),
-            "revenue_trend_fig_json": revenue_trend_fig.to_json(),
-            "suspicious_invoices_json": suspicious_invoices_df.to_json(orient='split'),
-            "extracted_entities_json": extracted_entities_df.to_json(orient='split'),
-            "actual_vs_budget_json": actual_vs_budget_df.to_json(orient='split'),
-            "audit_flags_json": audit_flags_df.to_json(orient='split')
-        }
-        return jsonify(response_data)
+        def run(data):
+            # Call your core logic (already adapted)
+            return process_invoices(
+                data,
+                near_dup_amount_tolerance=near_dup_amount_tolerance,
+                near_dup_days=near_dup_days,
+                near_dup_name_similarity=near_dup_name_similarity,
+                store=get_invoice_store() if append_mode else None,
+                threshold_sketch=threshold_sketch,
+                segment_by=segment_by
+            )
+
+        def build_payload(results):
+            return invoice_payload(results, append_mode)
+
+        if progressive:
+            # On a sample, duplicate and near-duplicate findings are incomplete; the exact job has them all
+            return progressive_response('invoice', file_bytes_io, ['city'], run, build_payload,
+                                        lambda results, index, design: invoice_estimates(results[0], index, design))
+        return streaming_json_response(build_payload(run(file_bytes_io)), request.headers.get('Accept-Encoding'))
     except Exception as e:
         app.logger.error(f"Error in /api/invoice_process: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+def invoice_payload(results, append_mode):
+    """Response dict for process_invoices results."""
+    df_original, top_segments_df, city_revenue_fig, revenue_trend_fig, \
+    suspicious_invoices_df, extracted_entities_df, actual_vs_budget_df, audit_flags_df = results
+
+    # Prepare results for JSON response
+    response_data = {
+        "summary": {
+            "total_invoices": len(df_original),
+            "total_revenue": df_original['total_value'].sum()
+        },
+        "top_segments_json": FrameJSON(top_segments_df),
+        "city_revenue_fig_json": city_revenue_fig.to_json(),
+        "revenue_trend_fig_json": revenue_trend_fig.to_json(),
+        "suspicious_invoices_json": FrameJSON(suspicious_invoices_df),
+        "extracted_entities_json": FrameJSON(extracted_entities_df),
+        "actual_vs_budget_json": FrameJSON(actual_vs_budget_df),
+        "audit_flags_json": FrameJSON(audit_flags_df)
+    }
+    if 'date_parsing' in df_original.attrs:
+        response_data["date_parsing"] = df_original.attrs['date_parsing']
+    if 'segment_models' in df_original.attrs:
+        response_data["segment_models"] = df_original.attrs['segment_models']
+    if 'segment_cube_id' in df_original.attrs:
+        response_data["segment_cube_id"] = df_original.attrs['segment_cube_id']
+        if 'response_cache_tags' in g:
+            g.response_cache_tags['segment_cube_id'] = df_original.attrs['segment_cube_id']
+    if append_mode:
+        response_data["store_report"] = df_original.attrs.get('store_report')
+        response_data["store_totals"] = get_invoice_store().totals()
+    return response_data
+
+@app.route('/api/invoice_segments/query', methods=['POST'])
+@admission_controlled(admission, 'query')
+def invoice_segments_query_endpoint():
+    """
+    Top-N, filter and roll-up queries against the segmentation cube built by /api/invoice_process.
+    Expects JSON: {"cube_id": ..., "group_by": ["city"], "filters": {"job": ["Engineer"]},
+                   "month_from": "2022-01", "month_to": "2022-06", "metric": "total_revenue", "top_n": 10}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object."}), 400
+        cube_id, top_n = data.get('cube_id'), data.get('top_n', 10)
+        if not isinstance(cube_id, str) or not cube_id:
+            return jsonify({"error": "cube_id (from /api/invoice_process) is required."}), 400
+        if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1:
+            return jsonify({"error": "top_n must be a positive whole number."}), 400
+        cube = get_cube(cube_id)
+        if cube is None:
+            return jsonify({"error": "Unknown or expired cube_id. Re-run /api/invoice_process."}), 404
+
+        result = cube.query(
+            group_by=data.get('group_by', ['city', 'job']),
+            filters=data.get('filters'),
+            month_from=data.get('month_from'),
+            month_to=data.get('month_to'),
+            metric=data.get('metric', 'total_revenue'),
+            top_n=top_n,
+            ascending=bool(data.get('ascending', False))
+        )
+        return jsonify({"cube_id": cube_id, "result_json": result.to_json(orient='split')})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error in /api/invoice_segments/query: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/invoice_store/summary', methods=['GET'])
+@admission_controlled(admission, 'summary')
+def invoice_store_summary_endpoint():
+    """
+    Dashboard data for all invoices appended so far, served from the store's running aggregates.
+    Optional query parameter: top_n (default 10).
+    """
+    try:
+        top_n = int(request.args.get('top_n', 10))
+        summary = get_invoice_store().summary(top_n=top_n)
+        return jsonify({
+            "summary": summary['totals'],
+            "top_segments_json": summary['top_segments'].to_json(orient='split'),
+            "city_revenue_fig_json": summary['city_revenue_fig'].to_json(),
+            "revenue_trend_fig_json": summary['revenue_trend_fig'].to_json(),
+            "actual_vs_budget_json": summary['actual_vs_budget'].to_json(orient='split')
+        })
+    except Exception as e:
+        app.logger.error(f"Error in /api/invoice_store/summary: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/plots/<asset_id>.<fmt>', methods=['GET'])
+@admission_controlled(admission, 'plot')
+def plot_asset_endpoint(asset_id, fmt):
+    """
+    Serves a chart by content hash, rendering it on first request. The id covers the chart's
+    data and drawing code, so responses never change: strong ETag and an immutable Cache-Control.
+    """
+    if fmt not in PLOT_FORMATS:
+        return jsonify({"error": f"Unknown plot format '{fmt}'. Choose one of: {', '.join(PLOT_FORMATS)}."}), 400
+    etag = f"{asset_id}-{fmt}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        image = get_plot_store().get(asset_id, fmt)
+        if image is None:
+            return jsonify({"error": f"Unknown or expired plot '{asset_id}'. Re-run the analysis to regenerate it."}), 404
+        response = app.response_class(image, mimetype=PLOT_FORMATS[fmt])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@admission_controlled(admission, 'job')
+def job_endpoint(job_id):
+    """
+    Result of a background job (e.g. the exact run behind a progressive response):
+    202 with its status while queued or running, then the result body.
+    """
+    jobs = get_job_store()
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown or expired job '{job_id}'."}), 404
+    if status['status'] in ('queued', 'running'):
+        return jsonify(status), 202
+    if status['status'] == 'failed':
+        return jsonify(status), 500
+    body = jobs.result(job_id)
+    if body is None:
+        return jsonify({"error": f"Result of job '{job_id}' has expired."}), 404
+    return json_bytes_response(body, request.headers.get('Accept-Encoding'))
+
+@app.route('/api/profiles/<profile_id>', defaults={'fmt': 'json'}, methods=['GET'])
+@app.route('/api/profiles/<profile_id>.<fmt>', methods=['GET'])
+@admission_controlled(admission, 'profile')
+def profile_endpoint(profile_id, fmt):
+    """
+    A profile captured with the X-Profile header: the JSON summary and, for sampled
+    captures, the collapsed stacks (.collapsed, input for flamegraph.pl or speedscope) or,
+    for cProfile captures, the raw stats (.pstats, for pstats or snakeviz). Needs the same
+    X-Profile-Token.
+    """
+    if not admin_token_valid(request.headers.get('X-Profile-Token')):
+        return jsonify({"error": "Profiles require a valid X-Profile-Token."}), 403
+    if fmt not in ('json', 'collapsed', 'pstats'):
+        return jsonify({"error": f"Unknown profile format '{fmt}'. Choose one of: json, collapsed, pstats."}), 400
+    profiles = get_profile_store()
+    if fmt == 'json':
+        summary = profiles.summary(profile_id)
+        if summary is None:
+            return jsonify({"error": f"Unknown or expired profile '{profile_id}'."}), 404
+        return jsonify(summary)
+    content = profiles.artifact(profile_id, fmt)
+    if content is None:
+        return jsonify({"error": f"No {fmt} output for profile '{profile_id}'."}), 404
+    mimetype = 'text/plain' if fmt == 'collapsed' else 'application/octet-stream'
+    return app.response_class(content, mimetype=mimetype)
+
+@app.route('/api/plots/stats', methods=['GET'])
+def plot_stats_endpoint():
+    """Chart cache occupancy and render/hit counters of this worker."""
+    return jsonify(get_plot_store().stats())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def response_cache_stats_endpoint():
+    """Response cache occupancy and hit/miss/304 counters of this worker."""
+    return jsonify(response_cache.stats())
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats_endpoint():
+    """This worker's admission budgets, in-flight load, queue length and admit/reject counters."""
+    return jsonify(admission.stats())
+
 # --- Main entry point for Vercel ---
 # Vercel will look for an 'app' object in this file if 'src' in vercel.json points here.
 # This makes 'app' the WSGI application that Vercel will serve.
\ No newline at end of file
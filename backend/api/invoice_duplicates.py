@@ -0,0 +1,153 @@
+# financial-analysis-suite-web/backend/api/invoice_duplicates.py
+
+import difflib
+import numpy as np
+import pandas as pd
+
+# Exact-duplicate rule sets used by the invoice engine.
+DUPLICATE_RULES = {
+    'fraud': ['invoice_date', 'first_name', 'product_id', 'amount'],
+    'audit': ['invoice_date', 'email', 'amount'],
+}
+
+
+class DuplicateIndex:
+    """
+    Hashed key index over an invoice frame for exact-duplicate detection.
+
+    Each rule set (a list of columns) is hashed once into a single uint64 key per row with
+    `pd.util.hash_pandas_object`; duplicate checks then run on that one integer column
+    instead of re-comparing the multi-column subset. Keys are cached per rule set, so the
+    fraud and audit stages (and any later caller) share the work.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._keys = {}
+
+    def key(self, cols: list) -> pd.Series:
+        """Returns the cached hashed key for `cols`, or None if any column is missing."""
+        cols = tuple(cols)
+        if any(col not in self.df.columns for col in cols):
+            return None
+        if cols not in self._keys:
+            self._keys[cols] = pd.util.hash_pandas_object(self.df[list(cols)], index=False)
+        return self._keys[cols]
+
+    def duplicated(self, cols: list, index: pd.Index = None) -> pd.Series:
+        """
+        Marks every row that shares its `cols` values with another row (keep=False semantics).
+
+        Args:
+            cols (list): Columns of the rule set.
+            index (pd.Index, optional): Align the result to these rows (e.g. a filtered copy).
+
+        Returns:
+            pd.Series or None: Boolean mask, or None if the rule's columns are not all present.
+        """
+        key = self.key(cols)
+        if key is None:
+            return None
+        mask = key.duplicated(keep=False)
+        if index is not None:
+            mask = mask.reindex(index, fill_value=False)
+        return mask
+
+
+def _client_names(df: pd.DataFrame) -> np.ndarray:
+    """Lower-cased 'first last' per row; None where the row has no name (never matches), or None if there are no name columns."""
+    parts = [df[col].astype('string').str.strip().fillna('') for col in ('first_name', 'last_name') if col in df.columns]
+    if not parts:
+        return None
+    names = parts[0] if len(parts) == 1 else parts[0] + ' ' + parts[1]
+    names = names.str.lower().str.strip().to_numpy(dtype=object)
+    names[names == ''] = None
+    return names
+
+
+def find_near_duplicates(df: pd.DataFrame, amount_tolerance: float = 0.0, date_tolerance_days: int = 1,
+                         name_similarity: float = 0.85, window: int = 10,
+                         block_cols: tuple = ('product_id',)) -> pd.DataFrame:
+    """
+    Finds pairs of invoices that are probably the same invoice entered twice: same product,
+    amounts within `amount_tolerance`, dates at most `date_tolerance_days` apart and client
+    names at least `name_similarity` alike (catches typos). Exact copies are left to the
+    exact-duplicate rules.
+
+    Rather than comparing every pair, rows are blocked on `block_cols` and sorted by
+    (block, amount, date); each row is only compared with its next `window` neighbours
+    (sorted-neighbourhood blocking), which keeps the cost near-linear. Name similarity is
+    only computed for the few pairs that survive the amount and date checks.
+
+    Args:
+        df (pd.DataFrame): Cleaned invoices with 'amount' and datetime 'invoice_date'.
+        amount_tolerance (float): Maximum absolute amount difference.
+        date_tolerance_days (int): Maximum days between the two invoice dates.
+        name_similarity (float): Minimum SequenceMatcher ratio between client names (0-1). Rows
+            without a name never pair; without first_name/last_name columns the test is skipped
+            (name_similarity is then NaN).
+        window (int): Number of sorted neighbours each row is compared with.
+        block_cols (tuple): Columns that must match exactly (blocking key).
+
+    Returns:
+        pd.DataFrame: One row per pair with columns left_index, right_index, amount_diff,
+                      days_apart and name_similarity.
+    """
+    pair_cols = ['left_index', 'right_index', 'amount_diff', 'days_apart', 'name_similarity']
+    if df.empty or 'amount' not in df.columns or 'invoice_date' not in df.columns:
+        return pd.DataFrame(columns=pair_cols)
+
+    present_blocks = [col for col in block_cols if col in df.columns]
+    if present_blocks:
+        block = pd.util.hash_pandas_object(df[present_blocks], index=False).to_numpy()
+    else:
+        block = np.zeros(len(df), dtype=np.uint64)
+    amounts = df['amount'].to_numpy(dtype=np.float64)
+    days = df['invoice_date'].to_numpy().astype('datetime64[s]').astype(np.int64) / 86400.0
+    names = _client_names(df)
+
+    order = np.lexsort((days, amounts, block))
+    block, amounts, days = block[order], amounts[order], days[order]
+    if names is not None:
+        names = names[order]
+
+    left_parts, right_parts = [], []
+    for lag in range(1, min(window, len(order) - 1) + 1):
+        left = np.arange(len(order) - lag)
+        right = left + lag
+        candidate = (block[left] == block[right]) \
+            & (np.abs(amounts[right] - amounts[left]) <= amount_tolerance) \
+            & (np.abs(days[right] - days[left]) <= date_tolerance_days)
+        left_parts.append(left[candidate])
+        right_parts.append(right[candidate])
+
+    if not left_parts:
+        return pd.DataFrame(columns=pair_cols)
+    left = np.concatenate(left_parts)
+    right = np.concatenate(right_parts)
+
+    if names is None:  # No name columns: amount, date and product alone decide
+        similarity = np.full(len(left), np.nan)
+        exact_copy = days[left] == days[right]
+        keep = ~exact_copy
+    else:  # Rows without a name never match
+        similarity = np.array([
+            difflib.SequenceMatcher(None, names[l], names[r]).ratio() if names[l] is not None and names[r] is not None
+            else 0.0 for l, r in zip(left, right)
+        ], dtype=np.float64)
+        exact_copy = (names[left] == names[right]) & (days[left] == days[right])
+        keep = (similarity >= name_similarity) & ~exact_copy
+
+    return pd.DataFrame({
+        'left_index': df.index.to_numpy()[order[left[keep]]],
+        'right_index': df.index.to_numpy()[order[right[keep]]],
+        'amount_diff': np.abs(amounts[right[keep]] - amounts[left[keep]]),
+        'days_apart': np.abs(days[right[keep]] - days[left[keep]]),
+        'name_similarity': similarity[keep],
+    }, columns=pair_cols)
+
+
+def near_duplicate_mask(pairs: pd.DataFrame, index: pd.Index) -> pd.Series:
+    """Marks every row of `index` that appears on either side of a near-duplicate pair."""
+    flagged = pd.Index(pairs['left_index']).append(pd.Index(pairs['right_index']))
+    return pd.Series(index.isin(flagged), index=index)
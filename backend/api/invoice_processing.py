@@ -1,5 +1,7 @@
 # financial-analysis-suite-web/backend/api/invoice_processing.py
 
+import logging
+
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest
@@ -7,12 +9,119 @@ import plotly.express as px
 import io
 import plotly.graph_objects as go
 
-
-def process_invoices(file_path_or_bytes_obj: any):
+from .data_loading import read_table
+from .quantile_sketch import streaming_threshold
+from .date_parsing import parse_date_columns
+from .schema import fill_missing, optimize_dtypes
+from .segmentation_cube import SegmentCube, register_cube
+from .invoice_duplicates import DUPLICATE_RULES, DuplicateIndex, find_near_duplicates, near_duplicate_mask
+from .segment_anomaly import segment_anomaly_flags
+
+logger = logging.getLogger(__name__)
+
+# Normalized names of the invoice columns the engine reads; the rest of the export is skipped.
+INVOICE_COLUMNS = [
+    'invoice_id', 'invoice_date', 'amount', 'qty', 'product_id', 'first_name', 'last_name',
+    'email', 'city', 'job'
+]
+
+
+def normalize_invoice_column(name: str) -> str:
+    return name.strip().lower().replace(" ", "_")
+
+
+def segmentation_outputs(segmentation: pd.DataFrame, monthly_revenue: pd.DataFrame, top_n: int = 10,
+                         figures: bool = True):
+    """
+    Builds the segmentation results from per-(city, job) and per-month aggregates.
+
+    Args:
+        segmentation (pd.DataFrame): city, job, total_revenue, avg_invoice_amount, total_invoices.
+        monthly_revenue (pd.DataFrame): invoice_month ('YYYY-MM'), total_value.
+        top_n (int): Number of segments and cities to keep.
+        figures (bool): Build the Plotly figures; without them both figures are None.
+
+    Returns:
+        tuple: (top_segments, city_revenue_fig, revenue_trend_fig)
+    """
+    top_segments = segmentation.sort_values(by='total_revenue', ascending=False).head(top_n)
+    if not figures:
+        return top_segments, None, None
+
+    city_revenue_data = segmentation.groupby('city', observed=True)['total_revenue'].sum().sort_values(ascending=False).head(top_n).reset_index()
+    city_revenue_fig = px.bar(
+        city_revenue_data,
+        x='city', y='total_revenue',
+        title=f"Top {top_n} Cities by Revenue",
+        labels={'total_revenue': 'Total Revenue', 'city': 'City'}
+    )
+    city_revenue_fig.update_layout(plot_bgcolor='white')
+
+    monthly_revenue = monthly_revenue.copy()
+    monthly_revenue['invoice_month_sort'] = pd.to_datetime(monthly_revenue['invoice_month'])
+    monthly_revenue = monthly_revenue.sort_values('invoice_month_sort').drop(columns='invoice_month_sort')
+
+    revenue_trend_fig = px.line(
+        monthly_revenue, x='invoice_month', y='total_value',
+        title="Monthly Revenue Trend", markers=True,
+        labels={'invoice_month': 'Month', 'total_value': 'Revenue'}
+    )
+    revenue_trend_fig.update_layout(plot_bgcolor='white')
+
+    return top_segments, city_revenue_fig, revenue_trend_fig
+
+
+def actual_vs_budget_from_actuals(budget_reference: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds budget, variance and status to per-job actuals (columns: job, actual).
+    The budget is a seeded +/-20% perturbation of the actuals, so it is reproducible.
+    """
+    budget_reference = budget_reference.copy()
+    np.random.seed(42)
+    if not budget_reference.empty:
+        budget_reference["budget"] = budget_reference["actual"] * np.random.uniform(0.8, 1.2, size=len(budget_reference))
+    else:
+        budget_reference["budget"] = 0
+
+    actual_vs_budget = budget_reference.copy()
+    actual_vs_budget["variance"] = actual_vs_budget["actual"] - actual_vs_budget["budget"]
+    actual_vs_budget["status"] = actual_vs_budget["variance"].apply(lambda x: "🔴 Over" if x > 0 else "🟢 Under")
+    return actual_vs_budget
+
+
+def process_invoices(file_path_or_bytes_obj: any, near_dup_amount_tolerance: float = 0.0,
+                     near_dup_days: int = 1, near_dup_name_similarity: float = 0.85, store=None,
+                     threshold_sketch: str = None, generate_plots: bool = True, segment_by: str = None):
+    """
+    Runs the invoice analyses: segmentation, rule/ML fraud flags, entity extraction and budget vs actual.
+
+    Args:
+        file_path_or_bytes_obj (any): Path to the invoice file or an io.BytesIO object of it.
+        near_dup_amount_tolerance (float): Max amount difference for two invoices to count as near-duplicates.
+        near_dup_days (int): Max days apart for two invoices to count as near-duplicates.
+        near_dup_name_similarity (float): Min client-name similarity (0-1) for near-duplicates.
+        store (InvoiceStore, optional): Append mode. The batch is added to this persistent store and
+                                        segmentation, revenue trend and budget figures are served from
+                                        its running aggregates (whole history) instead of recomputed.
+                                        The append report is left in df.attrs['store_report'].
+        threshold_sketch (str, optional): Name of a persisted quantile sketch; the high-value audit
+                                          threshold then covers all batches merged into it.
+        generate_plots (bool): Build the city revenue and revenue trend figures (None otherwise).
+        segment_by (str, optional): 'product_id', 'job' or 'city'. The ML fraud flag then judges each
+                                    amount against its segment (see segment_anomaly) instead of one
+                                    IsolationForest over all invoices; the report is in
+                                    df.attrs['segment_models'].
+
+    Returns:
+        tuple: (df, top_segments, city_revenue_fig, revenue_trend_fig, suspicious_invoices,
+                extracted_entities, actual_vs_budget, audit_flags). Outside append mode the id of the
+                cached segmentation cube (see segmentation_cube) is in df.attrs['segment_cube_id'],
+                and per-column date parsing timings are in df.attrs['date_parsing'].
+    """
 
     def load_and_clean_data(file_obj: any):
-        df = pd.read_csv(file_obj)
-        df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
+        df = read_table(file_obj, columns=INVOICE_COLUMNS, normalize=normalize_invoice_column)
+        df.columns = df.columns.map(normalize_invoice_column)
         df.drop_duplicates(inplace=True)
         
         required_cols = ['invoice_date', 'amount', 'product_id']
@@ -28,17 +137,19 @@ def process_invoices(file_path_or_bytes_obj: any):
             df['qty'] = 1
             
         if 'job' in df.columns:
-            df['job'] = df['job'].fillna("Unknown")
+            df['job'] = fill_missing(df['job'], "Unknown")
         else:
             df['job'] = "Unknown"
         
         if 'email' in df.columns:
-            df['email'] = df['email'].fillna("no-email@unknown.com")
+            df['email'] = fill_missing(df['email'], "no-email@unknown.com")
         else:
             df['email'] = "no-email@unknown.com"
 
+        # Low-cardinality strings (city, job, names) -> category, numerics -> compact dtypes
+        df = optimize_dtypes(df)
 
-        df['invoice_date'] = pd.to_datetime(df['invoice_date'], errors='coerce')
+        date_parsing = parse_date_columns(df, ['invoice_date']) # Sniffed format, unique values parsed once
         df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
         if 'qty' in df.columns:
             df['qty'] = pd.to_numeric(df['qty'], errors='coerce')
@@ -49,15 +160,15 @@ def process_invoices(file_path_or_bytes_obj: any):
 
         df = df.dropna(subset=['amount', 'total_value'])
         df = df[df['amount'] > 0]
+        df.attrs['date_parsing'] = date_parsing
 
-        # --- DEBUG PRINT ---
-        print("\n--- After load_and_clean_data ---")
-        print("DF shape:", df.shape)
-        print("DF columns:", df.columns.tolist())
-        print("DF head:\n", df.head())
-        print("DF dtypes:\n", df.dtypes)
-        print("Missing values after cleaning:\n", df.isnull().sum())
-        # --- END DEBUG PRINT ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("--- After load_and_clean_data ---")
+            logger.debug("DF shape: %s", df.shape)
+            logger.debug("DF columns: %s", df.columns.tolist())
+            logger.debug("DF head:\n%s", df.head())
+            logger.debug("DF dtypes:\n%s", df.dtypes)
+            logger.debug("Missing values after cleaning:\n%s", df.isnull().sum())
 
         return df
 
@@ -67,99 +178,82 @@ def process_invoices(file_path_or_bytes_obj: any):
         if 'city' not in df.columns: df['city'] = 'unknown_city' # Use lowercase for consistency
         if 'job' not in df.columns: df['job'] = 'unknown' # Use lowercase for consistency
 
-        # --- DEBUG PRINT ---
-        print("\n--- Before Segmentation Groupby ---")
-        print("DF head (for segmentation):\n", df[['city', 'job', 'total_value', 'amount', 'product_id']].head())
-        print("Unique cities:", df['city'].unique())
-        print("Unique jobs:", df['job'].unique())
-        # --- END DEBUG PRINT ---
-
-        segmentation = df.groupby(['city', 'job']).agg(
-            total_revenue=('total_value', 'sum'),
-            avg_invoice_amount=('amount', 'mean'),
-            total_invoices=('product_id', 'count')
-        ).reset_index()
-
-        top_segments = segmentation.sort_values(by='total_revenue', ascending=False).head(10)
-
-        city_revenue_data = segmentation.groupby('city')['total_revenue'].sum().sort_values(ascending=False).head(10).reset_index()
-        city_revenue_fig = px.bar(
-            city_revenue_data,
-            x='city', y='total_revenue',
-            title="Top 10 Cities by Revenue",
-            labels={'total_revenue': 'Total Revenue', 'city': 'City'}
-        )
-        city_revenue_fig.update_layout(plot_bgcolor='white')
-
-        monthly_revenue = df.groupby('invoice_month')['total_value'].sum().reset_index()
-        monthly_revenue['invoice_month_sort'] = pd.to_datetime(monthly_revenue['invoice_month'])
-        monthly_revenue = monthly_revenue.sort_values('invoice_month_sort').drop(columns='invoice_month_sort')
-
-        revenue_trend_fig = px.line(
-            monthly_revenue, x='invoice_month', y='total_value',
-            title="Monthly Revenue Trend", markers=True,
-            labels={'invoice_month': 'Month', 'total_value': 'Revenue'}
-        )
-        revenue_trend_fig.update_layout(plot_bgcolor='white')
-
-        # --- DEBUG PRINT ---
-        print("\n--- After Segmentation Analysis ---")
-        print("Top Segments:\n", top_segments)
-        print("City Revenue Data (for plot):\n", city_revenue_data)
-        # --- END DEBUG PRINT ---
-
-        return top_segments, city_revenue_fig, revenue_trend_fig
-
-
-    def detect_fraud(df):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("--- Before Segmentation Groupby ---")
+            logger.debug("DF head (for segmentation):\n%s", df[['city', 'job', 'total_value', 'amount', 'product_id']].head())
+            logger.debug("Unique cities: %s", df['city'].unique())
+            logger.debug("Unique jobs: %s", df['job'].unique())
+
+        # One pass over the invoices builds the city x job x product x month cube; the segment
+        # table and monthly trend are roll-ups of it, and it is cached for drill-down queries.
+        cube = SegmentCube.from_frame(df)
+        cube_id = register_cube(cube)
+
+        segmentation = cube.query(group_by=['city', 'job'], top_n=None)
+        monthly_revenue = cube.query(group_by=['invoice_month'], top_n=None) \
+            .rename(columns={'total_revenue': 'total_value'})[['invoice_month', 'total_value']]
+
+        return segmentation_outputs(segmentation, monthly_revenue, figures=generate_plots) + (cube_id,)
+
+
+    def detect_fraud(df, dup_index):
         df = df.copy()
         df['fraud_flag_rule'] = 0
 
         df.loc[df['amount'] <= 0, 'fraud_flag_rule'] = 1
         
         # Rule 2: Duplicate invoices based on date, first_name, product_id, amount
-        duplicate_subset_cols = ['invoice_date', 'first_name', 'product_id', 'amount']
+        duplicate_subset_cols = DUPLICATE_RULES['fraud']
         existing_duplicate_cols = [col for col in duplicate_subset_cols if col in df.columns]
 
-        # --- DEBUG PRINT ---
-        print("\n--- Before Fraud Detection ---")
-        print("DF head (for fraud):\n", df[existing_duplicate_cols + ['amount']].head())
-        print("Checking for duplicates with columns:", existing_duplicate_cols)
-        # --- END DEBUG PRINT ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("--- Before Fraud Detection ---")
+            logger.debug("DF head (for fraud):\n%s", df[existing_duplicate_cols + ['amount']].head())
+            logger.debug("Checking for duplicates with columns: %s", existing_duplicate_cols)
 
-        if len(existing_duplicate_cols) == len(duplicate_subset_cols):
-            duplicates = df.duplicated(subset=existing_duplicate_cols, keep=False)
+        duplicates = dup_index.duplicated(duplicate_subset_cols, index=df.index)
+        if duplicates is not None:
             df.loc[duplicates, 'fraud_flag_rule'] = 1
-            # --- DEBUG PRINT ---
-            print("Rule-based duplicates found:", df['fraud_flag_rule'].sum())
-            # --- END DEBUG PRINT ---
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Rule-based duplicates found: %s", df['fraud_flag_rule'].sum())
         else:
-            print(f"Warning: Skipping rule-based duplicate fraud detection due to missing columns: {list(set(duplicate_subset_cols) - set(existing_duplicate_cols))}")
+            logger.warning("Skipping rule-based duplicate fraud detection due to missing columns: %s",
+                           list(set(duplicate_subset_cols) - set(existing_duplicate_cols)))
+
+        # Rule 3: Near-duplicates (same product, amount within tolerance, a few days apart, similar client name)
+        near_pairs = find_near_duplicates(df, amount_tolerance=near_dup_amount_tolerance,
+                                          date_tolerance_days=near_dup_days,
+                                          name_similarity=near_dup_name_similarity)
+        df['fraud_flag_near_duplicate'] = near_duplicate_mask(near_pairs, df.index).astype(int)
 
         # ML-based fraud detection: IsolationForest
         features = df[['amount']].copy().dropna()
-        if features.empty:
+        segment_report = None
+        if segment_by and not features.empty:
+            # Per segment: robust statistics for small segments, cached forests for large ones
+            df['fraud_flag_ml'], segment_report = segment_anomaly_flags(df, segment_by)
+        elif features.empty:
             df['fraud_flag_ml'] = 0
-            print("Warning: 'amount' feature is empty for ML fraud detection.")
+            logger.warning("'amount' feature is empty for ML fraud detection.")
         else:
             model = IsolationForest(n_estimators=100, contamination=0.02, random_state=42)
             df.loc[features.index, 'fraud_flag_ml'] = model.fit_predict(features)
             df['fraud_flag_ml'] = df['fraud_flag_ml'].map({1: 0, -1: 1})
             df['fraud_flag_ml'] = df['fraud_flag_ml'].fillna(0).astype(int)
-            print("ML-based fraud flags (total):", df['fraud_flag_ml'].sum())
+            logger.debug("ML-based fraud flags (total): %s", df['fraud_flag_ml'].sum())
 
-        df['fraud_suspected'] = df[['fraud_flag_rule', 'fraud_flag_ml']].max(axis=1)
+        df['fraud_suspected'] = df[['fraud_flag_rule', 'fraud_flag_near_duplicate', 'fraud_flag_ml']].max(axis=1)
 
         if 'first_name' not in df.columns:
             df['first_name'] = 'unknown_client'
 
         suspicious = df[df['fraud_suspected'] == 1][
-            ['first_name', 'invoice_date', 'amount', 'fraud_flag_rule', 'fraud_flag_ml']
+            ['first_name', 'invoice_date', 'amount', 'fraud_flag_rule', 'fraud_flag_near_duplicate', 'fraud_flag_ml']
         ]
-        # --- DEBUG PRINT ---
-        print("Suspicious Invoices found:\n", suspicious)
-        # --- END DEBUG PRINT ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Suspicious Invoices found:\n%s", suspicious)
 
+        suspicious.attrs['segment_models'] = segment_report
         return suspicious
 
 
@@ -181,14 +275,13 @@ def process_invoices(file_path_or_bytes_obj: any):
             }
 
         extracted = df.apply(extract_entities, axis=1)
-        # --- DEBUG PRINT ---
-        print("\n--- After Entity Extraction ---")
-        print("Extracted Entities head:\n", extracted.head())
-        # --- END DEBUG PRINT ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("--- After Entity Extraction ---")
+            logger.debug("Extracted Entities head:\n%s", extracted.head())
         return pd.DataFrame(extracted.tolist())
 
 
-    def budget_vs_actual_analysis(df):
+    def budget_vs_actual_analysis(df, dup_index):
         df = df.copy()
         df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
         df["invoice_date"] = pd.to_datetime(df["invoice_date"], errors="coerce")
@@ -198,39 +291,31 @@ def process_invoices(file_path_or_bytes_obj: any):
 
         df.dropna(subset=["amount", "invoice_date", "job"], inplace=True)
         
-        # --- DEBUG PRINT ---
-        print("\n--- Before Budget vs Actual Analysis ---")
-        print("DF head (for budget):\n", df[['amount', 'invoice_date', 'job']].head())
-        print("DF shape (for budget):", df.shape)
-        # --- END DEBUG PRINT ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("--- Before Budget vs Actual Analysis ---")
+            logger.debug("DF head (for budget):\n%s", df[['amount', 'invoice_date', 'job']].head())
+            logger.debug("DF shape (for budget): %s", df.shape)
 
         if df.empty:
-            print("Warning: DataFrame is empty for Budget vs Actual analysis after dropping NaNs.")
+            logger.warning("DataFrame is empty for Budget vs Actual analysis after dropping NaNs.")
             return pd.DataFrame(), pd.DataFrame()
 
-        budget_reference = df.groupby("job")["amount"].sum().reset_index()
+        budget_reference = df.groupby("job", observed=True)["amount"].sum().reset_index()
         budget_reference.rename(columns={"amount": "actual"}, inplace=True)
-
-        np.random.seed(42)
-        if not budget_reference.empty:
-            budget_reference["budget"] = budget_reference["actual"] * np.random.uniform(0.8, 1.2, size=len(budget_reference))
-        else:
-            budget_reference["budget"] = 0
-
-        actual_vs_budget = budget_reference.copy()
-        actual_vs_budget["variance"] = actual_vs_budget["actual"] - actual_vs_budget["budget"]
-        actual_vs_budget["status"] = actual_vs_budget["variance"].apply(lambda x: "🔴 Over" if x > 0 else "🟢 Under")
+        actual_vs_budget = actual_vs_budget_from_actuals(budget_reference)
 
         audit_flags = pd.DataFrame()
         
-        cols_for_duplicates = ['invoice_date', 'email', 'amount']
-        existing_cols = [col for col in cols_for_duplicates if col in df.columns]
-        if len(existing_cols) == len(cols_for_duplicates):
-            duplicates_for_audit = df[df.duplicated(subset=existing_cols, keep=False)]
+        duplicate_mask = dup_index.duplicated(DUPLICATE_RULES['audit'], index=df.index)
+        if duplicate_mask is not None:
+            duplicates_for_audit = df[duplicate_mask]
             audit_flags = pd.concat([audit_flags, duplicates_for_audit]).drop_duplicates()
 
         if not df.empty and 'amount' in df.columns and pd.api.types.is_numeric_dtype(df['amount']):
-            threshold = df["amount"].quantile(0.95)
+            threshold = streaming_threshold(
+                df["amount"], 0.95,
+                sketch_name=f'{threshold_sketch}-invoice-amount' if threshold_sketch else None
+            )
             high_value = df[df["amount"] > threshold]
             audit_flags = pd.concat([audit_flags, high_value]).drop_duplicates()
         
@@ -240,20 +325,31 @@ def process_invoices(file_path_or_bytes_obj: any):
         elif display_cols:
              audit_flags = audit_flags[display_cols]
 
-        # --- DEBUG PRINT ---
-        print("Budget vs Actual results:\n", actual_vs_budget)
-        print("Audit Flags found:\n", audit_flags)
-        # --- END DEBUG PRINT ---
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Budget vs Actual results:\n%s", actual_vs_budget)
+            logger.debug("Audit Flags found:\n%s", audit_flags)
 
         return actual_vs_budget, audit_flags
 
     # --- Main execution logic for process_invoices ---
     df = load_and_clean_data(file_path_or_bytes_obj)
-    
-    top_segments, city_revenue_fig, revenue_trend_fig = customer_segmentation_analysis(df.copy())
-    suspicious_invoices = detect_fraud(df.copy())
+    dup_index = DuplicateIndex(df)  # Hashed duplicate keys, shared by the fraud and audit rules
+
+    if store is not None:
+        # Append mode: only this batch is cleaned and scanned; history lives in the store's aggregates.
+        df.attrs['store_report'] = store.append(df)
+        top_segments, city_revenue_fig, revenue_trend_fig = segmentation_outputs(store.segmentation(), store.monthly_revenue(),
+                                                                              figures=generate_plots)
+    else:
+        top_segments, city_revenue_fig, revenue_trend_fig, df.attrs['segment_cube_id'] = customer_segmentation_analysis(df.copy())
+    suspicious_invoices = detect_fraud(df.copy(), dup_index)
+    segment_report = suspicious_invoices.attrs.pop('segment_models', None)
+    if segment_report is not None:
+        df.attrs['segment_models'] = segment_report
     extracted_entities = extract_named_entities(df.copy())
-    actual_vs_budget, audit_flags = budget_vs_actual_analysis(df.copy())
+    actual_vs_budget, audit_flags = budget_vs_actual_analysis(df.copy(), dup_index)
+    if store is not None:
+        actual_vs_budget = store.actual_vs_budget()
 
     return df, top_segments, city_revenue_fig, revenue_trend_fig, \
            suspicious_invoices, extracted_entities, actual_vs_budget, audit_flags
\ No newline at end of file
@@ -0,0 +1,242 @@
+# financial-analysis-suite-web/backend/api/invoice_store.py
+
+import glob
+import json
+import os
+import shutil
+import uuid
+
+import pandas as pd
+
+from .app_paths import app_data_dir
+from .file_lock import file_lock
+from .invoice_processing import INVOICE_COLUMNS, actual_vs_budget_from_actuals, segmentation_outputs
+
+# Persistent history: INVOICE_STORE_DIR, else the app data directory (never the temp dir)
+DEFAULT_STORE_DIR = app_data_dir('invoice_store', 'INVOICE_STORE_DIR')
+
+# Running aggregates kept next to the partitions. All measures are additive (sums and
+# counts), so a new batch is folded in without rereading history.
+AGGREGATE_KEYS = {
+    'segments': ['city', 'job'],
+    'monthly': ['invoice_month'],
+    'job_actuals': ['job'],
+}
+
+
+class InvoiceStore:
+    """
+    Local, month-partitioned Parquet store of cleaned invoices with incrementally maintained aggregates.
+
+    Layout under `root`:
+        partitions/invoice_month=YYYY-MM/part-<batch>.parquet      cleaned invoice rows
+        aggregates/<batch>/{segments,monthly,job_actuals}.parquet  running aggregates as of <batch>
+        staging/<batch>/<month>.parquet                            rows of a batch being committed
+        state.json                                                 current aggregates and pending batch
+
+    Appending a batch only reads the row hashes of the months the batch touches (to skip
+    invoices that were already stored) and writes one new file per touched month; the
+    aggregates are updated by adding the batch's own sums and counts.
+
+    A batch commits in one step: its rows are staged and the updated aggregates written
+    to a new directory, then state.json is replaced to point at those aggregates and name
+    the batch as pending; only then are the staged files moved into the partitions. A
+    crash before the switch leaves the store as it was; a crash after it is finished by
+    `_recover` (on open and before every append), so partitions and aggregates always
+    count the same rows.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+        self.partition_dir = os.path.join(root, 'partitions')
+        self.aggregate_dir = os.path.join(root, 'aggregates')
+        self.staging_dir = os.path.join(root, 'staging')
+        self.state_path = os.path.join(root, 'state.json')
+        for path in (self.partition_dir, self.aggregate_dir, self.staging_dir):
+            os.makedirs(path, exist_ok=True)
+        with self._locked():
+            self._recover()
+
+    def _locked(self):
+        """Serializes writers across threads and worker processes sharing the same directory."""
+        return file_lock(os.path.join(self.root, '.lock'))
+
+    def _month_dir(self, month: str) -> str:
+        return os.path.join(self.partition_dir, f'invoice_month={month}')
+
+    def _state(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'aggregates': '', 'pending': None}  # '' = aggregates/*.parquet of stores predating state.json
+
+    def _write_state(self, state: dict):
+        tmp_path = f'{self.state_path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def _aggregate_path(self, name: str, version: str = None) -> str:
+        version = self._state()['aggregates'] if version is None else version
+        return os.path.join(self.aggregate_dir, version, f'{name}.parquet')
+
+    @staticmethod
+    def _write_atomic(df: pd.DataFrame, path: str):
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _stored_hashes(self, month: str) -> pd.Index:
+        files = glob.glob(os.path.join(self._month_dir(month), '*.parquet'))
+        if not files:
+            return pd.Index([], dtype='uint64')
+        return pd.Index(pd.concat([pd.read_parquet(f, columns=['_row_hash']) for f in files])['_row_hash'])
+
+    def read_aggregate(self, name: str, version: str = None) -> pd.DataFrame:
+        path = self._aggregate_path(name, version)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        return pd.read_parquet(path)
+
+    def _publish(self, batch_id: str):
+        """Moves a committed batch's staged rows into the partitions (idempotent: moved files are gone)."""
+        staged = os.path.join(self.staging_dir, batch_id)
+        for path in sorted(glob.glob(os.path.join(staged, '*.parquet'))):
+            month = os.path.basename(path)[:-len('.parquet')]
+            os.makedirs(self._month_dir(month), exist_ok=True)
+            os.replace(path, os.path.join(self._month_dir(month), f'part-{batch_id}.parquet'))
+        shutil.rmtree(staged, ignore_errors=True)
+
+    def _recover(self):
+        """Finishes a committed batch and drops leftovers of uncommitted ones. Call with the lock held."""
+        state = self._state()
+        if state['pending']:
+            self._publish(state['pending'])
+            state = {**state, 'pending': None}
+            self._write_state(state)
+        for leftover in os.listdir(self.staging_dir):
+            shutil.rmtree(os.path.join(self.staging_dir, leftover), ignore_errors=True)
+        # Keep the current and the previous aggregates (readers don't take the lock)
+        keep = {state['aggregates'], state.get('previous_aggregates', '')}
+        for version in os.listdir(self.aggregate_dir):
+            path = os.path.join(self.aggregate_dir, version)
+            if os.path.isdir(path) and version not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def append(self, df: pd.DataFrame) -> dict:
+        """
+        Adds a batch of cleaned invoices (output of the invoice loader) to the store.
+
+        Args:
+            df (pd.DataFrame): Cleaned invoices with invoice_month, amount and total_value.
+
+        Returns:
+            dict: batch_id, rows_received, rows_added, rows_skipped (already stored or repeated) and partitions_touched.
+        """
+        batch = df.copy()
+        if 'city' not in batch.columns: batch['city'] = 'unknown_city'
+        if 'job' not in batch.columns: batch['job'] = 'unknown'
+        for col in ['city', 'job', 'invoice_month']:
+            batch[col] = batch[col].astype(str)
+
+        hash_cols = sorted(col for col in INVOICE_COLUMNS if col in batch.columns)
+        batch['_row_hash'] = pd.util.hash_pandas_object(batch[hash_cols].astype(str), index=False).to_numpy()
+        batch = batch.drop_duplicates(subset='_row_hash')
+
+        batch_id = uuid.uuid4().hex[:12]
+        new_parts = []
+        with self._locked():
+            self._recover()
+            staged = os.path.join(self.staging_dir, batch_id)
+            for month, month_rows in batch.groupby('invoice_month', sort=True):
+                month_rows = month_rows[~month_rows['_row_hash'].isin(self._stored_hashes(month))]
+                if month_rows.empty:
+                    continue
+                os.makedirs(staged, exist_ok=True)
+                self._write_atomic(month_rows, os.path.join(staged, f'{month}.parquet'))
+                new_parts.append(month_rows)
+
+            added = pd.concat(new_parts) if new_parts else batch.iloc[0:0]
+            if not added.empty:
+                state = self._state()
+                self._write_aggregates(added, state['aggregates'], batch_id)
+                self._write_state({'aggregates': batch_id, 'previous_aggregates': state['aggregates'],
+                                   'pending': batch_id})  # Commit point
+                self._recover()
+
+        return {
+            'batch_id': batch_id,
+            'rows_received': len(df),
+            'rows_added': len(added),
+            'rows_skipped': len(df) - len(added),
+            'partitions_touched': sorted(added['invoice_month'].unique().tolist()),
+        }
+
+    def _write_aggregates(self, added: pd.DataFrame, base: str, version: str):
+        """Writes aggregates `base` plus the batch's sums and counts as aggregates `version`."""
+        deltas = {
+            'segments': added.groupby(AGGREGATE_KEYS['segments']).agg(
+                total_revenue=('total_value', 'sum'),
+                amount_sum=('amount', 'sum'),
+                total_invoices=('amount', 'count')
+            ).reset_index(),
+            'monthly': added.groupby(AGGREGATE_KEYS['monthly']).agg(
+                total_value=('total_value', 'sum'),
+                total_invoices=('amount', 'count')
+            ).reset_index(),
+            'job_actuals': added.groupby(AGGREGATE_KEYS['job_actuals']).agg(
+                actual=('amount', 'sum')
+            ).reset_index(),
+        }
+        os.makedirs(os.path.join(self.aggregate_dir, version), exist_ok=True)
+        for name, delta in deltas.items():
+            merged = pd.concat([self.read_aggregate(name, base), delta], ignore_index=True)
+            merged = merged.groupby(AGGREGATE_KEYS[name], as_index=False).sum()
+            self._write_atomic(merged, self._aggregate_path(name, version))
+
+    def segmentation(self) -> pd.DataFrame:
+        segments = self.read_aggregate('segments')
+        if segments.empty:
+            return pd.DataFrame(columns=['city', 'job', 'total_revenue', 'avg_invoice_amount', 'total_invoices'])
+        segments['avg_invoice_amount'] = segments['amount_sum'] / segments['total_invoices']
+        return segments[['city', 'job', 'total_revenue', 'avg_invoice_amount', 'total_invoices']]
+
+    def monthly_revenue(self) -> pd.DataFrame:
+        monthly = self.read_aggregate('monthly')
+        if monthly.empty:
+            return pd.DataFrame(columns=['invoice_month', 'total_value'])
+        return monthly[['invoice_month', 'total_value']]
+
+    def actual_vs_budget(self) -> pd.DataFrame:
+        actuals = self.read_aggregate('job_actuals')
+        if actuals.empty:
+            return pd.DataFrame()
+        return actual_vs_budget_from_actuals(actuals[['job', 'actual']])
+
+    def totals(self) -> dict:
+        monthly = self.read_aggregate('monthly')
+        return {
+            'total_invoices': int(monthly['total_invoices'].sum()) if not monthly.empty else 0,
+            'total_revenue': float(monthly['total_value'].sum()) if not monthly.empty else 0.0,
+            'months': int(len(monthly)),
+        }
+
+    def summary(self, top_n: int = 10) -> dict:
+        """
+        Dashboard payload served straight from the aggregates (no partition reads).
+
+        Returns:
+            dict: totals, top_segments, city_revenue_fig, revenue_trend_fig and actual_vs_budget.
+        """
+        top_segments, city_revenue_fig, revenue_trend_fig = segmentation_outputs(
+            self.segmentation(), self.monthly_revenue(), top_n=top_n)
+        return {
+            'totals': self.totals(),
+            'top_segments': top_segments,
+            'city_revenue_fig': city_revenue_fig,
+            'revenue_trend_fig': revenue_trend_fig,
+            'actual_vs_budget': self.actual_vs_budget(),
+        }
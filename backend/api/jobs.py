@@ -0,0 +1,154 @@
+# financial-analysis-suite-web/backend/api/jobs.py
+
+import glob
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .app_paths import app_cache_dir, private_dir
+
+DEFAULT_JOB_DIR = app_cache_dir('jobs', 'JOB_DIR')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+MAX_KEPT_JOBS = 256
+HEARTBEAT_SECONDS = 10
+STALE_AFTER_SECONDS = 6 * HEARTBEAT_SECONDS  # A queued or running job not heard of for this long is lost
+
+
+class JobStore:
+    """
+    Background jobs whose results are fetched later by id (e.g. the exact result behind a
+    progressive, sample-based response).
+
+    Jobs run on a small thread pool in this worker. Status and result bodies are written to
+    `root` as they change, so any worker process can answer GET /api/jobs/<id>.
+
+    A queued or running job's status names its owner (host and pid) and carries a heartbeat
+    the owner refreshes every HEARTBEAT_SECONDS. When the owner has exited (a recycled or
+    killed worker) or the heartbeat is older than STALE_AFTER_SECONDS, `status` reports the
+    job as failed instead of leaving clients polling forever.
+    """
+
+    def __init__(self, root: str = DEFAULT_JOB_DIR, max_workers: int = JOB_WORKERS, max_kept: int = MAX_KEPT_JOBS):
+        self.root = root
+        self.max_kept = max_kept
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._active = {}  # job_id -> status of this worker's queued and running jobs
+        self._heartbeat = None
+        private_dir(root)
+
+    def _paths(self, job_id: str) -> tuple:
+        safe = ''.join(ch for ch in job_id if ch.isalnum())
+        return os.path.join(self.root, f'{safe}.json'), os.path.join(self.root, f'{safe}.body')
+
+    def _write_status(self, job_id: str, status: dict):
+        path = self._paths(job_id)[0]
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+
+    def _set_status(self, job_id: str, status: dict, active: bool = True):
+        """Records a status of one of this worker's jobs (and whether it still needs heartbeats)."""
+        with self._lock:
+            if active:
+                self._active[job_id] = status
+            else:
+                self._active.pop(job_id, None)
+            self._write_status(job_id, {**status, 'heartbeat_at': time.time()})
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self._lock:
+                for job_id, status in list(self._active.items()):
+                    self._write_status(job_id, {**status, 'heartbeat_at': time.time()})
+
+    def submit(self, kind: str, func, *args, **kwargs) -> str:
+        """
+        Queues func(*args, **kwargs), which must return the result body as bytes (JSON).
+        Returns the job id.
+        """
+        job_id = uuid.uuid4().hex
+        status = {'job_id': job_id, 'kind': kind, 'status': 'queued', 'submitted_at': time.time(),
+                  'owner_host': socket.gethostname(), 'owner_pid': os.getpid()}
+        self._set_status(job_id, status)
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+        self._trim()
+        self._executor.submit(self._run, job_id, status, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, status: dict, func, args, kwargs):
+        started = time.time()
+        self._set_status(job_id, {**status, 'status': 'running', 'started_at': started})
+        try:
+            body = func(*args, **kwargs)
+            body_path = self._paths(job_id)[1]
+            tmp_path = f'{body_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, body_path)
+            self._set_status(job_id, {**status, 'status': 'done', 'started_at': started,
+                                      'finished_at': time.time(), 'seconds': round(time.time() - started, 3)},
+                             active=False)
+        except Exception as e:
+            traceback.print_exc()
+            self._set_status(job_id, {**status, 'status': 'failed', 'error': str(e), 'started_at': started,
+                                      'finished_at': time.time()}, active=False)
+
+    @staticmethod
+    def _owner_gone(status: dict) -> bool:
+        if time.time() - status.get('heartbeat_at', status['submitted_at']) > STALE_AFTER_SECONDS:
+            return True
+        if status.get('owner_host') != socket.gethostname() or 'owner_pid' not in status:
+            return False  # Another machine sharing JOB_DIR: only the heartbeat tells
+        try:
+            os.kill(status['owner_pid'], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # Exists, owned by someone else
+        return False
+
+    def status(self, job_id: str) -> dict:
+        """
+        The job's status dict ('queued', 'running', 'done' or 'failed'), or None if unknown.
+        A queued or running job whose owner is gone is marked failed (and recorded as such).
+        """
+        try:
+            with open(self._paths(job_id)[0]) as f:
+                status = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if status['status'] in ('queued', 'running') and self._owner_gone(status):
+            status = {**status, 'status': 'failed', 'finished_at': time.time(),
+                      'error': "The worker running this job exited before it finished. Resubmit the request."}
+            self._write_status(job_id, status)
+        return status
+
+    def result(self, job_id: str) -> bytes:
+        """The result body of a finished job, or None."""
+        try:
+            with open(self._paths(job_id)[1], 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _trim(self):
+        # Forget the oldest jobs beyond max_kept (status and result).
+        with self._lock:
+            statuses = sorted(glob.glob(os.path.join(self.root, '*.json')), key=os.path.getmtime)
+            for old_status in statuses[:-self.max_kept]:
+                for path in (old_status, old_status[:-len('.json')] + '.body'):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
@@ -0,0 +1,242 @@
+# financial-analysis-suite-web/backend/api/online_anomaly.py
+
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .app_paths import app_data_dir, private_dir
+
+DEFAULT_STATE_DIR = app_data_dir('online_anomaly', 'ONLINE_ANOMALY_DIR')
+
+ONLINE_METHODS = ('robust_zscore', 'seasonal')
+MAX_SCORE_HISTORY = 10000  # Scores kept per series so already-seen points keep theirs
+
+_state_lock = threading.Lock()
+
+# Consistency constant: 1.4826 * MAD estimates the standard deviation of normal data.
+_MAD_TO_STD = 1.4826
+
+
+class OnlineAnomalyDetector:
+    """
+    Streaming anomaly scorer for one time series, with O(1) state updates per observation.
+
+    Each new value is scored against the state *before* it is absorbed, so a point is never
+    judged against itself:
+
+    - 'robust_zscore': the residual from a running median, divided by a running MAD. The
+      median follows a stochastic-approximation update (a step of alpha * MAD towards the
+      new value), the MAD an exponentially weighted mean of absolute residuals.
+    - 'seasonal': the residual from an additive level + trend + seasonal (Holt-Winters)
+      one-step prediction, scaled by the same running MAD. Suits monthly sales with a
+      yearly cycle, where a plain z-score flags every December.
+
+    Residuals are clipped at `threshold` scales before updating the state, so anomalies
+    don't drag the baseline towards themselves. The first `warmup` points (two seasons for
+    'seasonal') initialize the state and are not scored.
+    """
+
+    def __init__(self, method: str = 'robust_zscore', threshold: float = 3.5, alpha: float = 0.1,
+                 season_length: int = 12, warmup: int = None):
+        if method not in ONLINE_METHODS:
+            raise ValueError(f"Unknown online anomaly method '{method}'. Choose one of: {', '.join(ONLINE_METHODS)}.")
+        self.method = method
+        self.threshold = float(threshold)
+        self.alpha = float(alpha)
+        self.season_length = int(season_length)
+        self.warmup = int(warmup or (2 * self.season_length if method == 'seasonal' else 8))
+        self.n = 0
+        self.buffer = []         # Warm-up values only
+        self.level = 0.0
+        self.trend = 0.0
+        self.seasonal = []       # One entry per position in the season
+        self.scale = 0.0         # Running MAD of the residuals
+        self.last_key = None     # Index key of the last absorbed observation
+
+    @property
+    def ready(self) -> bool:
+        return self.n >= self.warmup
+
+    def _initialize(self):
+        values = np.asarray(self.buffer, dtype=np.float64)
+        if self.method == 'seasonal':
+            m = self.season_length
+            first, second = values[:m], values[m:2 * m]
+            self.trend = float((second.mean() - first.mean()) / m)
+            # Linear trend through the two season means; the seasonal profile is the average detrended season.
+            ramp = self.trend * (np.arange(m) - (m - 1) / 2.0)
+            fitted = np.concatenate([first.mean() + ramp, second.mean() + ramp])
+            detrended = (values - fitted).reshape(2, m)
+            self.seasonal = detrended.mean(axis=0).tolist()
+            residuals = (detrended - detrended.mean(axis=0)).ravel()
+            self.level = float(second.mean() + self.trend * (m - 1) / 2.0)  # As of the last warm-up point
+            # In-sample residuals of a two-season fit understate the one-step prediction error
+            # (each residual is half a difference of two noisy values); double them.
+            self.scale = 2.0 * float(np.median(np.abs(residuals - np.median(residuals))))
+        else:
+            self.level = float(np.median(values))
+            self.scale = float(np.median(np.abs(values - self.level)))
+        if self.scale <= 0:
+            self.scale = float(np.std(values)) or 1e-9
+        self.buffer = []
+
+    def _prediction(self) -> float:
+        if self.method == 'seasonal':
+            return self.level + self.trend + self.seasonal[self.n % self.season_length]
+        return self.level
+
+    def update(self, value: float) -> float:
+        """Scores `value` against the current state, then absorbs it. Returns NaN during warm-up."""
+        value = float(value)
+        if not self.ready:
+            self.buffer.append(value)
+            self.n += 1
+            if self.ready:
+                self._initialize()
+            return float('nan')
+
+        residual = value - self._prediction()
+        score = residual / (_MAD_TO_STD * self.scale)
+
+        # Robust update: clip the residual so outliers only move the state a bounded amount.
+        bound = self.threshold * _MAD_TO_STD * self.scale
+        clipped = float(np.clip(residual, -bound, bound))
+        a = self.alpha
+        if self.method == 'seasonal':
+            k = self.n % self.season_length
+            x = self.level + self.trend + self.seasonal[k] + clipped
+            previous_level = self.level
+            self.level = a * (x - self.seasonal[k]) + (1 - a) * (self.level + self.trend)
+            self.trend = a * (self.level - previous_level) + (1 - a) * self.trend
+            self.seasonal[k] = a * (x - self.level) + (1 - a) * self.seasonal[k]
+        else:
+            self.level += a * self.scale * np.sign(clipped)
+        self.scale = max((1 - a) * self.scale + a * abs(clipped), 1e-9)
+        self.n += 1
+        return score
+
+    def to_dict(self) -> dict:
+        return {
+            'method': self.method, 'threshold': self.threshold, 'alpha': self.alpha,
+            'season_length': self.season_length, 'warmup': self.warmup, 'n': self.n,
+            'buffer': self.buffer, 'level': self.level, 'trend': self.trend,
+            'seasonal': list(self.seasonal), 'scale': self.scale, 'last_key': self.last_key,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'OnlineAnomalyDetector':
+        detector = cls(method=data['method'], threshold=data['threshold'], alpha=data['alpha'],
+                       season_length=data['season_length'], warmup=data['warmup'])
+        for key in ('n', 'buffer', 'level', 'trend', 'seasonal', 'scale', 'last_key'):
+            setattr(detector, key, data[key])
+        return detector
+
+
+class DetectorStateStore:
+    """Persists detector state (plus recent scores) per series_id as JSON, with atomic writes."""
+
+    def __init__(self, root: str = DEFAULT_STATE_DIR):
+        self.root = root
+        private_dir(root)
+
+    def _path(self, series_id: str) -> str:
+        safe = ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in series_id)
+        return os.path.join(self.root, f'{safe}.json')
+
+    def load(self, series_id: str) -> dict:
+        path = self._path(series_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, series_id: str, state: dict):
+        path = self._path(series_id)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+
+def _index_keys(index: pd.Index) -> np.ndarray:
+    """Orderable integer keys for a DatetimeIndex (nanoseconds) or a numeric time-step index."""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8
+    return np.asarray(index, dtype=np.int64)
+
+
+def infer_season_length(index: pd.Index, default: int = 12) -> int:
+    """Observations per yearly/weekly cycle from the index frequency (12 monthly, 52 weekly, 7 daily)."""
+    if isinstance(index, pd.DatetimeIndex) and len(index) >= 3:
+        freq = pd.infer_freq(index) or ''
+        for prefix, length in (('M', 12), ('W', 52), ('Q', 4), ('D', 7), ('B', 5)):
+            if freq.startswith(prefix):
+                return length
+    return default
+
+
+def score_online(series: pd.Series, method: str = 'robust_zscore', series_id: str = None,
+                 threshold: float = 3.5, alpha: float = 0.1, season_length: int = None,
+                 store: DetectorStateStore = None) -> pd.DataFrame:
+    """
+    Scores a time series with an OnlineAnomalyDetector.
+
+    Without `series_id` the detector starts fresh and streams through the whole series. With
+    it, the persisted state for that series is resumed: only points after the last absorbed
+    index are scored (and absorbed), points seen before keep their stored scores, and the
+    updated state is written back. Appending a month therefore costs one update, not a refit.
+
+    Args:
+        series (pd.Series): Values in time order (DatetimeIndex or integer time steps).
+        method (str): 'robust_zscore' or 'seasonal'.
+        series_id (str, optional): Key of the persisted detector state.
+        threshold (float): |score| above which a point is flagged.
+        alpha (float): Smoothing rate of the state updates.
+        season_length (int, optional): Seasonal period; inferred from the index if omitted.
+        store (DetectorStateStore, optional): Where state lives (default directory otherwise).
+
+    Returns:
+        pd.DataFrame: Same index as `series`, columns online_score (NaN during warm-up) and online_anomaly.
+    """
+    keys = _index_keys(series.index)
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    season_length = season_length or infer_season_length(series.index)
+
+    store = (store or DetectorStateStore()) if series_id else None
+    with _state_lock:
+        saved = store.load(series_id) if store is not None else None
+        if saved is not None and saved['detector']['method'] == method:
+            detector = OnlineAnomalyDetector.from_dict(saved['detector'])
+            history = dict(zip(saved['history_keys'], saved['history_scores']))
+        else:
+            detector = OnlineAnomalyDetector(method=method, threshold=threshold, alpha=alpha,
+                                             season_length=season_length)
+            history = {}
+
+        scores = np.full(len(values), np.nan)
+        for i, (key, value) in enumerate(zip(keys.tolist(), values)):
+            if detector.last_key is not None and key <= detector.last_key:
+                stored = history.get(key)
+                scores[i] = np.nan if stored is None else stored
+                continue
+            if np.isnan(value):
+                continue
+            scores[i] = detector.update(value)
+            detector.last_key = key
+            history[key] = None if np.isnan(scores[i]) else float(scores[i])
+
+        if store is not None:
+            recent = sorted(history)[-MAX_SCORE_HISTORY:]
+            store.save(series_id, {
+                'detector': detector.to_dict(),
+                'history_keys': recent,
+                'history_scores': [history[key] for key in recent],
+            })
+
+    result = pd.DataFrame({'online_score': scores}, index=series.index)
+    result['online_anomaly'] = np.abs(np.nan_to_num(scores)) > detector.threshold
+    return result
@@ -0,0 +1,180 @@
+# financial-analysis-suite-web/backend/api/partitioned_scoring.py
+
+import atexit
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from .anomaly_detectors import get_detector
+
+PARTITION_MIN_ROWS = int(os.environ.get('PARTITIONED_SCORING_MIN_ROWS', 1_000_000))
+SCORING_WORKERS = int(os.environ.get('PARTITIONED_SCORING_WORKERS', os.cpu_count() or 1))
+BLOCK_ROWS = 250_000        # Rows scaled and scored per task
+FIT_SAMPLE_ROWS = 1_000_000  # Rows the detector is fitted on
+
+
+def _attach(name: str) -> SharedMemory:
+    """Opens a segment created (and unlinked) by the parent process."""
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # Older versions register it again, with the resource tracker spawned workers share
+        # with the parent: a no-op, and the parent's unlink unregisters it
+        return SharedMemory(name=name)
+
+
+def _limit_threads():
+    # Each worker scores one block at a time; parallelism comes from the processes
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = '1'
+
+
+def _score_block(model, X: np.ndarray, scores: np.ndarray, mean: np.ndarray, scale: np.ndarray, start: int, stop: int):
+    block = (X[start:stop] - mean) / scale  # Only this block is ever materialized scaled
+    scores[start:stop] = model.score_samples(block)
+
+
+def _score_task(x_name: str, scores_name: str, shape: tuple, model_bytes: bytes,
+                mean: np.ndarray, scale: np.ndarray, start: int, stop: int):
+    """Pool task: scores rows [start, stop) of the shared matrix into the shared score vector."""
+    x_shm, scores_shm = _attach(x_name), _attach(scores_name)
+    try:
+        X = np.ndarray(shape, dtype=np.float64, buffer=x_shm.buf)
+        scores = np.ndarray(shape[0], dtype=np.float64, buffer=scores_shm.buf)
+        _score_block(pickle.loads(model_bytes), X, scores, mean, scale, start, stop)
+        del X, scores  # Release the buffer views before closing
+    finally:
+        x_shm.close()
+        scores_shm.close()
+
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def get_scoring_pool(workers: int = SCORING_WORKERS) -> ProcessPoolExecutor:
+    """
+    The shared scoring pool of `workers` processes, created on first use (and recreated if
+    asked for another size). Workers are spawned, so the pool is safe next to TensorFlow and threads.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown(wait=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=_limit_threads)
+            _pool_workers = workers
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Drops a broken pool, so the next get_scoring_pool call starts a new one."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_workers = None, None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def scoring_pool_map(func, *iterables, workers: int = SCORING_WORKERS, fallback=None) -> list:
+    """
+    list(pool.map(func, *iterables)) on the shared scoring pool. A pool one of whose
+    workers died (e.g. OOM-killed) is broken for good: it is discarded and the whole map
+    retried once on a new pool (tasks must be idempotent). If that breaks too, the tasks
+    run in this process, through `fallback` (same arguments) if given, else `func`.
+    """
+    iterables = [list(iterable) for iterable in iterables]
+    for _ in range(2):
+        pool = get_scoring_pool(workers)
+        try:
+            return list(pool.map(func, *iterables))
+        except BrokenProcessPool:
+            _discard_pool(pool)
+    return [(fallback or func)(*args) for args in zip(*iterables)]
+
+
+def _column_stats(X: np.ndarray, block_rows: int = BLOCK_ROWS) -> tuple:
+    """Per-column mean and StandardScaler's scale (population std, 0 -> 1), in blocks: no full-size temporaries."""
+    n = len(X)
+    mean = np.zeros(X.shape[1])
+    for start in range(0, n, block_rows):
+        mean += X[start:start + block_rows].sum(axis=0)
+    mean /= max(n, 1)
+    sq = np.zeros(X.shape[1])
+    for start in range(0, n, block_rows):
+        sq += ((X[start:start + block_rows] - mean) ** 2).sum(axis=0)
+    scale = np.sqrt(sq / max(n, 1))
+    return mean, np.where(scale > 0, scale, 1.0)
+
+
+def partitioned_fit_score(frame: pd.DataFrame, features: list, detector_name: str = 'isolation_forest',
+                          workers: int = None, block_rows: int = BLOCK_ROWS,
+                          fit_sample_rows: int = FIT_SAMPLE_ROWS, seed: int = 42) -> np.ndarray:
+    """
+    Standardizes `features` of `frame` and returns the detector's anomaly scores, like
+    StandardScaler().fit_transform followed by fit_score, for batches too large for one core.
+
+    The raw feature matrix is copied once into shared memory. The scaler statistics are
+    accumulated over it in blocks, the detector is fitted on a random sample of
+    `fit_sample_rows` scaled rows, and row blocks are then scaled and scored by the
+    scoring pool, each worker writing its block's scores into a shared output vector in
+    place, so results come back in row order and nothing large is pickled. With one worker
+    the blocks are scored in this process, as they are if the pool keeps breaking.
+
+    Fitting on a sample is what IsolationForest does anyway (256 rows per tree); the
+    histogram and robust z-score detectors estimate their bins and medians from it.
+
+    Returns:
+        np.ndarray: Anomaly scores (higher = more anomalous), one per row of `frame`.
+    """
+    workers = workers or SCORING_WORKERS
+    n, k = len(frame), len(features)
+    shape = (n, k)
+    owned, X, scores = [], None, None
+    try:
+        if workers > 1:
+            x_shm = SharedMemory(create=True, size=max(n * k * 8, 1))
+            scores_shm = SharedMemory(create=True, size=max(n * 8, 1))
+            owned = [x_shm, scores_shm]
+            X = np.ndarray(shape, dtype=np.float64, buffer=x_shm.buf)
+            scores = np.ndarray(n, dtype=np.float64, buffer=scores_shm.buf)
+        else:
+            X, scores = np.empty(shape), np.empty(n)
+        for j, col in enumerate(features):
+            X[:, j] = frame[col].to_numpy(dtype=np.float64, na_value=0.0)
+
+        mean, scale = _column_stats(X, block_rows)
+        rng = np.random.default_rng(seed)
+        fit_rows = np.sort(rng.choice(n, fit_sample_rows, replace=False)) if n > fit_sample_rows else slice(None)
+        model = get_detector(detector_name).fit((X[fit_rows] - mean) / scale)
+
+        bounds = [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+        if workers > 1:
+            if hasattr(model, 'model'):
+                model.model.set_params(n_jobs=1)  # One core per worker
+            model_bytes = pickle.dumps(model)
+            starts, stops = [start for start, _ in bounds], [stop for _, stop in bounds]
+            scoring_pool_map(
+                _score_task, [x_shm.name] * len(bounds), [scores_shm.name] * len(bounds), [shape] * len(bounds),
+                [model_bytes] * len(bounds), [mean] * len(bounds), [scale] * len(bounds), starts, stops,
+                workers=workers,
+                fallback=lambda *task: _score_block(model, X, scores, mean, scale, task[-2], task[-1]))
+        else:
+            for start, stop in bounds:
+                _score_block(model, X, scores, mean, scale, start, stop)
+        return np.array(scores)  # Copy out of shared memory before it is released
+    finally:
+        X = scores = None  # Drop the views, or the segments can't be closed
+        for shm in owned:
+            shm.close()
+            shm.unlink()
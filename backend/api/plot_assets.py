@@ -0,0 +1,233 @@
+# financial-analysis-suite-web/backend/api/plot_assets.py
+
+import glob
+import hashlib
+import io
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import matplotlib
+import pandas as pd
+
+from . import signed_pickle
+from .app_paths import app_cache_dir, private_dir
+
+DEFAULT_PLOT_DIR = app_cache_dir('plot_assets', 'PLOT_ASSET_DIR')
+MAX_PLOT_CACHE_BYTES = int(os.environ.get('PLOT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+MAX_PLOT_SPECS = 4096
+MAX_SPILLED_PLOTS = 4096
+
+PLOT_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# kind -> function(data) returning a matplotlib Figure. Registered at import time by the engines.
+_RENDERERS = {}
+
+
+def plot_renderer(kind: str):
+    """
+    Registers a module-level drawing function for plots of `kind`.
+
+    The function receives the plot's (small, pre-aggregated) data and returns a
+    matplotlib.figure.Figure. Bump the version suffix of `kind` (e.g. 'fraud.by_type.v2')
+    whenever the drawing changes: it is part of every asset id, so cached renders of the
+    old look are never served for the new one.
+    """
+    def decorator(func):
+        _RENDERERS[kind] = func
+        return func
+    return decorator
+
+
+def _digest(h, obj):
+    """Feeds a stable representation of plot data into `h` (frames and series by value, not pickle bytes)."""
+    if isinstance(obj, pd.DataFrame):
+        h.update(repr(('frame', list(obj.columns), [str(d) for d in obj.dtypes], obj.index.name)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(repr(('series', obj.name, str(obj.dtype), obj.index.name)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, dict):
+        h.update(b'{')
+        for key in sorted(obj, key=repr):
+            h.update(repr(key).encode())
+            _digest(h, obj[key])
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for item in obj:
+            _digest(h, item)
+        h.update(b']')
+    else:
+        h.update(repr(obj).encode())
+
+
+class PlotSpec:
+    """
+    A chart that has not been drawn yet: its renderer kind plus the data to draw.
+
+    The asset id is a hash of both, so the same chart produced by another user, another
+    request or a re-run gets the same id and is rendered only once.
+    """
+
+    def __init__(self, kind: str, data):
+        if kind not in _RENDERERS:
+            raise ValueError(f"No plot renderer registered for '{kind}'.")
+        self.kind = kind
+        self.data = data
+        h = hashlib.sha256(kind.encode())
+        _digest(h, data)
+        self.asset_id = h.hexdigest()[:32]
+
+    def render(self, fmt: str = 'png') -> bytes:
+        """Draws the figure and encodes it as `fmt` ('png' or 'svg')."""
+        fig = _RENDERERS[self.kind](self.data)
+        buf = io.BytesIO()
+        # Fixed SVG id salt and no timestamps, so an asset id always maps to the same bytes
+        with matplotlib.rc_context({'svg.hashsalt': self.asset_id}):
+            fig.savefig(buf, format=fmt, bbox_inches='tight', metadata={'Date': None} if fmt == 'svg' else None)
+        return buf.getvalue()
+
+
+class PlotAssetStore:
+    """
+    Bounded, content-addressed cache of charts, served by /api/plots/<asset_id>.<fmt>.
+
+    Analysis endpoints only register PlotSpecs and return their URLs; a chart is rendered
+    the first time one of its formats is fetched. Specs are kept in an LRU by count and
+    rendered images in an LRU by bytes. With a `root` directory both are written through to
+    disk, so a chart registered by one worker process can be fetched from any other. The
+    directory must be private (0700) to this user, and specs are pickles signed with the
+    directory's key: files the store didn't write are never unpickled.
+    """
+
+    def __init__(self, root: str = DEFAULT_PLOT_DIR, max_bytes: int = MAX_PLOT_CACHE_BYTES,
+                 max_specs: int = MAX_PLOT_SPECS, max_spilled: int = MAX_SPILLED_PLOTS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_specs = max_specs
+        self.max_spilled = max_spilled
+        self._specs = OrderedDict()    # asset_id -> PlotSpec
+        self._images = OrderedDict()   # (asset_id, fmt) -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._render_locks = {}        # (asset_id, fmt) -> Lock, so concurrent fetches render once
+        self.counters = {'registered': 0, 'rendered': 0, 'memory_hits': 0, 'disk_hits': 0}
+        self._key = None
+        if root:
+            private_dir(root)
+            self._key = signed_pickle.signing_key(root)
+
+    def _path(self, asset_id: str, ext: str) -> str:
+        safe = ''.join(ch for ch in asset_id if ch.isalnum())
+        return os.path.join(self.root, f'{safe}.{ext}')
+
+    def register(self, spec: PlotSpec) -> str:
+        """Remembers `spec` for later rendering (cheap: nothing is drawn). Returns its asset id."""
+        with self._lock:
+            known = spec.asset_id in self._specs
+            self._specs[spec.asset_id] = spec
+            self._specs.move_to_end(spec.asset_id)
+            while len(self._specs) > self.max_specs:
+                self._specs.popitem(last=False)
+            if not known:
+                self.counters['registered'] += 1
+        if self.root and not known and not os.path.exists(self._path(spec.asset_id, 'pkl')):
+            self._write(self._path(spec.asset_id, 'pkl'), signed_pickle.dumps((spec.kind, spec.data), self._key))
+            self._trim_disk()
+        return spec.asset_id
+
+    def _spec(self, asset_id: str) -> PlotSpec:
+        with self._lock:
+            spec = self._specs.get(asset_id)
+            if spec is not None:
+                self._specs.move_to_end(asset_id)
+                return spec
+        if not self.root:
+            return None
+        try:
+            with open(self._path(asset_id, 'pkl'), 'rb') as f:
+                kind, data = signed_pickle.loads(f.read(), self._key)
+        except (FileNotFoundError, ValueError):
+            return None
+        spec = PlotSpec(kind, data)
+        with self._lock:
+            self._specs[asset_id] = spec
+        return spec
+
+    def has(self, asset_id: str) -> bool:
+        """Whether `asset_id` can still be served (its spec is in memory or on disk)."""
+        with self._lock:
+            if asset_id in self._specs:
+                return True
+        return bool(self.root) and os.path.exists(self._path(asset_id, 'pkl'))
+
+    def get(self, asset_id: str, fmt: str = 'png') -> bytes:
+        """The encoded image, rendering it on first use. None if the asset id is unknown."""
+        key = (asset_id, fmt)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return image
+            render_lock = self._render_locks.setdefault(key, threading.Lock())
+
+        with render_lock:
+            with self._lock:
+                image = self._images.get(key)  # Rendered by a concurrent request meanwhile
+            if image is None and self.root:
+                try:
+                    with open(self._path(asset_id, fmt), 'rb') as f:
+                        image = f.read()
+                    self.counters['disk_hits'] += 1
+                except FileNotFoundError:
+                    pass
+            if image is None:
+                spec = self._spec(asset_id)
+                if spec is None:
+                    with self._lock:
+                        self._render_locks.pop(key, None)
+                    return None
+                image = spec.render(fmt)
+                self.counters['rendered'] += 1
+                if self.root:
+                    self._write(self._path(asset_id, fmt), image)
+            self._cache_image(key, image)
+        with self._lock:
+            self._render_locks.pop(key, None)
+        return image
+
+    def _cache_image(self, key: tuple, image: bytes):
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = image
+            self._bytes += len(image)
+            # Evict least recently used images, but always keep the newest one
+            while len(self._images) > 1 and self._bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _write(self, path: str, content: bytes):
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _trim_disk(self):
+        # Drop the oldest specs (and their renders) beyond max_spilled.
+        spilled = sorted(glob.glob(os.path.join(self.root, '*.pkl')), key=os.path.getmtime)
+        for old_spec in spilled[:-self.max_spilled]:
+            stem = old_spec[:-len('.pkl')]
+            for path in [old_spec] + [f'{stem}.{fmt}' for fmt in PLOT_FORMATS]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'specs_in_memory': len(self._specs), 'images_in_memory': len(self._images),
+                    'image_bytes': self._bytes, 'max_bytes': self.max_bytes, **self.counters}
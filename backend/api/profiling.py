@@ -0,0 +1,320 @@
+# financial-analysis-suite-web/backend/api/profiling.py
+
+import cProfile
+import glob
+import hmac
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+from .app_paths import app_cache_dir, private_dir
+
+DEFAULT_PROFILE_DIR = app_cache_dir('profiles', 'PROFILE_DIR')
+MAX_KEPT_PROFILES = 200
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5)) / 1000
+TOP_N = 30
+TRACEMALLOC_FRAMES = 1  # Allocation sites by line; every extra frame makes traced requests markedly slower
+PROFILE_MODES = ('sample', 'cprofile')
+
+# One profiled request at a time per worker: tracemalloc and the sampler are process-wide
+_capture_lock = threading.Lock()
+
+
+def admin_token_valid(token: str) -> bool:
+    """Profiling is off unless PROFILE_ADMIN_TOKEN is set, and then needs that token."""
+    expected = os.environ.get('PROFILE_ADMIN_TOKEN')
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+class ProfileStore:
+    """Captured profiles on disk: <id>.json (summary, written last) and <id>.collapsed (sampler) or <id>.pstats (cProfile)."""
+
+    def __init__(self, root: str = DEFAULT_PROFILE_DIR, max_kept: int = MAX_KEPT_PROFILES):
+        self.root = root
+        self.max_kept = max_kept
+        private_dir(root)
+
+    def path(self, profile_id: str, ext: str) -> str:
+        safe = ''.join(ch for ch in profile_id if ch.isalnum())
+        return os.path.join(self.root, f'{safe}.{ext}')
+
+    def _write(self, path: str, content: bytes):
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def save(self, profile_id: str, summary: dict, collapsed: str = None, pstats_bytes: bytes = None):
+        if collapsed is not None:
+            self._write(self.path(profile_id, 'collapsed'), collapsed.encode())
+        if pstats_bytes is not None:
+            self._write(self.path(profile_id, 'pstats'), pstats_bytes)
+        self._write(self.path(profile_id, 'json'), json.dumps(summary).encode())
+        self._trim()
+
+    def summary(self, profile_id: str) -> dict:
+        try:
+            with open(self.path(profile_id, 'json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def artifact(self, profile_id: str, ext: str) -> bytes:
+        try:
+            with open(self.path(profile_id, ext), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _trim(self):
+        summaries = sorted(glob.glob(os.path.join(self.root, '*.json')), key=os.path.getmtime)
+        for old in summaries[:-self.max_kept]:
+            stem = old[:-len('.json')]
+            for path in (old, f'{stem}.collapsed', f'{stem}.pstats'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()  # root-first tuple of frame labels -> samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format (flamegraph.pl, speedscope): 'a;b;c <samples>' per line."""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, n: int = TOP_N) -> list:
+        total = sum(self.stacks.values()) or 1
+        own, inclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+        return [{'function': label, 'self_pct': round(100 * own[label] / total, 2),
+                 'total_pct': round(100 * count / total, 2), 'samples': count}
+                for label, count in inclusive.most_common(n)] if self.stacks else []
+
+
+def _cprofile_results(profiler: cProfile.Profile, n: int = TOP_N) -> tuple:
+    """
+    (top-N functions by cumulative time, pstats dump). cProfile only keeps caller -> callee
+    edges, not whole stacks, so there is no collapsed output for these captures: open the
+    dump in snakeviz or gprof2dot for a call graph.
+    """
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+        rows.append({'function': label, 'calls': calls, 'self_seconds': round(own, 6),
+                     'total_seconds': round(cumulative, 6)})
+    rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+    return rows[:n], marshal.dumps(stats.stats)  # What Stats.dump_stats writes, without a temp file
+
+
+class _Capture:
+    """One request's profile: started before the app is called, finished when its response iterable is closed."""
+
+    def __init__(self, mode: str, memory: bool, environ: dict):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.memory = memory
+        self.request = {'method': environ.get('REQUEST_METHOD'), 'path': environ.get('PATH_INFO'),
+                        'query': environ.get('QUERY_STRING', ''), 'content_length': environ.get('CONTENT_LENGTH')}
+        self.status = None
+        self.body_bytes = 0
+        self.profiler = cProfile.Profile() if mode == 'cprofile' else None
+        self.sampler = StackSampler(threading.get_ident()) if mode == 'sample' else None
+        self._tracing = False   # This capture started tracemalloc (and so must stop it)
+        self._sampling = False
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        if self.memory:
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            self.memory_started = tracemalloc.get_traced_memory()[0]
+        if self.sampler:
+            self.sampler.start()
+            self._sampling = True
+
+    def _stop_sampler(self):
+        if self._sampling:
+            self.sampler.stop()
+            self._sampling = False
+
+    def _stop_tracing(self):
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def discard(self):
+        """Stops whatever start() started, saving nothing (the request failed before returning a body)."""
+        try:
+            self._stop_sampler()
+        finally:
+            self._stop_tracing()
+
+    def run(self, func, *args):
+        """Calls func under the deterministic profiler when there is one (it only sees this thread)."""
+        if self.profiler is None:
+            return func(*args)
+        self.profiler.enable()
+        try:
+            return func(*args)
+        finally:
+            self.profiler.disable()
+
+    def finish(self, store: ProfileStore):
+        wall = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+        self._stop_sampler()  # Before the snapshot, which would otherwise show up in the samples
+        memory = None
+        if self.memory:
+            try:
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+            finally:
+                self._stop_tracing()
+            memory = {'peak_traced_bytes': peak - self.memory_started, 'retained_bytes': current - self.memory_started,
+                      'top_allocations': [{'location': str(stat.traceback[0]), 'size_bytes': stat.size, 'count': stat.count}
+                                          for stat in snapshot.statistics('lineno')[:TOP_N]]}
+        if self.sampler:
+            top, collapsed, dump = self.sampler.top(), self.sampler.collapsed(), None
+        else:
+            (top, dump), collapsed = _cprofile_results(self.profiler), None
+        summary = {
+            'profile_id': self.id, 'mode': self.mode, 'request': self.request, 'status': self.status,
+            'wall_seconds': round(wall, 4), 'cpu_seconds': round(cpu, 4), 'response_bytes': self.body_bytes,
+            'memory': memory,
+            'samples': sum(self.sampler.stacks.values()) if self.sampler else None,
+            'top_functions': top, 'created_at': time.time(),
+        }
+        store.save(self.id, summary, collapsed, dump)
+
+
+class _ProfiledBody:
+    """Response iterable that keeps profiling while the body is generated (streamed responses do their work here)."""
+
+    def __init__(self, body, capture: _Capture, store: ProfileStore):
+        self.body = body
+        self.iterator = iter(body)
+        self.capture = capture
+        self.store = store
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.capture.run(next, self.iterator)
+        self.capture.body_bytes += len(chunk)
+        return chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.capture.run(self.body.close)
+        finally:
+            try:
+                self.capture.finish(self.store)
+            finally:
+                _capture_lock.release()
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware: profiles a single request on demand.
+
+    A request with `X-Profile: sample` (stack sampling every PROFILE_SAMPLE_INTERVAL_MS,
+    negligible overhead) or `X-Profile: cprofile` (deterministic), optionally with
+    `,memory` (tracemalloc: allocation peak and top allocation sites, at several times the
+    run time), and `X-Profile-Token: <PROFILE_ADMIN_TOKEN>` is run under that profiler from
+    the view call until its (possibly streamed) body is fully sent. The response carries
+    X-Profile-Id; the summary is served by /api/profiles/<id>, and the sampled stacks by
+    /api/profiles/<id>.collapsed or the cProfile stats by /api/profiles/<id>.pstats. Every
+    other request costs one header lookup.
+
+    Only one request per worker is profiled at a time (tracemalloc is process-wide and
+    also counts concurrent requests' allocations); others asking meanwhile run unprofiled
+    with `X-Profile-Skipped: busy`. Both profilers only see the request's own thread, not
+    the pools it hands work to.
+    """
+
+    def __init__(self, wsgi_app, get_store):
+        self.wsgi_app = wsgi_app
+        self.get_store = get_store
+
+    def __call__(self, environ, start_response):
+        mode = environ.get('HTTP_X_PROFILE')
+        if not mode:
+            return self.wsgi_app(environ, start_response)
+        return self._profiled(mode, environ, start_response)
+
+    def _profiled(self, header, environ, start_response):
+        def skipped(reason):
+            def start_with_header(status, headers, exc_info=None):
+                return start_response(status, headers + [('X-Profile-Skipped', reason)], exc_info)
+            return self.wsgi_app(environ, start_with_header)
+
+        if not admin_token_valid(environ.get('HTTP_X_PROFILE_TOKEN')):
+            return skipped('unauthorized')
+        options = {option.strip() for option in header.lower().split(',')}
+        mode = next((mode for mode in PROFILE_MODES if mode in options), 'sample')
+        if not _capture_lock.acquire(blocking=False):
+            return skipped('busy')
+
+        capture = _Capture(mode, 'memory' in options, environ)
+
+        def start_with_id(status, headers, exc_info=None):
+            capture.status = int(status.split(' ', 1)[0])
+            return start_response(status, headers + [('X-Profile-Id', capture.id)], exc_info)
+
+        try:
+            capture.start()
+            body = capture.run(self.wsgi_app, environ, start_with_id)
+        except BaseException:
+            try:
+                capture.discard()
+            finally:
+                _capture_lock.release()
+            raise
+        return _ProfiledBody(body, capture, self.get_store())
@@ -0,0 +1,139 @@
+# financial-analysis-suite-web/backend/api/progressive.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SAMPLE_ROWS = int(os.environ.get('PROGRESSIVE_SAMPLE_ROWS', 50000))
+MAX_SAMPLE_ROWS = 1_000_000   # Larger samples cost about as much as the exact run they stand in for
+EXACT_RESULT_MAX_WAIT = float(os.environ.get('PROGRESSIVE_EXACT_MAX_WAIT_SECONDS', 900))  # Admission wait of the background exact run
+MIN_ROWS_PER_STRATUM = 30    # Small strata are sampled at least this deep (or completely)
+MAX_REPORTED_GROUPS = 50     # Largest groups reported in per-group estimates
+_Z95 = 1.959964
+
+
+def _strata(df: pd.DataFrame, strata_col: str) -> tuple:
+    if strata_col is not None and strata_col in df.columns:
+        codes, labels = pd.factorize(df[strata_col], use_na_sentinel=False)
+        return strata_col, codes, [None if pd.isna(label) else str(label) for label in labels]
+    return None, np.zeros(len(df), dtype=np.int64), ['all']
+
+
+def stratified_sample(df: pd.DataFrame, strata_col: str = None, n: int = DEFAULT_SAMPLE_ROWS, seed: int = 0) -> tuple:
+    """
+    Draws about `n` rows, proportionally allocated across the values of `strata_col`, with
+    every stratum sampled at least MIN_ROWS_PER_STRATUM deep (or completely). Rows are kept
+    independently with their stratum's probability, in one vectorized pass over the frame.
+
+    Returns:
+        tuple: (sample, design). The sample keeps the frame's index. design holds the strata
+               column and labels, the stratum code of every sampled row ('codes', aligned
+               with the sample), and the population and sampled row counts per stratum.
+    """
+    strata_col, codes, labels = _strata(df, strata_col)
+    population = np.bincount(codes, minlength=len(labels))
+    allocation = np.minimum(population, np.maximum(np.round(n * population / max(len(df), 1)), MIN_ROWS_PER_STRATUM))
+    probability = np.divide(allocation, population, out=np.ones(len(population)), where=population > 0)
+    keep = np.random.default_rng(seed).random(len(df)) < probability[codes]
+    design = {'strata_col': strata_col, 'labels': labels, 'codes': codes[keep], 'population': population,
+              'sampled': np.bincount(codes[keep], minlength=len(labels))}
+    return df[keep], design
+
+
+def full_design(df: pd.DataFrame, strata_col: str = None) -> dict:
+    """The design of a 'sample' that is the whole frame: the estimators then return exact values with zero error."""
+    strata_col, codes, labels = _strata(df, strata_col)
+    population = np.bincount(codes, minlength=len(labels))
+    return {'strata_col': strata_col, 'labels': labels, 'codes': codes, 'population': population, 'sampled': population}
+
+
+def _summary(estimate: float, stderr: float, digits: int = 4) -> dict:
+    return {'estimate': round(float(estimate), digits), 'stderr': round(float(stderr), digits),
+            'ci95': [round(float(estimate - _Z95 * stderr), digits), round(float(estimate + _Z95 * stderr), digits)]}
+
+
+def stratified_total(y: np.ndarray, design: dict) -> tuple:
+    """
+    Stratified (expansion) estimator of the population total of `y`, one value per sampled
+    row, and its standard error with the finite-population correction.
+    """
+    codes, N_h, n_h = design['codes'], design['population'], design['sampled']
+    k = len(N_h)
+    y = np.asarray(y, dtype=np.float64)
+    sums = np.bincount(codes, weights=y, minlength=k)
+    sq_sums = np.bincount(codes, weights=y * y, minlength=k)
+    n = np.maximum(n_h, 1)
+    means = sums / n
+    variances = np.where(n_h > 1, (sq_sums - n * means ** 2) / np.maximum(n_h - 1, 1), 0.0)
+    variances = np.maximum(variances, 0.0)
+    fpc = 1.0 - np.divide(n_h, N_h, out=np.ones(k), where=N_h > 0)
+    total = float(np.sum(N_h * means))
+    stderr = float(np.sqrt(np.sum(N_h ** 2 * fpc * variances / n)))
+    return total, stderr
+
+
+def _aligned(output: pd.DataFrame, column: str, sample_index: pd.Index, fill=0.0) -> np.ndarray:
+    """`column` of the engine's output for every sampled row; rows the engine dropped get `fill`."""
+    return output[column].reindex(sample_index).to_numpy(dtype=np.float64, na_value=fill)
+
+
+def _group_totals(y: np.ndarray, group_codes: np.ndarray, labels: list, design: dict, divide_by: np.ndarray = None) -> dict:
+    """
+    Domain estimates of the total of `y` per group (the MAX_REPORTED_GROUPS largest in the
+    sample); `group_codes` index `labels`, -1 for rows in no group. With `divide_by` (known
+    group sizes) the totals become means, e.g. rates.
+    """
+    sizes = np.bincount(group_codes[group_codes >= 0], minlength=len(labels))
+    out = {}
+    for code in np.argsort(-sizes, kind='stable')[:MAX_REPORTED_GROUPS]:
+        if sizes[code] == 0:
+            break
+        total, stderr = stratified_total(np.where(group_codes == code, y, 0.0), design)
+        if divide_by is not None:
+            size = max(int(divide_by[code]), 1)
+            total, stderr = total / size, stderr / size
+        out[str(labels[code])] = _summary(total, stderr)
+    return out
+
+
+def fraud_estimates(output: pd.DataFrame, sample_index: pd.Index, design: dict, amount_col: str = None) -> dict:
+    """
+    Anomaly rate (overall and per stratum), anomaly count and flagged amount, estimated
+    from the fraud engine's output on a sample (exact, with zero error, on a full design).
+    """
+    N = int(design['population'].sum())
+    flags = _aligned(output, 'is_anomaly', sample_index)
+    total, stderr = stratified_total(flags, design)
+    estimates = {
+        'anomalies': _summary(total, stderr, 1),
+        'anomaly_rate': _summary(total / max(N, 1), stderr / max(N, 1)),
+    }
+    if amount_col and amount_col in output.columns:
+        amounts = _aligned(output, amount_col, sample_index)
+        estimates['flagged_amount'] = _summary(*stratified_total(flags * amounts, design), 2)
+    if design['strata_col'] is not None:
+        # The groups are the strata themselves, whose sizes are known exactly
+        estimates[f"anomaly_rate_by_{design['strata_col']}"] = _group_totals(
+            flags, design['codes'], design['labels'], design, divide_by=design['population'])
+    return estimates
+
+
+def invoice_estimates(output: pd.DataFrame, sample_index: pd.Index, design: dict) -> dict:
+    """Total revenue, invoice count and revenue per city, estimated from the invoice engine's output on a sample."""
+    revenue = _aligned(output, 'total_value', sample_index)
+    kept = np.isin(sample_index, output.index).astype(np.float64)  # Rows surviving the engine's cleaning
+    estimates = {
+        'total_revenue': _summary(*stratified_total(revenue, design), 2),
+        'invoice_count': _summary(*stratified_total(kept, design), 1),
+    }
+    if 'city' in output.columns:
+        city_codes, cities = pd.factorize(output['city'].astype(object).reindex(sample_index))
+        estimates['revenue_by_city'] = _group_totals(revenue, city_codes, list(cities), design)
+    return estimates
+
+
+def sample_report(design: dict) -> dict:
+    rows, population = int(design['sampled'].sum()), int(design['population'].sum())
+    return {'rows': rows, 'population_rows': population, 'fraction': round(rows / max(population, 1), 6),
+            'strata_column': design['strata_col'], 'strata': len(design['labels'])}
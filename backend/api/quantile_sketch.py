@@ -0,0 +1,201 @@
+# financial-analysis-suite-web/backend/api/quantile_sketch.py
+
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .app_paths import app_data_dir, private_dir
+from .file_lock import file_lock
+
+DEFAULT_SKETCH_DIR = app_data_dir('quantile_sketches', 'QUANTILE_SKETCH_DIR')
+MAX_BATCH_DIGESTS = 10_000  # Digests of merged batches remembered per sketch
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch (a merging t-digest).
+
+    Values are summarized as weighted centroids. Small inputs are kept exactly (every value is
+    its own centroid), so thresholds on small uploads equal pandas' linearly interpolated
+    `quantile`. Once the sketch grows past `buffer_size` centroids it is compressed with the
+    arcsine scale function, which keeps centroids small in the tails, where fraud and audit
+    thresholds such as P95 live. Compression is a sort plus a vectorized bucketing pass,
+    so updating with a million-row chunk costs about as much as sorting it.
+
+    Sketches built on different chunks or worker partitions combine with `merge`.
+    """
+
+    def __init__(self, compression: float = 500.0, buffer_size: int = None):
+        self.compression = float(compression)
+        self.buffer_size = int(buffer_size or 5 * compression)
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values) -> 'QuantileSketch':
+        """Adds a chunk of values (NaNs are ignored)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._absorb(values, np.ones(values.size))
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Folds another sketch (e.g. from another partition or an earlier batch) into this one."""
+        if other.weights.size:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._absorb(other.means, other.weights)
+        return self
+
+    def _absorb(self, means: np.ndarray, weights: np.ndarray):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='mergesort')
+        self.means, self.weights = means[order], weights[order]
+        if self.means.size > self.buffer_size:
+            self._compress()
+
+    def _compress(self):
+        total = self.weights.sum()
+        cumulative = np.cumsum(self.weights)
+        # Arcsine scale: k(q) = delta / (2*pi) * asin(2q - 1). Centroids whose midpoint falls in
+        # the same unit of k are merged, which bounds each centroid's size by its tail position.
+        q_mid = (cumulative - self.weights / 2.0) / total
+        k = self.compression / (2.0 * np.pi) * np.arcsin(np.clip(2.0 * q_mid - 1.0, -1.0, 1.0))
+        bucket = np.floor(k - k.min()).astype(np.int64)
+        _, bucket = np.unique(bucket, return_inverse=True)
+        weights = np.bincount(bucket, weights=self.weights)
+        self.means = np.bincount(bucket, weights=self.means * self.weights) / weights
+        self.weights = weights
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated q-quantile (0 <= q <= 1), interpolating linearly between centroid centres by rank.
+        Exact, and identical to pandas' default interpolation, while no compression has happened.
+        """
+        if self.weights.size == 0:
+            return float('nan')
+        if self.weights.size == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        # Rank (0-based, like numpy's linear method) of each centroid's centre.
+        centres = np.cumsum(self.weights) - self.weights + (self.weights - 1.0) / 2.0
+        target = q * (total - 1.0)
+        ranks = np.concatenate([[0.0], centres, [total - 1.0]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(target, ranks, values))
+
+    def to_dict(self) -> dict:
+        return {
+            'compression': self.compression,
+            'buffer_size': self.buffer_size,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+            'min': self.min if self.weights.size else None,
+            'max': self.max if self.weights.size else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'QuantileSketch':
+        sketch = cls(compression=data['compression'], buffer_size=data['buffer_size'])
+        sketch.means = np.asarray(data['means'], dtype=np.float64)
+        sketch.weights = np.asarray(data['weights'], dtype=np.float64)
+        if sketch.weights.size:
+            sketch.min, sketch.max = float(data['min']), float(data['max'])
+        return sketch
+
+
+def sketch_series(series: pd.Series, chunk_size: int = 1_000_000, sketch: QuantileSketch = None) -> QuantileSketch:
+    """Builds (or extends) a sketch from a numeric Series, chunk by chunk."""
+    sketch = sketch if sketch is not None else QuantileSketch()
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    for start in range(0, len(values), chunk_size):
+        sketch.update(values[start:start + chunk_size])
+    return sketch
+
+
+def batch_digest(series: pd.Series) -> str:
+    """Content digest of a batch of values, used to merge each batch into a sketch only once."""
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return hashlib.sha256(np.ascontiguousarray(values).tobytes()).hexdigest()[:32]
+
+
+class SketchStore:
+    """
+    Persists named sketches as JSON so thresholds learned on earlier batches carry over.
+    Writes are atomic; updates of the same name are serialized by a file lock, across
+    threads and worker processes. Each sketch remembers the digests of the batches merged
+    into it, so re-submitting an upload doesn't count its values twice.
+    """
+
+    def __init__(self, root: str = DEFAULT_SKETCH_DIR):
+        self.root = root
+        private_dir(root)
+
+    def _path(self, name: str) -> str:
+        safe = ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in name)
+        return os.path.join(self.root, f'{safe}.json')
+
+    def _load_entry(self, name: str) -> tuple:
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None, []
+        with open(path) as f:
+            data = json.load(f)
+        return QuantileSketch.from_dict(data), data.get('merged_batches', [])
+
+    def load(self, name: str) -> QuantileSketch:
+        return self._load_entry(name)[0]
+
+    def save(self, name: str, sketch: QuantileSketch, merged_batches: list = ()):
+        path = self._path(name)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({**sketch.to_dict(), 'merged_batches': list(merged_batches)[-MAX_BATCH_DIGESTS:]}, f)
+        os.replace(tmp_path, path)
+
+    def update(self, name: str, batch_sketch: QuantileSketch, digest: str = None) -> QuantileSketch:
+        """
+        Merges a batch's sketch into the persisted one and returns the combined sketch. A
+        batch whose `digest` was merged before is skipped (the stored sketch is returned).
+        """
+        with file_lock(f'{self._path(name)}.lock'):
+            stored, merged_batches = self._load_entry(name)
+            if digest is not None and digest in merged_batches:
+                return stored
+            combined = stored.merge(batch_sketch) if stored is not None else batch_sketch
+            self.save(name, combined, merged_batches + ([digest] if digest is not None else []))
+            return combined
+
+
+def streaming_threshold(series: pd.Series, q: float, sketch_name: str = None, store: SketchStore = None) -> float:
+    """
+    q-quantile of `series` from a streaming sketch, optionally merged with a persisted sketch.
+
+    Args:
+        series (pd.Series): Current batch of values.
+        q (float): Quantile, e.g. 0.95.
+        sketch_name (str, optional): If given, the batch is merged into the persisted sketch of
+                                     that name and the threshold covers all batches seen so far.
+        store (SketchStore, optional): Where named sketches live (default directory otherwise).
+
+    Returns:
+        float: The threshold.
+    """
+    sketch = sketch_series(series)
+    if sketch_name:
+        sketch = (store or SketchStore()).update(sketch_name, sketch, digest=batch_digest(series))
+    return sketch.quantile(q)
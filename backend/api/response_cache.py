@@ -0,0 +1,232 @@
+# financial-analysis-suite-web/backend/api/response_cache.py
+
+import functools
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import Response, g, request
+
+from .app_paths import app_cache_dir, private_dir
+from .streaming import negotiate_encoding
+
+DEFAULT_RESPONSE_CACHE_DIR = app_cache_dir('response_cache', 'RESPONSE_CACHE_DIR')
+MAX_RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+MAX_SPILLED_RESPONSES = 512
+_HASH_CHUNK_BYTES = 1 << 20
+
+
+def request_fingerprint(endpoint: str) -> str:
+    """
+    Digest of the current request's inputs: endpoint, every form field (sorted) and the
+    content of every uploaded file. A dataset_id is already a content hash, so it is
+    covered by the form fields.
+    """
+    digest = hashlib.sha256(endpoint.encode())
+    digest.update(json.dumps(sorted(request.form.items(multi=True))).encode())
+    for name, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        digest.update(f'\0file:{name}\0'.encode())
+        stream = file.stream
+        chunk = stream.read(_HASH_CHUNK_BYTES)
+        while chunk:
+            digest.update(chunk)
+            chunk = stream.read(_HASH_CHUNK_BYTES)
+        stream.seek(0)
+    return digest.hexdigest()[:32]
+
+
+class ResponseCache:
+    """
+    Cache of complete analysis responses, keyed by request fingerprint and content encoding.
+
+    Bodies are stored exactly as they were sent (already compressed), so a hit costs a
+    memory or disk read and nothing else. Entries live in an LRU bounded by bytes; with a
+    `root` directory they are also written through to disk, so hits survive restarts and
+    are shared by the worker processes.
+    """
+
+    def __init__(self, root: str = DEFAULT_RESPONSE_CACHE_DIR, max_bytes: int = MAX_RESPONSE_CACHE_BYTES,
+                 max_entry_bytes: int = None, max_spilled: int = MAX_SPILLED_RESPONSES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self.max_spilled = max_spilled
+        self._entries = OrderedDict()  # key -> (body, meta)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'not_modified': 0, 'bypassed': 0,
+                         'stored': 0, 'too_large': 0, 'invalidated': 0, 'evictions': 0}
+        if root:
+            private_dir(root)
+
+    def _paths(self, key: str) -> tuple:
+        safe = ''.join(ch if ch.isalnum() else '_' for ch in key)
+        return os.path.join(self.root, f'{safe}.bin'), os.path.join(self.root, f'{safe}.json')
+
+    def count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def get(self, key: str) -> tuple:
+        """(body, meta) for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry
+        if not self.root:
+            return None
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        self._cache(key, body, meta)
+        with self._lock:
+            self.counters['disk_hits'] += 1
+        return body, meta
+
+    def put(self, key: str, body: bytes, meta: dict):
+        if len(body) > self.max_entry_bytes:
+            self.count('too_large')
+            return
+        if self.root:
+            body_path, meta_path = self._paths(key)
+            suffix = f'.{uuid.uuid4().hex}.tmp'
+            with open(body_path + suffix, 'wb') as f:
+                f.write(body)
+            os.replace(body_path + suffix, body_path)
+            with open(meta_path + suffix, 'w') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + suffix, meta_path)  # Metadata last: it marks the entry complete
+            self._trim_disk()
+        self._cache(key, body, meta)
+        self.count('stored')
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[0])
+        if self.root:
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _cache(self, key: str, body: bytes, meta: dict):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (body, meta)
+            self._bytes += len(body)
+            # Evict least recently used responses, but always keep the newest one
+            while len(self._entries) > 1 and self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.counters['evictions'] += 1
+
+    def _trim_disk(self):
+        spilled = sorted(glob.glob(os.path.join(self.root, '*.json')), key=os.path.getmtime)
+        for old_meta in spilled[:-self.max_spilled]:
+            for path in (old_meta, old_meta[:-len('.json')] + '.bin'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hits = self.counters['hits'] + self.counters['disk_hits']
+            return {'entries_in_memory': len(self._entries), 'bytes_in_memory': self._bytes,
+                    'max_bytes': self.max_bytes, 'hit_rate': round(hits / lookups, 4) if lookups else None,
+                    **self.counters}
+
+
+def _tee(chunks, on_complete):
+    """Passes `chunks` through, then hands the concatenated body to `on_complete` if fully sent."""
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        on_complete(b''.join(parts))
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def cached_response(cache: ResponseCache, bypass=None, validate=None):
+    """
+    View decorator: serves repeated submissions of the same upload and form fields from `cache`.
+
+    Successful responses are stored as they stream out (the tee adds no latency). Each
+    response carries a strong ETag derived from the request fingerprint and encoding; a
+    resubmission with a matching If-None-Match gets a bodiless 304. Put it outside
+    admission control, so hits never wait for analysis capacity.
+
+    Args:
+        cache (ResponseCache): Where responses are kept.
+        bypass (callable, optional): form -> bool; True for requests with side effects (e.g.
+            updating a persisted sketch or store), which are never served from or stored in the cache.
+        validate (callable, optional): tags -> bool, checked on a hit. Views record in
+            `flask.g.response_cache_tags` what a response refers to (e.g. an in-memory cube);
+            an entry whose references are gone is dropped and recomputed.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            no_cache = 'no-cache' in request.headers.get('Cache-Control', '')
+            if bypass is not None and bypass(request.form):
+                cache.count('bypassed')
+                return view(*args, **kwargs)
+
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+            key = f"{request_fingerprint(request.path)}-{encoding or 'identity'}"
+            etag = key
+
+            entry = None if no_cache else cache.get(key)
+            if entry is not None and validate is not None and not validate(entry[1].get('tags', {})):
+                cache.delete(key)
+                cache.count('invalidated')
+                entry = None
+            if entry is not None:
+                body, meta = entry
+                if request.if_none_match.contains(etag):
+                    cache.count('not_modified')
+                    response = Response(status=304)
+                else:
+                    response = Response(body, mimetype=meta['mimetype'])
+                    if meta.get('content_encoding'):
+                        response.headers['Content-Encoding'] = meta['content_encoding']
+                response.headers['Vary'] = 'Accept-Encoding'
+                response.headers['X-Cache'] = 'HIT'
+                response.set_etag(etag)
+                return response
+
+            cache.count('misses')
+            g.response_cache_tags = {}
+            response = view(*args, **kwargs)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return response
+
+            meta = {'mimetype': response.mimetype, 'content_encoding': response.headers.get('Content-Encoding'),
+                    'tags': dict(g.response_cache_tags), 'created_at': time.time()}
+            response.response = _tee(response.response, lambda body: cache.put(key, body, meta))
+            response.headers['X-Cache'] = 'MISS'
+            response.set_etag(etag)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,157 @@
+# financial-analysis-suite-web/backend/api/schema.py
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# A string column becomes `category` when it has at most this many distinct values and they
+# make up at most this share of the rows (IDs, emails and free text stay object).
+CATEGORY_MAX_UNIQUE = 50000
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Money columns stay float64: float32 holds single values to the cent but loses cents when
+# summing large columns (revenue totals, balances).
+MONETARY_HINTS = ('amount', 'value', 'balance', 'revenue', 'price', 'sales', 'total', 'cost')
+DATETIME_HINTS = ('date', 'time')
+BOOLEAN_STRINGS = {'true': True, 'false': False, 'yes': True, 'no': False}
+
+_SAMPLE_SIZE = 10000
+MAX_CACHED_SCHEMAS = 256
+
+_schema_cache = OrderedDict()
+_schema_cache_lock = threading.Lock()
+
+
+def header_signature(df: pd.DataFrame) -> tuple:
+    """Column names plus their parsed dtypes: uploads from the same export share a signature."""
+    return tuple((str(col), str(dtype)) for col, dtype in df.dtypes.items())
+
+
+def _float32_safe(values: pd.Series) -> bool:
+    """True if every value survives a float32 round trip to within half a cent (and 1e-6 relative)."""
+    x = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    finite = x[np.isfinite(x)]
+    if finite.size == 0:
+        return True
+    error = np.abs(finite.astype(np.float32).astype(np.float64) - finite)
+    return bool((error < 0.005).all() and (error <= 1e-6 * np.abs(finite)).all())
+
+
+def _category_fits(series: pd.Series) -> bool:
+    """True if the column has few enough distinct values (absolutely and per row) to be a category."""
+    n_unique = series.nunique(dropna=True)
+    return n_unique <= CATEGORY_MAX_UNIQUE and n_unique <= CATEGORY_MAX_UNIQUE_RATIO * max(len(series), 1)
+
+
+def _integer_dtype(values: pd.Series) -> str:
+    info = np.iinfo(np.int32)
+    if values.empty or (values.min() >= info.min and values.max() <= info.max):
+        return 'int32'
+    return str(values.dtype)
+
+
+def _infer_column(name: str, series: pd.Series) -> dict:
+    lower = name.lower()
+    if pd.api.types.is_bool_dtype(series):
+        return {'role': 'boolean', 'dtype': 'bool'}
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return {'role': 'datetime', 'dtype': str(series.dtype)}
+    if pd.api.types.is_integer_dtype(series):
+        return {'role': 'numeric', 'dtype': _integer_dtype(series)}
+    if pd.api.types.is_float_dtype(series):
+        if any(hint in lower for hint in MONETARY_HINTS) or not _float32_safe(series):
+            return {'role': 'numeric', 'dtype': 'float64'}
+        return {'role': 'numeric', 'dtype': 'float32'}
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return {'role': 'categorical', 'dtype': 'category'}
+
+    # Strings (object dtype)
+    non_null = series.dropna()
+    if not non_null.empty and len(non_null) == len(series) and \
+            non_null.astype(str).str.lower().isin(list(BOOLEAN_STRINGS)).all():
+        return {'role': 'boolean', 'dtype': 'bool'}
+    if any(hint in lower for hint in DATETIME_HINTS) and not non_null.empty:
+        sample = non_null.sample(min(len(non_null), _SAMPLE_SIZE), random_state=0).astype(str)
+        parsed = pd.to_datetime(sample, errors='coerce', format='mixed')
+        if parsed.notna().mean() >= 0.9:
+            return {'role': 'datetime', 'dtype': 'object'}  # Parsed by the engines themselves
+    if _category_fits(series):
+        return {'role': 'categorical', 'dtype': 'category'}
+    return {'role': 'identifier', 'dtype': 'object'}
+
+
+def infer_schema(df: pd.DataFrame) -> dict:
+    """
+    Infers each column's role ('numeric', 'boolean', 'categorical', 'datetime', 'identifier')
+    and the compact dtype to store it in. Results are cached by header signature, so later
+    uploads of the same export skip inference.
+
+    Returns:
+        dict: column -> {'role': ..., 'dtype': ...}
+    """
+    signature = header_signature(df)
+    with _schema_cache_lock:
+        cached = _schema_cache.get(signature)
+        if cached is not None:
+            _schema_cache.move_to_end(signature)
+            return cached
+
+    schema = {col: _infer_column(str(col), df[col]) for col in df.columns}
+
+    with _schema_cache_lock:
+        _schema_cache[signature] = schema
+        while len(_schema_cache) > MAX_CACHED_SCHEMAS:
+            _schema_cache.popitem(last=False)
+    return schema
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """
+    Casts `df` to the schema's compact dtypes. A cached schema may come from an earlier upload,
+    so numeric downcasts and category casts are re-checked and skipped where this upload's
+    values don't fit (e.g. a column that is now mostly unique stays object).
+    Categories are sorted, so `.cat.codes` match what LabelEncoder would assign.
+    """
+    df = df.copy()
+    for col, spec in schema.items():
+        if col not in df.columns:
+            continue
+        series, dtype = df[col], spec['dtype']
+        if dtype == 'category' and not isinstance(series.dtype, pd.CategoricalDtype):
+            if not _category_fits(series):
+                continue
+            categories = pd.Index(series.dropna().unique())
+            try:
+                categories = categories.sort_values()
+            except TypeError:  # Mixed types: keep order of appearance
+                pass
+            df[col] = pd.Categorical(series, categories=categories)
+        elif dtype == 'bool' and not pd.api.types.is_bool_dtype(series):
+            mapped = series.astype(str).str.lower().map(BOOLEAN_STRINGS)
+            if mapped.notna().all():
+                df[col] = mapped.astype(bool)
+        elif dtype == 'float32' and pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+            if _float32_safe(series):
+                df[col] = series.astype(np.float32)
+        elif dtype == 'int32' and pd.api.types.is_integer_dtype(series) and _integer_dtype(series) == 'int32':
+            df[col] = series.astype(np.int32)
+    return df
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Infers (or reuses) the schema for `df` and returns a compactly typed copy."""
+    return apply_schema(df, infer_schema(df))
+
+
+def fill_missing(series: pd.Series, value) -> pd.Series:
+    """`series.fillna(value)` that also works on categoricals whose categories lack `value`."""
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+
+def memory_per_row(df: pd.DataFrame) -> float:
+    """Deep memory usage in bytes per row (strings included)."""
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
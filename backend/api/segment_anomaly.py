@@ -0,0 +1,248 @@
+# financial-analysis-suite-web/backend/api/segment_anomaly.py
+
+import glob
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from . import signed_pickle
+from .app_paths import app_cache_dir, private_dir
+from .partitioned_scoring import SCORING_WORKERS, scoring_pool_map
+
+SEGMENT_COLUMNS = ('product_id', 'job', 'city')
+DEFAULT_SEGMENT_MODEL_DIR = app_cache_dir('segment_models', 'SEGMENT_MODEL_DIR')
+SEGMENT_MODEL_MAX_AGE = float(os.environ.get('SEGMENT_MODEL_MAX_AGE_HOURS', 24 * 7)) * 3600
+MAX_CACHED_MODELS = 1024
+MAX_SPILLED_MODELS = 8192
+FINGERPRINT_QUANTILES = np.linspace(0.05, 0.95, 19)
+FINGERPRINT_RESOLUTION = 0.05  # Log-amount step (about 5% of the amount) below which distributions count as equal
+
+MIN_FOREST_ROWS = 500      # Segments at least this large get their own IsolationForest
+MIN_SEGMENT_ROWS = 20      # Smaller segments are scored against the pooled statistics of all small segments
+ROBUST_Z_THRESHOLD = 3.5   # Modified z-score cut-off (Iglewicz & Hoaglin)
+CONTAMINATION = 0.02       # As the single global IsolationForest this replaces
+
+
+class SegmentModelCache:
+    """
+    Fitted per-segment IsolationForests, keyed by segment column, segment value and a
+    fingerprint of the segment's data (see `segment_fingerprint`), so a model is only reused
+    for an upload whose segment has the same size class and amount distribution, and never
+    carries one dataset's notion of normal into an unrelated one. Models older than `max_age`
+    seconds are refitted. An LRU by count in memory, written through to `root` (private, as
+    signed pickles) so every worker process shares them.
+    """
+
+    def __init__(self, root: str = DEFAULT_SEGMENT_MODEL_DIR, max_models: int = MAX_CACHED_MODELS,
+                 max_age: float = SEGMENT_MODEL_MAX_AGE, max_spilled: int = MAX_SPILLED_MODELS):
+        self.root = root
+        self.max_models = max_models
+        self.max_age = max_age
+        self.max_spilled = max_spilled
+        self._models = OrderedDict()  # key -> (model, meta)
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stale': 0, 'stored': 0}
+        self._key = None
+        if root:
+            private_dir(root)
+            self._key = signed_pickle.signing_key(root)
+
+    @staticmethod
+    def key(column: str, value, fingerprint: str) -> str:
+        return hashlib.sha256(repr((column, str(value), fingerprint)).encode()).hexdigest()[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f'{key}.pkl')
+
+    def get(self, column: str, value, fingerprint: str):
+        """The cached model for this segment and data fingerprint, or None if missing or too old."""
+        key = self.key(column, value, fingerprint)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+        from_disk = False
+        if entry is None and self.root:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    entry = signed_pickle.loads(f.read(), self._key)
+                from_disk = True
+            except (FileNotFoundError, ValueError):
+                entry = None
+        if entry is None:
+            self._count('misses')
+            return None
+        model, meta = entry
+        if time.time() - meta['fitted_at'] > self.max_age:
+            self._count('stale')
+            return None
+        if from_disk:
+            self._remember(key, entry)
+        self._count('disk_hits' if from_disk else 'hits')
+        return model
+
+    def put(self, column: str, value, fingerprint: str, model, rows: int):
+        key = self.key(column, value, fingerprint)
+        entry = (model, {'column': column, 'value': str(value), 'fingerprint': fingerprint,
+                         'rows': rows, 'fitted_at': time.time()})
+        if self.root:
+            path = self._path(key)
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(signed_pickle.dumps(entry, self._key))
+            os.replace(tmp_path, path)
+        self._remember(key, entry)
+        self._count('stored')
+
+    def _remember(self, key: str, entry: tuple):
+        with self._lock:
+            self._models[key] = entry
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def trim_disk(self):
+        if not self.root:
+            return
+        spilled = sorted(glob.glob(os.path.join(self.root, '*.pkl')), key=os.path.getmtime)
+        for old in spilled[:-self.max_spilled]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'models_in_memory': len(self._models), **self.counters}
+
+
+_model_cache = None
+_model_cache_lock = threading.Lock()
+
+
+def get_segment_model_cache() -> SegmentModelCache:
+    """The process-wide segment model cache (directory from SEGMENT_MODEL_DIR), opened on first use."""
+    global _model_cache
+    with _model_cache_lock:
+        if _model_cache is None:
+            _model_cache = SegmentModelCache()
+        return _model_cache
+
+
+def segment_fingerprint(values: np.ndarray) -> str:
+    """
+    Digest of a segment's log amounts: its size class (power of two) and its 5%..95%
+    quantiles rounded to FINGERPRINT_RESOLUTION. Re-uploads and near-identical data share a
+    fingerprint; a segment from a different population of invoices does not.
+    """
+    steps = np.round(np.quantile(values, FINGERPRINT_QUANTILES) / FINGERPRINT_RESOLUTION).astype(np.int64)
+    return hashlib.sha256(repr((int(len(values)).bit_length(), steps.tolist())).encode()).hexdigest()[:16]
+
+
+def _fit_forest(values: np.ndarray) -> IsolationForest:
+    """Pool task: one segment's forest, single-threaded (the pool provides the parallelism)."""
+    model = IsolationForest(n_estimators=100, contamination=CONTAMINATION, random_state=42, n_jobs=1)
+    return model.fit(values.reshape(-1, 1))
+
+
+def _robust_scores(x: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """|x - median| / (1.4826 * MAD) within each group, for all groups at once."""
+    frame = pd.DataFrame({'g': groups, 'x': x})
+    median = frame.groupby('g')['x'].median().reindex(range(n_groups)).to_numpy()
+    deviation = np.abs(x - median[groups])
+    by_group = pd.DataFrame({'g': groups, 'd': deviation}).groupby('g')['d']
+    mad = 1.4826 * by_group.median().reindex(range(n_groups)).to_numpy()
+    # Segments where most amounts are identical have MAD == 0: mean absolute deviation, then 1
+    mean_ad = 1.2533 * by_group.mean().reindex(range(n_groups)).to_numpy()
+    scale = np.where(mad > 0, mad, mean_ad)
+    scale = np.where(scale > 0, scale, 1.0)
+    return deviation / scale[groups]
+
+
+def segment_anomaly_flags(df: pd.DataFrame, segment_by: str, amount_col: str = 'amount',
+                          cache: SegmentModelCache = None, workers: int = None,
+                          min_forest_rows: int = MIN_FOREST_ROWS) -> tuple:
+    """
+    Flags invoice amounts that are unusual for their segment (product, job or city) rather
+    than for the whole file.
+
+    Amounts are compared on a log scale. Segments with at least `min_forest_rows` invoices
+    get their own IsolationForest (contamination 2%), fitted in parallel on the shared
+    scoring pool (see partitioned_scoring), or taken from `cache` if a fresh model for the
+    segment and a matching data fingerprint exists. Smaller
+    segments are scored together, vectorized, by modified z-score against their own median
+    and MAD; segments under MIN_SEGMENT_ROWS are pooled for those statistics.
+
+    Returns:
+        tuple: (flags Series of 0/1 aligned with df, report dict with segment counts, models
+               trained and reused, and seconds taken)
+    """
+    start = time.perf_counter()
+    if segment_by not in df.columns:
+        raise ValueError(f"Cannot segment invoices by '{segment_by}': column not found.")
+    cache = cache if cache is not None else get_segment_model_cache()
+
+    valid = df[amount_col].notna().to_numpy()
+    x = np.log1p(np.clip(df[amount_col].to_numpy(dtype=np.float64, na_value=0.0), 0, None))
+    codes, labels = pd.factorize(df[segment_by].astype(str))
+    sizes = np.bincount(codes[valid], minlength=len(labels))
+    flags = np.zeros(len(df), dtype=np.int64)
+
+    # Small segments: one vectorized pass of per-group robust statistics
+    small = valid & (sizes[codes] < min_forest_rows)
+    if small.any():
+        tiny_group = len(labels)  # All rows of segments too small for statistics of their own
+        groups = np.where(sizes[codes[small]] >= MIN_SEGMENT_ROWS, codes[small], tiny_group)
+        z = _robust_scores(x[small], groups, len(labels) + 1)
+        flags[small] = (z > ROBUST_Z_THRESHOLD).astype(np.int64)
+
+    # Large segments: one IsolationForest each, cached across uploads
+    large = np.flatnonzero(sizes >= min_forest_rows)
+    valid_rows = np.flatnonzero(valid)
+    by_segment = np.split(valid_rows[np.argsort(codes[valid_rows], kind='stable')], np.cumsum(sizes)[:-1])
+    rows_of = {code: by_segment[code] for code in large}
+    fingerprints = {code: segment_fingerprint(x[rows_of[code]]) for code in large}
+    models, to_fit = {}, []
+    for code in large:
+        model = cache.get(segment_by, labels[code], fingerprints[code])
+        if model is None:
+            to_fit.append(code)
+        else:
+            models[code] = model
+    workers = workers or SCORING_WORKERS
+    if workers > 1 and len(to_fit) > 1:
+        fitted = scoring_pool_map(_fit_forest, [x[rows_of[code]] for code in to_fit], workers=workers)
+    else:
+        fitted = [_fit_forest(x[rows_of[code]]) for code in to_fit]
+    for code, model in zip(to_fit, fitted):
+        cache.put(segment_by, labels[code], fingerprints[code], model, len(rows_of[code]))
+        models[code] = model
+    if to_fit:
+        cache.trim_disk()
+    for code, model in models.items():
+        rows = rows_of[code]
+        flags[rows] = (model.predict(x[rows].reshape(-1, 1)) == -1).astype(np.int64)
+
+    report = {
+        'segment_by': segment_by,
+        'segments': int((sizes > 0).sum()),
+        'robust_segments': int(((sizes > 0) & (sizes < min_forest_rows)).sum()),
+        'forest_segments': int(len(large)),
+        'models_trained': len(to_fit),
+        'models_reused': len(large) - len(to_fit),
+        'workers': min(workers, len(to_fit)),
+        'flagged': int(flags.sum()),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    return pd.Series(flags, index=df.index), report
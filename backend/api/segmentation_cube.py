@@ -0,0 +1,229 @@
+# financial-analysis-suite-web/backend/api/segmentation_cube.py
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .app_paths import app_cache_dir, private_dir
+
+CUBE_DIMENSIONS = ['city', 'job', 'product_id', 'invoice_month']
+CUBE_METRICS = ['total_revenue', 'avg_invoice_amount', 'total_invoices']
+MAX_CACHED_CUBES = 32
+MAX_SPILLED_CUBES = 256
+DEFAULT_CUBE_DIR = app_cache_dir('segment_cubes', 'SEGMENT_CUBE_DIR')
+
+
+class SegmentCube:
+    """
+    Pre-aggregated invoice cube over city x job x product_id x invoice_month.
+
+    Every dimension is dictionary-encoded once (sorted categories -> integer codes) and the
+    invoices are reduced to one row per non-empty cell with np.bincount, holding additive
+    measures: revenue (sum of total_value), sum of amount and invoice count. Queries
+    (filters, month ranges, roll-ups to any subset of dimensions, top-N) then only touch
+    the cells, never the invoice rows.
+
+    Missing dimension values get a cell of their own (label None), so totals over other
+    dimensions still count those invoices, but a roll-up that groups by that dimension leaves
+    them out, as pandas' groupby does.
+    """
+
+    def __init__(self, categories: dict, cell_codes: dict, revenue: np.ndarray, amount_sum: np.ndarray, count: np.ndarray):
+        self.categories = categories    # dimension -> np.ndarray of labels, index = code
+        self.cell_codes = cell_codes    # dimension -> code per non-empty cell
+        self.revenue = revenue
+        self.amount_sum = amount_sum
+        self.count = count
+        # dimension -> code of its missing-value label, for the dimensions that have one
+        self.missing_codes = {dim: int(np.flatnonzero(pd.isna(labels))[0])
+                              for dim, labels in categories.items() if pd.isna(labels).any()}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, dimensions: list = CUBE_DIMENSIONS) -> 'SegmentCube':
+        """
+        Builds the cube from cleaned invoices (needs total_value, amount and the dimension columns).
+        """
+        categories, codes = {}, []
+        for dim in dimensions:
+            dim_codes, labels = pd.factorize(df[dim], sort=True)
+            labels = np.asarray(labels, dtype=object)
+            dim_codes = dim_codes.astype(np.int64)
+            if (dim_codes < 0).any():
+                dim_codes[dim_codes < 0] = len(labels)
+                labels = np.append(labels, None)
+            categories[dim] = labels
+            codes.append(dim_codes)
+
+        shape = tuple(len(categories[dim]) for dim in dimensions)
+        flat = np.ravel_multi_index(codes, shape) if len(df) else np.array([], dtype=np.int64)
+        cells, inverse = np.unique(flat, return_inverse=True)
+
+        revenue = np.bincount(inverse, weights=df['total_value'].to_numpy(dtype=np.float64), minlength=len(cells))
+        amount_sum = np.bincount(inverse, weights=df['amount'].to_numpy(dtype=np.float64), minlength=len(cells))
+        count = np.bincount(inverse, minlength=len(cells))
+        cell_codes = dict(zip(dimensions, np.unravel_index(cells, shape))) if len(cells) else \
+            {dim: np.array([], dtype=np.int64) for dim in dimensions}
+        return cls(categories, cell_codes, revenue, amount_sum, count)
+
+    @property
+    def dimensions(self) -> list:
+        return list(self.categories)
+
+    def _cell_mask(self, filters: dict, month_from: str, month_to: str) -> np.ndarray:
+        mask = np.ones(len(self.count), dtype=bool)
+        for dim, allowed in (filters or {}).items():
+            if dim not in self.categories:
+                raise ValueError(f"Unknown cube dimension '{dim}'. Available: {', '.join(self.dimensions)}.")
+            allowed = [allowed] if np.isscalar(allowed) else list(allowed)
+            labels = self.categories[dim].astype(str)
+            allowed_codes = np.flatnonzero(np.isin(labels, [str(value) for value in allowed]))
+            allowed_codes = allowed_codes[allowed_codes != self.missing_codes.get(dim, -1)]
+            mask &= np.isin(self.cell_codes[dim], allowed_codes)
+        if (month_from or month_to) and 'invoice_month' in self.categories:
+            months = self.categories['invoice_month'].astype(str)  # 'YYYY-MM' sorts chronologically
+            in_range = np.ones(len(months), dtype=bool)
+            if month_from:
+                in_range &= months >= month_from
+            if month_to:
+                in_range &= months <= month_to
+            mask &= in_range[self.cell_codes['invoice_month']]
+        return mask
+
+    def query(self, group_by: list = ('city', 'job'), filters: dict = None, month_from: str = None,
+              month_to: str = None, metric: str = 'total_revenue', top_n: int = 10,
+              ascending: bool = False) -> pd.DataFrame:
+        """
+        Rolls the cube up to `group_by`, after filtering.
+
+        Args:
+            group_by (list): Dimensions to keep (empty for a grand total).
+            filters (dict): Dimension -> allowed value(s), e.g. {'city': ['Pune', 'Delhi']}.
+            month_from (str), month_to (str): Inclusive 'YYYY-MM' bounds on invoice_month.
+            metric (str): Sort key, one of CUBE_METRICS.
+            top_n (int or None): Number of rows to return; None returns all groups.
+            ascending (bool): Sort order (default: largest first).
+
+        Returns:
+            pd.DataFrame: group_by columns plus total_revenue, avg_invoice_amount, total_invoices.
+        """
+        group_by = list(group_by)
+        unknown = [dim for dim in group_by if dim not in self.categories]
+        if unknown:
+            raise ValueError(f"Unknown cube dimension(s) {unknown}. Available: {', '.join(self.dimensions)}.")
+        if metric not in CUBE_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Choose one of: {', '.join(CUBE_METRICS)}.")
+
+        mask = self._cell_mask(filters, month_from, month_to)
+        for dim in group_by:
+            if dim in self.missing_codes:
+                mask &= self.cell_codes[dim] != self.missing_codes[dim]
+        if group_by:
+            shape = tuple(len(self.categories[dim]) for dim in group_by)
+            group_flat = np.ravel_multi_index([self.cell_codes[dim][mask] for dim in group_by], shape)
+            groups, inverse = np.unique(group_flat, return_inverse=True)
+            group_codes = np.unravel_index(groups, shape)
+        else:
+            groups, inverse, group_codes = np.zeros(1, dtype=np.int64), np.zeros(mask.sum(), dtype=np.int64), ()
+
+        revenue = np.bincount(inverse, weights=self.revenue[mask], minlength=len(groups))
+        amount_sum = np.bincount(inverse, weights=self.amount_sum[mask], minlength=len(groups))
+        count = np.bincount(inverse, weights=self.count[mask], minlength=len(groups)).astype(np.int64)
+
+        result = pd.DataFrame({dim: self.categories[dim][codes] for dim, codes in zip(group_by, group_codes)})
+        result['total_revenue'] = revenue
+        result['avg_invoice_amount'] = np.divide(amount_sum, count, out=np.full(len(count), np.nan), where=count > 0)
+        result['total_invoices'] = count
+        result = result.sort_values(by=metric, ascending=ascending)
+        return result.head(top_n) if top_n is not None else result
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for dim in self.dimensions:
+            digest.update(dim.encode())
+            digest.update(self.cell_codes[dim].tobytes())
+            digest.update('\x1f'.join(map(str, self.categories[dim])).encode())
+        digest.update(self.revenue.tobytes())
+        return digest.hexdigest()[:16]
+
+    def save(self, path: str):
+        """Writes the cube as .npz (no pickles: labels are stored as JSON), atomically."""
+        arrays = {f'codes_{i}': self.cell_codes[dim] for i, dim in enumerate(self.dimensions)}
+        labels = {dim: self.categories[dim].tolist() for dim in self.dimensions}
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp.npz'
+        np.savez(tmp_path, revenue=self.revenue, amount_sum=self.amount_sum, count=self.count,
+                 categories=np.array(json.dumps(labels, default=str)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SegmentCube':
+        with np.load(path, allow_pickle=False) as data:
+            labels = json.loads(str(data['categories']))
+            categories = {dim: np.asarray(values, dtype=object) for dim, values in labels.items()}
+            cell_codes = {dim: data[f'codes_{i}'] for i, dim in enumerate(labels)}
+            return cls(categories, cell_codes, data['revenue'], data['amount_sum'], data['count'])
+
+
+_cube_cache = OrderedDict()
+_cube_cache_lock = threading.Lock()
+
+
+def _cube_path(cube_id: str) -> str:
+    safe = ''.join(ch for ch in cube_id if ch.isalnum())
+    return os.path.join(private_dir(DEFAULT_CUBE_DIR), f'{safe}.npz')
+
+
+def _remember(cube_id: str, cube: SegmentCube):
+    with _cube_cache_lock:
+        _cube_cache[cube_id] = cube
+        _cube_cache.move_to_end(cube_id)
+        while len(_cube_cache) > MAX_CACHED_CUBES:
+            _cube_cache.popitem(last=False)
+
+
+def register_cube(cube: SegmentCube) -> str:
+    """
+    Caches a cube (LRU, bounded) and returns its id, which is stable for identical data.
+    Cubes are also written to SEGMENT_CUBE_DIR, so any worker can answer queries for them.
+    """
+    cube_id = cube.fingerprint()
+    _remember(cube_id, cube)
+    path = _cube_path(cube_id)
+    if not os.path.exists(path):
+        cube.save(path)
+        spilled = sorted(glob.glob(os.path.join(DEFAULT_CUBE_DIR, '*.npz')), key=os.path.getmtime)
+        for old in spilled[:-MAX_SPILLED_CUBES]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    return cube_id
+
+
+def has_cube(cube_id: str) -> bool:
+    """Whether any worker can serve `cube_id` (in this worker's memory or on disk), without loading it."""
+    with _cube_cache_lock:
+        if cube_id in _cube_cache:
+            return True
+    return os.path.exists(_cube_path(cube_id))
+
+
+def get_cube(cube_id: str) -> SegmentCube:
+    """Returns a cube from memory or disk, or None if it was never built or has been evicted everywhere."""
+    with _cube_cache_lock:
+        cube = _cube_cache.get(cube_id)
+        if cube is not None:
+            _cube_cache.move_to_end(cube_id)
+            return cube
+    try:
+        cube = SegmentCube.load(_cube_path(cube_id))
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return None
+    _remember(cube_id, cube)
+    return cube
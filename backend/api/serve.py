@@ -0,0 +1,126 @@
+# financial-analysis-suite-web/backend/api/serve.py
+#
+# Production entry point for running the API on our own hosts (Vercel keeps using index.app).
+#
+# Usage (from the repository root):
+#     python -m backend.api.serve --bind 0.0.0.0:8000 --workers 4 --threads 2 --max-requests 500
+#
+# Every option can also be set through the environment (API_BIND, API_WORKERS, API_THREADS,
+# API_MAX_REQUESTS, API_MAX_REQUESTS_JITTER, API_TIMEOUT, API_GRACEFUL_TIMEOUT).
+
+import argparse
+import gc
+import multiprocessing
+import os
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is POSIX-only; index.app still works under any WSGI server
+    BaseApplication = None
+
+
+def preload():
+    """
+    Imports the application and its heavy dependencies in the master process.
+
+    Workers are forked afterwards, so pandas, scikit-learn, matplotlib, plotly and TensorFlow
+    (code pages, import-time data, font caches) are shared copy-on-write instead of being
+    loaded once per worker. TensorFlow's runtime itself is not started here: it is not
+    fork-safe, so the first graph is built per worker in `warm_up_worker`.
+
+    Returns:
+        The WSGI app.
+    """
+    import matplotlib
+    matplotlib.use('Agg')  # No GUI backend on servers
+    import matplotlib.pyplot as plt
+
+    from .index import app
+
+    # Populate matplotlib's font cache once, in the master.
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.set_title("warm-up")
+    fig.canvas.draw()
+    plt.close(fig)
+
+    # Move everything loaded so far out of the cyclic GC's generations, so collections in the
+    # workers don't touch (and thereby copy) the shared pages.
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def warm_up_worker(worker):
+    """Per-worker warm-up after fork: runs the first (slow) call of each engine's libraries."""
+    import numpy as np
+    from sklearn.ensemble import IsolationForest
+
+    IsolationForest(n_estimators=2, random_state=0).fit(np.random.rand(16, 2))
+    try:
+        import tensorflow as tf
+        tf.constant([1.0]) + 1.0  # Initializes the TF runtime in this process
+    except Exception as e:
+        worker.log.warning(f"TensorFlow warm-up failed: {e}")
+    worker.log.info(f"Worker {worker.pid} warmed up")
+
+
+if BaseApplication is not None:
+    class APIServer(BaseApplication):
+        """Pre-fork gunicorn server around the preloaded Flask app."""
+
+        def __init__(self, options: dict, warm_up: bool = True):
+            self.options = options
+            self.warm_up = warm_up
+            self.application = preload()
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            if self.warm_up:
+                self.cfg.set('post_worker_init', warm_up_worker)
+
+        def load(self):
+            return self.application
+
+
+def parse_args(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Run the Financial Analysis Suite API with pre-forked workers.")
+    parser.add_argument('--bind', default=env('API_BIND', '0.0.0.0:8000'))
+    parser.add_argument('--workers', type=int, default=int(env('API_WORKERS', multiprocessing.cpu_count())),
+                        help="Worker processes (default: one per core).")
+    parser.add_argument('--threads', type=int, default=int(env('API_THREADS', 2)),
+                        help="Threads per worker; >1 uses gthread workers.")
+    parser.add_argument('--max-requests', type=int, default=int(env('API_MAX_REQUESTS', 500)),
+                        help="Recycle a worker after this many requests (0 disables) to contain leaks.")
+    parser.add_argument('--max-requests-jitter', type=int, default=int(env('API_MAX_REQUESTS_JITTER', 50)),
+                        help="Random extra requests so workers don't all recycle at once.")
+    parser.add_argument('--timeout', type=int, default=int(env('API_TIMEOUT', 300)),
+                        help="Seconds before a silent worker is killed (forecast training is slow).")
+    parser.add_argument('--graceful-timeout', type=int, default=int(env('API_GRACEFUL_TIMEOUT', 60)),
+                        help="Seconds a recycling worker gets to finish in-flight requests.")
+    parser.add_argument('--no-warmup', action='store_true', help="Skip per-worker warm-up.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if BaseApplication is None:
+        raise SystemExit("gunicorn is not installed (pip install gunicorn); it is required for backend.api.serve.")
+    args = parse_args(argv)
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'preload_app': True,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests_jitter,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+    }
+    APIServer(options, warm_up=not args.no_warmup).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# financial-analysis-suite-web/backend/api/signed_pickle.py
+
+import hashlib
+import hmac
+import os
+import pickle
+import secrets
+
+KEY_FILE = '.signing-key'
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+
+def signing_key(root: str) -> bytes:
+    """
+    The store's HMAC key, kept in `root` (mode 0600) and created by whichever worker gets
+    there first. The key is written to a temporary file and linked into place, so other
+    workers never see a partly written key.
+    """
+    path = os.path.join(root, KEY_FILE)
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{secrets.token_hex(8)}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_bytes(32))
+                f.flush()
+                os.fsync(f.fileno())
+            os.link(tmp_path, path)  # Atomic, and fails if another worker's key got there first
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        key = f.read()
+    if len(key) < 32:
+        raise ValueError(f"Signing key '{path}' is truncated; delete it to start a new one.")
+    return key
+
+
+def dumps(obj, key: bytes) -> bytes:
+    """Pickles `obj`, prefixed with an HMAC-SHA256 of the payload."""
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    return hmac.new(key, payload, hashlib.sha256).digest() + payload
+
+
+def loads(blob: bytes, key: bytes):
+    """Unpickles what `dumps` wrote with the same key; raises ValueError (before unpickling) on any other input."""
+    signature, payload = blob[:_DIGEST_SIZE], blob[_DIGEST_SIZE:]
+    if not hmac.compare_digest(signature, hmac.new(key, payload, hashlib.sha256).digest()):
+        raise ValueError("Refusing to unpickle a file without a valid signature.")
+    return pickle.loads(payload)
@@ -0,0 +1,202 @@
+# financial-analysis-suite-web/backend/api/streaming.py
+
+import json
+import logging
+import zlib
+
+import numpy as np
+import pandas as pd
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+FRAME_BLOCK_ROWS = 20000        # Rows serialized per DataFrame block
+FLUSH_BYTES = 64 * 1024         # Bytes buffered before compressing/sending a chunk
+
+logger = logging.getLogger(__name__)
+
+
+class FrameJSON:
+    """
+    Marks a DataFrame to be emitted as a JSON *string* holding `df.to_json(orient='split')`,
+    which is what the React tools JSON.parse. The string is produced block by block, so the
+    full serialized table never sits in memory at once.
+    """
+
+    def __init__(self, df: pd.DataFrame, date_format: str = None, block_rows: int = FRAME_BLOCK_ROWS):
+        self.df = df
+        self.date_format = date_format
+        self.block_rows = block_rows
+
+    def iter_split_json(self):
+        """Yields pieces of text that concatenate to exactly `df.to_json(orient='split', ...)`."""
+        df, fmt = self.df, self.date_format
+        empty = df.iloc[:0].to_json(orient='split', date_format=fmt)
+        yield empty[:-len(',"index":[],"data":[]}')]  # '{"columns":[...]'
+
+        yield ',"index":['
+        for i, start in enumerate(range(0, len(df), self.block_rows)):
+            index_block = df.index[start:start + self.block_rows].to_series()
+            yield (',' if i else '') + index_block.to_json(orient='values', date_format=fmt)[1:-1]
+
+        yield '],"data":['
+        for i, start in enumerate(range(0, len(df), self.block_rows)):
+            block = df.iloc[start:start + self.block_rows]
+            yield (',' if i else '') + block.to_json(orient='values', date_format=fmt)[1:-1]
+        yield ']}'
+
+
+def _json_default(value):
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def iter_json(value):
+    """
+    Serializes `value` to JSON text incrementally. Dicts, lists and FrameJSON tables are
+    streamed; anything else is encoded in one piece with json.dumps.
+    """
+    if isinstance(value, FrameJSON):
+        # A JSON string's escaped form is the concatenation of its pieces' escaped forms.
+        yield '"'
+        for piece in value.iter_split_json():
+            yield json.dumps(piece)[1:-1]
+        yield '"'
+    elif isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield (',' if i else '') + json.dumps(str(key)) + ':'
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ','
+            yield from iter_json(item)
+        yield ']'
+    else:
+        yield json.dumps(value, default=_json_default)
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """
+    Picks 'br' or 'gzip' from an Accept-Encoding header (honouring q-values), or None for identity.
+    """
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.lower()] = q
+
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    wildcard = offered.get('*', 0.0)
+    best = max(candidates, key=lambda enc: offered.get(enc, wildcard), default=None)
+    return best if best is not None and offered.get(best, wildcard) > 0 else None
+
+
+def _compressed(chunks, encoding: str):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=4)  # Fast levels: we compress on the fly
+        compress, finish = compressor.process, compressor.finish
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+        compress, finish = compressor.compress, compressor.flush
+    else:
+        yield from chunks
+        return
+    for chunk in chunks:
+        out = compress(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+def _buffered_bytes(pieces, flush_bytes: int = FLUSH_BYTES):
+    buffer, size = [], 0
+    for piece in pieces:
+        data = piece.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= flush_bytes:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream_json_body(payload, encoding: str = None):
+    """Generator of (optionally compressed) response body bytes for `payload`."""
+    return _compressed(_buffered_bytes(iter_json(payload)), encoding)
+
+
+def _primed(chunks):
+    """
+    Produces the first chunk right away, so a payload that fails to serialize raises in the
+    view (and gets a proper error response). A failure after that is logged and re-raised:
+    the server then drops the connection mid-body (no final chunk, truncated gzip/brotli
+    stream) instead of ending it cleanly, so the client can't take a partial body as complete.
+    """
+    first = next(chunks, None)
+
+    def body():
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except Exception:
+            logger.exception("JSON response failed after its headers were sent; aborting the body")
+            raise
+        finally:
+            chunks.close()
+    return body()
+
+
+def streaming_json_response(payload, accept_encoding: str = None, status: int = 200) -> Response:
+    """
+    Builds a Flask response that streams `payload` as JSON, compressed with the best encoding
+    the client accepts. Call from inside the view (so the header is read in request context).
+
+    Args:
+        payload (dict): Response envelope; DataFrames wrapped in FrameJSON are streamed in blocks.
+        accept_encoding (str): The request's Accept-Encoding header.
+        status (int): HTTP status code.
+
+    Returns:
+        flask.Response: Chunked response; only the first chunk is serialized before it is returned.
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(_primed(stream_json_body(payload, encoding)), status=status,
+                    mimetype='application/json', headers=headers)
+
+
+def json_bytes_response(body: bytes, accept_encoding: str = None, status: int = 200) -> Response:
+    """
+    Like streaming_json_response, for a JSON body that is already serialized (e.g. a stored
+    job result): compressed with the best encoding the client accepts.
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(b''.join(_compressed([body], encoding)), status=status,
+                    mimetype='application/json', headers=headers)
@@ -0,0 +1,162 @@
+# financial-analysis-suite-web/backend/api/summary_stats.py
+
+import numpy as np
+import pandas as pd
+
+BLOCK_ROWS = 1_000_000  # Rows per step of the fused pass
+
+
+class RunningMoments:
+    """
+    Mean and co-moment matrix of a stream of row blocks, merged with Chan et al.'s pairwise
+    update, so a covariance or correlation matrix takes one pass and O(columns^2) memory.
+    """
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros((k, k))
+
+    def update(self, X: np.ndarray):
+        n_b = len(X)
+        if n_b == 0:
+            return
+        mean_b = X.mean(axis=0)
+        centered = X - mean_b
+        m2_b = centered.T @ centered
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.m2 += m2_b + np.outer(delta, delta) * (self.n * n_b / n)
+        self.mean += delta * (n_b / n)
+        self.n = n
+
+    def covariance(self) -> pd.DataFrame:
+        cov = self.m2 / (self.n - 1) if self.n > 1 else np.full_like(self.m2, np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self) -> pd.DataFrame:
+        """Pearson correlations, as DataFrame.corr(); NaN where a column is constant."""
+        cov = self.covariance().to_numpy()
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        corr = np.where(np.outer(std > 0, std > 0), corr, np.nan)
+        np.fill_diagonal(corr, np.where(std > 0, 1.0, np.nan))
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=self.columns, columns=self.columns)
+
+
+def correlation_matrix(df: pd.DataFrame, columns: list, block_rows: int = BLOCK_ROWS) -> pd.DataFrame:
+    """df[columns].corr(), by running moments over row blocks (falls back to pandas' pairwise corr() if there are NaNs)."""
+    moments = RunningMoments(columns)
+    arrays = [df[col].to_numpy() for col in columns]
+    for start in range(0, len(df), block_rows):
+        X = np.column_stack([a[start:start + block_rows].astype(np.float64) for a in arrays])
+        if np.isnan(X).any():
+            return df[columns].corr()
+        moments.update(X)
+    return moments.correlation()
+
+
+def _codes(series: pd.Series) -> tuple:
+    """Integer codes (-1 = missing) and labels; categorical codes are taken as is."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    return pd.factorize(series, sort=True)
+
+
+def anomaly_statistics(df: pd.DataFrame, date_col: str = None, type_col: str = None, account_col: str = None,
+                       moment_cols: list = None, flag_col: str = 'is_anomaly', block_rows: int = BLOCK_ROWS) -> dict:
+    """
+    The aggregates behind the fraud summaries and charts, computed in one pass over the
+    scored frame in row blocks: anomaly counts per month and per day, normal/anomaly counts
+    per transaction type, anomaly counts per account, and running moments (covariance and
+    correlation) of `moment_cols` plus the flag column. Columns that are absent or None are
+    skipped.
+
+    Returns:
+        dict: 'rows', 'anomalies', 'monthly' (Series of anomaly counts, (year, month) MultiIndex),
+              'daily' (Series indexed by datetime.date), 'by_type' (DataFrame, types x flag
+              values), 'by_account' (Series of anomaly counts, descending), 'correlation' and
+              'covariance' (DataFrames, or None without moment_cols). Date-based entries are None
+              unless `date_col` is a datetime column with at least one dated anomaly.
+    """
+    n = len(df)
+    flags = df[flag_col].to_numpy().astype(bool)
+
+    days = None
+    if date_col in df.columns and pd.api.types.is_datetime64_any_dtype(df[date_col]):
+        dates = df[date_col]
+        if getattr(dates.dt, 'tz', None) is not None:
+            dates = dates.dt.tz_localize(None)  # Local calendar days, as .dt.date gives
+        days = dates.to_numpy(dtype='datetime64[ns]')
+    type_codes = type_labels = None
+    if type_col in df.columns:
+        type_codes, type_labels = _codes(df[type_col])
+        type_counts = np.zeros(2 * len(type_labels), dtype=np.int64)
+    account_codes = account_labels = None
+    if account_col in df.columns:
+        account_codes, account_labels = _codes(df[account_col])
+        account_counts = np.zeros(len(account_labels), dtype=np.int64)
+    moments, moment_arrays, has_nan = None, None, False
+    if moment_cols:
+        columns = [col for col in moment_cols if col in df.columns and col != flag_col
+                   and pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])] + [flag_col]
+        moments = RunningMoments(columns)
+        moment_arrays = [df[col].to_numpy() for col in columns]
+
+    anomaly_days = []
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        f = flags[start:stop]
+        if days is not None:
+            d = days[start:stop][f]
+            anomaly_days.append(d[~np.isnat(d)].astype('datetime64[D]'))
+        if type_codes is not None:
+            t = type_codes[start:stop]
+            known = t >= 0
+            type_counts += np.bincount(2 * t[known] + f[known], minlength=len(type_counts))
+        if account_codes is not None:
+            a = account_codes[start:stop][f]
+            account_counts += np.bincount(a[a >= 0], minlength=len(account_counts))
+        if moments is not None and not has_nan:
+            X = np.column_stack([arr[start:stop].astype(np.float64) for arr in moment_arrays])
+            has_nan = bool(np.isnan(X).any())
+            moments.update(X)
+
+    stats = {'rows': n, 'anomalies': int(flags.sum()), 'monthly': None, 'daily': None,
+             'by_type': None, 'by_account': None, 'correlation': None, 'covariance': None}
+
+    anomaly_days = np.concatenate(anomaly_days) if anomaly_days else np.array([], dtype='datetime64[D]')
+    if len(anomaly_days):
+        unique_days, day_counts = np.unique(anomaly_days, return_counts=True)
+        stats['daily'] = pd.Series(day_counts, index=pd.Index(unique_days.astype(object), name=date_col))
+        months = unique_days.astype('datetime64[M]')
+        unique_months, month_index = np.unique(months, return_inverse=True)
+        month_counts = np.bincount(month_index, weights=day_counts).astype(np.int64)
+        periods = pd.PeriodIndex(unique_months, freq='M')
+        stats['monthly'] = pd.Series(month_counts, index=pd.MultiIndex.from_arrays(
+            [periods.year, periods.month], names=['Year', 'Month']))
+
+    if type_codes is not None:
+        crosstab = type_counts.reshape(-1, 2)
+        observed = crosstab.sum(axis=1) > 0
+        present = [value for value in (0, 1) if crosstab[:, value].sum() > 0]
+        stats['by_type'] = pd.DataFrame(crosstab[observed][:, present], index=pd.Index(type_labels[observed], name=type_col),
+                                        columns=pd.Index(present, name=flag_col))
+
+    if account_codes is not None:
+        order = np.argsort(-account_counts, kind='stable')
+        order = order[account_counts[order] > 0]
+        stats['by_account'] = pd.Series(account_counts[order], index=pd.Index(account_labels[order], name=account_col),
+                                        name='count')
+
+    if moments is not None:
+        if has_nan:  # Pairwise-complete statistics, as pandas computes them
+            stats['correlation'] = df[moments.columns].corr()
+            stats['covariance'] = df[moments.columns].cov()
+        else:
+            stats['correlation'] = moments.correlation()
+            stats['covariance'] = moments.covariance()
+    return stats
@@ -0,0 +1,113 @@
+# financial-analysis-suite-web/backend/api/velocity_features.py
+
+import numpy as np
+import pandas as pd
+
+# Look-back windows for the per-account velocity features, in seconds.
+VELOCITY_WINDOWS = {
+    '1h': 3600,
+    '24h': 24 * 3600,
+    '7d': 7 * 24 * 3600,
+}
+
+
+def velocity_feature_names(windows: dict = VELOCITY_WINDOWS, flag_cols: tuple = ('Location', 'DeviceID')) -> list:
+    """Names of the columns `add_velocity_features` creates (flags only for columns present in the data)."""
+    names = []
+    for label in windows:
+        names += [f'AccountTxnCount{label}', f'AccountAmount{label}']
+    names.append(f'AmountDeviationFromAccountMean{list(windows)[-1]}')
+    names += [f'NewAccount{col}' for col in flag_cols]
+    return names
+
+
+def add_velocity_features(df: pd.DataFrame, date_col: str, account_col: str = 'AccountID',
+                          amount_col: str = 'TransactionAmount', windows: dict = VELOCITY_WINDOWS,
+                          flag_cols: tuple = ('Location', 'DeviceID')) -> list:
+    """
+    Adds per-account velocity features to `df` in place.
+
+    For every transaction, looks back over the same account's history and computes the
+    number of transactions and total amount in each window, the deviation of the amount
+    from the account's mean over the longest window, and whether each of `flag_cols`
+    (location, device) is seen for the first time on a non-first transaction.
+
+    Everything is done with one sort by (account, time) followed by binary searches and
+    cumulative sums over the sorted arrays, so the cost is O(n log n) with no per-account
+    Python loops. Windows are right-closed like pandas' time-based rolling: (t - w, t].
+
+    Args:
+        df (pd.DataFrame): Transactions; `date_col` must already be datetime64.
+        date_col (str): Transaction timestamp column.
+        account_col (str): Account key column.
+        amount_col (str): Transaction amount column (treated as 0 where missing).
+        windows (dict): Label -> window length in seconds.
+        flag_cols (tuple): Categorical columns to produce "new value for this account" flags for.
+
+    Returns:
+        list: Names of the feature columns that were added.
+    """
+    longest = list(windows)[-1]
+    present_flag_cols = [col for col in flag_cols if col in df.columns]
+    added = velocity_feature_names(windows, present_flag_cols)
+    for name in added:
+        df[name] = 0.0 if name.startswith(('AccountAmount', 'AmountDeviation')) else 0
+
+    if account_col not in df.columns or date_col not in df.columns \
+       or not pd.api.types.is_datetime64_any_dtype(df[date_col]):
+        return added
+
+    valid = (df[account_col].notna() & df[date_col].notna()).to_numpy()
+    if not valid.any():
+        return added
+
+    positions = np.flatnonzero(valid)
+    account_codes, _ = pd.factorize(df[account_col].to_numpy()[valid])
+    seconds = df[date_col].to_numpy()[valid].astype('datetime64[s]').astype(np.int64)
+    if amount_col in df.columns and pd.api.types.is_numeric_dtype(df[amount_col]):
+        amounts = df[amount_col].to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+        amounts = np.nan_to_num(amounts, nan=0.0)
+    else:
+        amounts = np.zeros(len(positions))
+
+    # The single sort: by account, then time. After it, each account's history is a
+    # contiguous, time-ordered run, and a combined (account, time) key is monotonic.
+    order = np.lexsort((seconds, account_codes))
+    account_sorted = account_codes[order]
+    seconds_sorted = seconds[order] - seconds.min()
+    amounts_sorted = amounts[order]
+
+    span = int(seconds_sorted.max()) + max(windows.values()) + 1
+    key = account_sorted.astype(np.int64) * span + seconds_sorted
+    idx = np.arange(len(key))
+    amount_cumsum = np.concatenate(([0.0], np.cumsum(amounts_sorted)))
+
+    results = {}
+    for label, width in windows.items():
+        # First row still inside (t - width, t] for the same account; the span padding
+        # guarantees the search never crosses into the previous account's run.
+        left = np.searchsorted(key, key - width, side='right')
+        count = idx - left + 1
+        total = amount_cumsum[idx + 1] - amount_cumsum[left]
+        results[f'AccountTxnCount{label}'] = count
+        results[f'AccountAmount{label}'] = total
+
+    rolling_mean = results[f'AccountAmount{longest}'] / results[f'AccountTxnCount{longest}']
+    results[f'AmountDeviationFromAccountMean{longest}'] = amounts_sorted - rolling_mean
+
+    is_first_of_account = np.ones(len(key), dtype=bool)
+    is_first_of_account[1:] = account_sorted[1:] != account_sorted[:-1]
+    for col in present_flag_cols:
+        value_codes, _ = pd.factorize(df[col].to_numpy()[valid][order])
+        pair_key = account_sorted.astype(np.int64) * (value_codes.max() + 2) + (value_codes + 1)
+        first_seen = ~pd.Series(pair_key).duplicated().to_numpy()
+        results[f'NewAccount{col}'] = (first_seen & ~is_first_of_account).astype(int)
+
+    # Scatter back from sorted order to the frame's row order.
+    target_rows = positions[order]
+    for name, values in results.items():
+        column = df[name].to_numpy().copy()
+        column[target_rows] = values
+        df[name] = column
+
+    return added
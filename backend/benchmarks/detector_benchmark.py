@@ -0,0 +1,80 @@
+# financial-analysis-suite-web/backend/benchmarks/detector_benchmark.py
+#
+# Compares the fraud anomaly detector backends on synthetic transaction-like data:
+# throughput (rows/s for fit + score) and agreement with IsolationForest.
+#
+# Usage (from the repository root):
+#     python -m backend.benchmarks.detector_benchmark --rows 1000000 --features 12
+#     # Scaling of partitioned scoring with the number of worker processes:
+#     python -m backend.benchmarks.detector_benchmark --rows 10000000 --workers 1,2,4,8
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+from sklearn.preprocessing import StandardScaler
+
+from backend.api.anomaly_detectors import DETECTORS, get_detector, flag_anomalies
+from backend.api.partitioned_scoring import partitioned_fit_score
+
+
+def make_data(n_rows: int, n_features: int, contamination: float, seed: int = 0) -> np.ndarray:
+    """Mostly log-normal 'amount-like' features with a planted fraction of shifted outliers."""
+    rng = np.random.default_rng(seed)
+    X = rng.lognormal(mean=3.0, sigma=0.6, size=(n_rows, n_features))
+    n_outliers = int(n_rows * contamination)
+    outlier_rows = rng.choice(n_rows, size=n_outliers, replace=False)
+    X[outlier_rows] *= rng.uniform(3.0, 8.0, size=(n_outliers, n_features))
+    return StandardScaler().fit_transform(X)
+
+
+def run(n_rows: int, n_features: int, contamination: float):
+    X = make_data(n_rows, n_features, contamination)
+    results = {}
+    for name in DETECTORS:
+        start = time.perf_counter()
+        scores = get_detector(name).fit_score(X)
+        elapsed = time.perf_counter() - start
+        results[name] = (elapsed, scores, flag_anomalies(scores, contamination))
+
+    ref_scores, ref_flags = results['isolation_forest'][1], results['isolation_forest'][2]
+    print(f"{n_rows:,} rows x {n_features} features, contamination={contamination}")
+    print(f"{'detector':<18}{'seconds':>10}{'rows/s':>14}{'flag Jaccard':>15}{'rank corr':>12}")
+    for name, (elapsed, scores, flags) in results.items():
+        union = np.logical_or(flags, ref_flags).sum()
+        jaccard = np.logical_and(flags, ref_flags).sum() / union if union else 1.0
+        rank_corr = spearmanr(scores, ref_scores).correlation
+        print(f"{name:<18}{elapsed:>10.2f}{n_rows / elapsed:>14,.0f}{jaccard:>15.3f}{rank_corr:>12.3f}")
+
+
+def run_scaling(n_rows: int, n_features: int, workers: list, detector: str = 'isolation_forest'):
+    """Throughput of partitioned_fit_score per worker count (the first call also spawns the pool)."""
+    frame = pd.DataFrame(make_data(n_rows, n_features, 0.01), columns=[f'f{i}' for i in range(n_features)])
+    features = list(frame.columns)
+    print(f"{n_rows:,} rows x {n_features} features, detector={detector}")
+    print(f"{'workers':<10}{'seconds':>10}{'rows/s':>14}{'speed-up':>10}")
+    baseline = None
+    for count in workers:
+        partitioned_fit_score(frame.head(1000), features, detector, workers=count)  # Warm-up: spawn workers
+        start = time.perf_counter()
+        partitioned_fit_score(frame, features, detector, workers=count)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{count:<10}{elapsed:>10.2f}{n_rows / elapsed:>14,.0f}{baseline / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fraud anomaly detector backends.")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--features', type=int, default=12)
+    parser.add_argument('--contamination', type=float, default=0.01)
+    parser.add_argument('--workers', default=None,
+                        help="Comma-separated worker counts: benchmark partitioned scoring scaling instead.")
+    parser.add_argument('--detector', default='isolation_forest', help="Detector for --workers.")
+    args = parser.parse_args()
+    if args.workers:
+        run_scaling(args.rows, args.features, [int(w) for w in args.workers.split(',')], args.detector)
+    else:
+        run(args.rows, args.features, args.contamination)
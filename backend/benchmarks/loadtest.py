@@ -0,0 +1,365 @@
+# financial-analysis-suite-web/backend/benchmarks/loadtest.py
+#
+# Load test / request replay for the API: fires requests at a configurable concurrency and
+# reports throughput, p50/p95/p99 latency and error rate per endpoint, plus the server's RSS
+# sampled as each request completes.
+#
+# Usage (from the repository root):
+#     # Synthetic uploads, against the app in-process (Flask test client):
+#     python -m backend.benchmarks.loadtest --endpoints fraud,tax --requests 40 --concurrency 4 --rows 5000
+#     # Same, against a running server (RSS summed over <pid> and its children, e.g. the
+#     # gunicorn master and its workers, when --server-pid is given):
+#     python -m backend.benchmarks.loadtest --url http://localhost:8000 --server-pid 1234 --endpoints fraud
+#     # Replay a request log:
+#     python -m backend.benchmarks.loadtest --replay traffic.jsonl --concurrency 8 --out results.json
+#
+# A replay log is JSONL with one request per line:
+#     {"method": "POST", "path": "/api/fraud", "file": "uploads/tx.csv", "form": {"contamination": "0.02"}}
+#     {"method": "POST", "path": "/api/tax_calculate", "json": {"income": 900000, "deductions": 50000, "year": 2024}}
+# (The requests.jsonl at the repository root is the change backlog, not a request log.)
+
+import argparse
+import io
+import json
+import os
+import resource
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# ------------------ Synthetic uploads ------------------ #
+
+def make_fraud_csv(rows: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2023-01-01')
+    dates = start + pd.to_timedelta(np.sort(rng.integers(0, 365 * 24 * 3600, rows)), unit='s')
+    df = pd.DataFrame({
+        'TransactionID': [f'TX{i:07d}' for i in range(rows)],
+        'AccountID': [f'AC{i:05d}' for i in rng.integers(0, max(rows // 10, 1), rows)],
+        'TransactionAmount': rng.lognormal(4.5, 1.0, rows).round(2),
+        'TransactionDate': dates.strftime('%Y-%m-%d %H:%M:%S'),
+        'TransactionType': rng.choice(['Debit', 'Credit'], rows),
+        'Location': rng.choice(['Mumbai', 'Delhi', 'Pune', 'Chennai', 'Kolkata'], rows),
+        'DeviceID': [f'D{i:05d}' for i in rng.integers(0, max(rows // 5, 1), rows)],
+        'Channel': rng.choice(['ATM', 'Online', 'Branch'], rows),
+        'CustomerAge': rng.integers(18, 80, rows),
+        'CustomerOccupation': rng.choice(['Doctor', 'Engineer', 'Student', 'Retired'], rows),
+        'TransactionDuration': rng.integers(10, 300, rows),
+        'LoginAttempts': rng.choice([1, 1, 1, 2, 5], rows),
+        'AccountBalance': rng.lognormal(8.5, 1.0, rows).round(2),
+    })
+    df['PreviousTransactionDate'] = (dates - pd.to_timedelta(rng.integers(3600, 90 * 24 * 3600, rows), unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+    return df.to_csv(index=False).encode()
+
+
+def make_invoice_csv(rows: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 730, rows), unit='D')
+    df = pd.DataFrame({
+        'first_name': rng.choice(['Ann', 'Bob', 'Cid', 'Dee', 'Eve'], rows),
+        'last_name': rng.choice(['Rao', 'Shah', 'Iyer', 'Das'], rows),
+        'email': [f'user{i}@example.com' for i in rng.integers(0, max(rows // 3, 1), rows)],
+        'product_id': rng.integers(100, 140, rows),
+        'qty': rng.integers(1, 10, rows),
+        'amount': rng.uniform(10, 1000, rows).round(2),
+        'invoice_date': dates.strftime('%Y-%m-%d'),
+        'city': rng.choice(['Mumbai', 'Delhi', 'Pune'], rows),
+        'job': rng.choice(['Chef', 'Artist', 'Engineer'], rows),
+    })
+    return df.to_csv(index=False).encode()
+
+
+def make_forecast_csv(rows: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    t = np.arange(rows)
+    target = 100 + 0.5 * t + 20 * np.sin(2 * np.pi * t / 12) + rng.normal(0, 3, rows)
+    df = pd.DataFrame({
+        'Date': pd.date_range('2000-01-01', periods=rows, freq='MS').strftime('%Y-%m-%d'),
+        'sales': (target * rng.uniform(0.9, 1.1, rows)).round(2),
+        'target_sales': target.round(2),
+        'gdp_growth': rng.normal(3, 1, rows).round(2),
+        'unemployment_rate': rng.normal(6, 0.5, rows).round(2),
+        'inflation_rate': rng.normal(4, 0.7, rows).round(2),
+    })
+    return df.to_csv(index=False).encode()
+
+
+def synthetic_requests(endpoints: list, rows: int) -> dict:
+    """One request template per endpoint; the forecast series is capped at 240 months."""
+    templates = {
+        'fraud': {'method': 'POST', 'path': '/api/fraud', 'upload': make_fraud_csv(rows)},
+        'invoice': {'method': 'POST', 'path': '/api/invoice_process', 'upload': make_invoice_csv(rows)},
+        'forecast': {'method': 'POST', 'path': '/api/forecast', 'upload': make_forecast_csv(min(rows, 240))},
+        'tax': {'method': 'POST', 'path': '/api/tax_calculate',
+                'json': {'income': 1200000, 'deductions': 150000, 'year': 2024}},
+        'home': {'method': 'GET', 'path': '/'},
+    }
+    unknown = [name for name in endpoints if name not in templates]
+    if unknown:
+        raise SystemExit(f"Unknown endpoint(s) {unknown}. Choose from: {', '.join(templates)}.")
+    return {name: templates[name] for name in endpoints}
+
+
+def load_replay_log(path: str) -> list:
+    """Reads a JSONL request log; uploads referenced by 'file' are read once, up front."""
+    entries, uploads = [], {}
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'path' not in entry:
+                raise SystemExit(f"{path}:{line_no} has no 'path'; this doesn't look like a request log "
+                                 f"(the repository's requests.jsonl is the change backlog).")
+            if entry.get('file'):
+                if entry['file'] not in uploads:
+                    with open(entry['file'], 'rb') as upload:
+                        uploads[entry['file']] = upload.read()
+                entry['upload'] = uploads[entry['file']]
+            entries.append(entry)
+    return entries
+
+
+# ------------------ Transports ------------------ #
+
+def _multipart(form: dict, upload: bytes, filename: str = 'upload.csv') -> tuple:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in (form or {}).items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    if upload is not None:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + upload + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HTTPTransport:
+    """Sends requests to a running server with urllib (bodies are read to the end)."""
+
+    def __init__(self, base_url: str, accept_encoding: str = 'gzip'):
+        self.base_url = base_url.rstrip('/')
+        self.accept_encoding = accept_encoding
+
+    def send(self, entry: dict) -> tuple:
+        headers = {'Accept-Encoding': self.accept_encoding}
+        data = None
+        if 'json' in entry:
+            data, headers['Content-Type'] = json.dumps(entry['json']).encode(), 'application/json'
+        elif entry.get('upload') is not None or entry.get('form'):
+            data, headers['Content-Type'] = _multipart(entry.get('form'), entry.get('upload'))
+        request = urllib.request.Request(self.base_url + entry['path'], data=data, headers=headers,
+                                         method=entry.get('method', 'POST'))
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                body = response.read()
+                return response.status, len(body)
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+class InProcessTransport:
+    """Calls the Flask app through its test client, one client per thread."""
+
+    def __init__(self, accept_encoding: str = 'gzip'):
+        from backend.api.index import app
+        self.app = app
+        self.accept_encoding = accept_encoding
+        self._local = threading.local()
+
+    def send(self, entry: dict) -> tuple:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        kwargs = {'method': entry.get('method', 'POST'), 'headers': {'Accept-Encoding': self.accept_encoding}}
+        if 'json' in entry:
+            kwargs['json'] = entry['json']
+        elif entry.get('upload') is not None or entry.get('form'):
+            data = dict(entry.get('form') or {})
+            if entry.get('upload') is not None:
+                data['file'] = (io.BytesIO(entry['upload']), os.path.basename(entry.get('file') or 'upload.csv'))
+            kwargs['data'] = data
+        response = client.open(entry['path'], **kwargs)
+        try:
+            body = response.get_data()  # Drains streamed responses
+        finally:
+            response.close()  # As a WSGI server would; releases the request's admission capacity
+        return response.status_code, len(body)
+
+
+# ------------------ RSS ------------------ #
+
+def _proc_rss_kb(pid) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0  # Kernel threads and zombies have no VmRSS
+
+
+def _descendants(pid: int) -> list:
+    """`pid` and every process below it (a pre-fork server's master and its workers), from /proc."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue  # Exited meanwhile
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def current_rss_mb(pid: int = None) -> float:
+    """
+    Resident set size from /proc: of this process when `pid` is None, else summed over `pid`
+    and its descendants (pages shared between workers are counted once per process, so this
+    overstates their combined footprint). Peak RSS of this process where /proc is missing.
+    """
+    try:
+        if pid is None:
+            return _proc_rss_kb('self') / 1024.0
+        total = 0
+        for member in _descendants(pid):
+            try:
+                total += _proc_rss_kb(member)
+            except OSError:
+                pass  # Exited meanwhile (e.g. a recycled worker)
+        return total / 1024.0 if total else float('nan')
+    except OSError:
+        pass
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return float('nan')
+
+
+# ------------------ Runner ------------------ #
+
+def _summarize(samples: list, wall_seconds: float) -> dict:
+    latencies = np.array([s['latency_ms'] for s in samples])
+    errors = sum(1 for s in samples if s['error'] or s['status'] >= 400)
+    rss = [s['rss_mb'] for s in samples if not np.isnan(s['rss_mb'])]
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'throughput_rps': len(samples) / wall_seconds if wall_seconds else 0.0,
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max()),
+        },
+        # Highest process RSS seen when one of these requests completed: not memory used by the endpoint
+        'process_rss_mb_at_completion_max': max(rss) if rss else None,
+        'bytes_received': int(sum(s['bytes'] for s in samples)),
+        'status_counts': {str(code): sum(1 for s in samples if s['status'] == code)
+                          for code in sorted({s['status'] for s in samples})},
+    }
+
+
+def run_load(entries: list, transport, concurrency: int, server_pid: int = None) -> dict:
+    """Sends every entry (in order of submission) with `concurrency` threads and summarizes per endpoint."""
+    samples = []
+    samples_lock = threading.Lock()
+
+    def fire(entry):
+        start = time.perf_counter()
+        status, size, error = 0, 0, None
+        try:
+            status, size = transport.send(entry)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        sample = {'path': entry['path'], 'status': status, 'bytes': size, 'error': error,
+                  'latency_ms': (time.perf_counter() - start) * 1000.0,
+                  'rss_mb': current_rss_mb(server_pid)}
+        with samples_lock:
+            samples.append(sample)
+
+    rss_before = current_rss_mb(server_pid)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fire, entries))
+    wall_seconds = time.perf_counter() - start
+
+    by_path = {}
+    for sample in samples:
+        by_path.setdefault(sample['path'], []).append(sample)
+    return {
+        'wall_seconds': wall_seconds,
+        'rss_mb_before': rss_before,
+        'rss_mb_after': current_rss_mb(server_pid),
+        'overall': _summarize(samples, wall_seconds),
+        'endpoints': {path: _summarize(group, wall_seconds) for path, group in sorted(by_path.items())},
+        'first_errors': [s['error'] or f"HTTP {s['status']} on {s['path']}" for s in samples
+                         if s['error'] or s['status'] >= 400][:5],
+    }
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<28}{'reqs':>6}{'err%':>7}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS@done MB':>13}")
+    rows = list(report['endpoints'].items()) + [('(all)', report['overall'])]
+    for path, stats in rows:
+        lat = stats['latency_ms']
+        rss = stats['process_rss_mb_at_completion_max']
+        rss = f"{rss:.0f}" if rss is not None else '-'
+        print(f"{path:<28}{stats['requests']:>6}{100 * stats['error_rate']:>7.1f}{stats['throughput_rps']:>8.2f}"
+              f"{lat['p50']:>10.0f}{lat['p95']:>10.0f}{lat['p99']:>10.0f}{rss:>13}")
+    print("RSS@done: max process RSS (server tree with --server-pid) when a request completed; not per-endpoint memory.")
+    for error in report['first_errors']:
+        print(f"  error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Financial Analysis Suite API.")
+    parser.add_argument('--url', help="Base URL of a running server; omit to call the app in-process.")
+    parser.add_argument('--server-pid', type=int, help="Server PID (e.g. the gunicorn master) whose process tree's RSS is sampled when using --url.")
+    parser.add_argument('--replay', help="JSONL request log to replay instead of synthetic uploads.")
+    parser.add_argument('--endpoints', default='fraud,invoice,tax',
+                        help="Synthetic endpoints: fraud, invoice, forecast, tax, home (comma separated).")
+    parser.add_argument('--requests', type=int, default=20, help="Synthetic requests per endpoint.")
+    parser.add_argument('--rows', type=int, default=2000, help="Rows per synthetic upload.")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1, help="Times to replay the log.")
+    parser.add_argument('--accept-encoding', default='gzip')
+    parser.add_argument('--out', help="Write the JSON report here (for comparing runs over time).")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        entries = load_replay_log(args.replay) * args.repeat
+    else:
+        templates = synthetic_requests([name.strip() for name in args.endpoints.split(',') if name.strip()], args.rows)
+        # Interleave endpoints so they compete for the worker, as real traffic would.
+        entries = [template for _ in range(args.requests) for template in templates.values()]
+
+    transport = HTTPTransport(args.url, args.accept_encoding) if args.url else InProcessTransport(args.accept_encoding)
+    report = run_load(entries, transport, args.concurrency, server_pid=args.server_pid if args.url else None)
+    report['config'] = {
+        'target': args.url or 'in-process', 'replay': args.replay, 'endpoints': args.endpoints,
+        'requests_per_endpoint': args.requests, 'rows': args.rows, 'concurrency': args.concurrency,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ function FraudDetectionTool() {
   const [file, setFile] = useState(null);
   const [contamination, setContamination] = useState(0.01);
   const [dateColumnName, setDateColumnName] = useState('TransactionDate');
+  const [detector, setDetector] = useState('isolation_forest');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [results, setResults] = useState(null);
@@ -25,6 +26,7 @@ function FraudDetectionTool() {
     formData.append('file', file);
     formData.append('contamination', contamination);
     formData.append('date_column_name', dateColumnName);
+    formData.append('detector', detector);
 
     try {
       const response = await fetch('/api/fraud', { // Call Flask backend
@@ -137,6 +139,14 @@ function FraudDetectionTool() {
           <label htmlFor="fraudContamination">Anomaly Detection Sensitivity (Contamination):</label>
           <input type="number" id="fraudContamination" value={contamination} onChange={(e) => setContamination(parseFloat(e.target.value))} step="0.001" min="0.001" max="0.1" />
         </div>
+        <div className="form-group">
+          <label htmlFor="fraudDetector">Detector:</label>
+          <select id="fraudDetector" value={detector} onChange={(e) => setDetector(e.target.value)}>
+            <option value="isolation_forest">Isolation Forest</option>
+            <option value="hbos">Histogram-based (HBOS, fast)</option>
+            <option value="robust_zscore">Robust z-score (fast)</option>
+          </select>
+        </div>
         <div className="form-group">
           <label htmlFor="fraudDateCol">Primary Date Column (Optional):</label>
           <input type="text" id="fraudDateCol" value={dateColumnName} onChange={(e) => setDateColumnName(e.target.value)} />
@@ -162,14 +172,14 @@ function FraudDetectionTool() {
           }
 
 
-          {/* Display plots (Matplotlib base64 images - no JSON.parse needed) */}
+          {/* Display plots (URLs of cached chart images, rendered by the API on first fetch) */}
           {results.plot_images && Object.keys(results.plot_images).length > 0 && (
             <div>
               <h5>Visualizations</h5>
-              {Object.entries(results.plot_images).map(([key, base64Image]) => (
+              {Object.entries(results.plot_images).map(([key, plotUrl]) => (
                 <div key={key} className="chart-container">
                   <h6>{key.replace(/_/g, ' ').charAt(0).toUpperCase() + key.replace(/_/g, ' ').slice(1)}</h6>
-                  <img src={`data:image/png;base64,${base64Image}`} alt={key} />
+                  <img src={plotUrl} alt={key} loading="lazy" />
                 </div>
               ))}
             </div>